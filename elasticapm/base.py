@@ -50,7 +50,9 @@ import elasticapm
 from elasticapm.conf import Config, VersionedConfig, constants
 from elasticapm.conf.constants import ERROR
 from elasticapm.metrics.base_metrics import MetricsRegistry
+from elasticapm.sampling import TailSampler
 from elasticapm.traces import Tracer, execution_context
+from elasticapm.transport.load_shedding import LoadShedder
 from elasticapm.utils import cgroup, cloud, compat, is_master_process, stacks, varmap
 from elasticapm.utils.encoding import enforce_label_format, keyword_field, shorten, transform
 from elasticapm.utils.logging import get_logger
@@ -136,12 +138,14 @@ class Client(object):
 
         headers = {
             "Content-Type": "application/x-ndjson",
-            "Content-Encoding": "gzip",
             "User-Agent": self.get_user_agent(),
         }
+        if self.config.api_request_compression == "gzip":
+            headers["Content-Encoding"] = "gzip"
 
         transport_kwargs = {
             "headers": headers,
+            "compression": self.config.api_request_compression,
             "verify_server_cert": self.config.verify_server_cert,
             "server_cert": self.config.server_cert,
             "timeout": self.config.server_timeout,
@@ -151,6 +155,20 @@ class Client(object):
             self.config.server_url if self.config.server_url.endswith("/") else self.config.server_url + "/",
             constants.EVENTS_API_PATH,
         )
+        self.load_shedder = (
+            LoadShedder(max_send_time=self.config.api_request_time.total_seconds())
+            if self.config.load_shedding
+            else None
+        )
+        self.sampler = import_string(self.config.transaction_sampler)(self) if self.config.transaction_sampler else None
+        self.tail_sampler = (
+            TailSampler(
+                min_duration=self.config.tail_sampling_min_duration.total_seconds(),
+                max_spans=self.config.tail_sampling_max_spans,
+            )
+            if self.config.tail_sampling
+            else None
+        )
         transport_class = import_string(self.config.transport_class)
         self._transport = transport_class(url=self._api_endpoint_url, client=self, **transport_kwargs)
         self.config.transport = self._transport
@@ -169,10 +187,12 @@ class Client(object):
             skip_modules = ("elasticapm.",)
 
         self.tracer = Tracer(
-            frames_collector_func=lambda: list(
-                stacks.iter_stack_frames(
-                    start_frame=inspect.currentframe(), skip_top_modules=skip_modules, config=self.config
-                )
+            frames_collector_func=lambda: stacks.capture_stack(
+                inspect.currentframe(),
+                skip_top_modules=skip_modules,
+                config=self.config,
+                # unless local variables are collected, the frames don't need to be kept alive once walked
+                snapshot=self.config.collect_local_variables not in ("all", "transactions"),
             ),
             frames_processing_func=lambda frames: self._get_stack_info_for_trace(
                 frames,
@@ -202,6 +222,8 @@ class Client(object):
             self._metrics.register("elasticapm.metrics.sets.breakdown.BreakdownMetricSet")
         if self.config.prometheus_metrics:
             self._metrics.register("elasticapm.metrics.sets.prometheus.PrometheusMetrics")
+        if self.load_shedder:
+            self._metrics.register("elasticapm.metrics.sets.load_shedding.LoadSheddingMetricSet")
         if self.config.metrics_interval:
             self._thread_managers["metrics"] = self._metrics
         compat.atexit_register(self.close)
@@ -284,7 +306,7 @@ class Client(object):
             flush = False
         self._transport.queue(event_type, data, flush)
 
-    def begin_transaction(self, transaction_type, trace_parent=None, start=None, auto_activate=True):
+    def begin_transaction(self, transaction_type, trace_parent=None, start=None, auto_activate=True, name=None):
         """
         Register the start of a transaction on the client
 
@@ -292,11 +314,12 @@ class Client(object):
         :param trace_parent: an optional TraceParent object for distributed tracing
         :param start: override the start timestamp, mostly useful for testing
         :param auto_activate: whether to set this transaction in execution_context
+        :param name: name of the transaction, if it is already known. It is taken into account for sampling
         :return: the started transaction object
         """
         if self.config.is_recording:
             return self.tracer.begin_transaction(
-                transaction_type, trace_parent=trace_parent, start=start, auto_activate=auto_activate
+                transaction_type, trace_parent=trace_parent, start=start, auto_activate=auto_activate, name=name
             )
 
     def end_transaction(self, name=None, result="", duration=None):
@@ -459,7 +482,8 @@ class Client(object):
         transaction = execution_context.get_transaction()
         span = execution_context.get_span()
         if transaction:
-            transaction_context = deepcopy(transaction.context)
+            # lazily computed context data is None if it couldn't be computed
+            transaction_context = {k: v for k, v in deepcopy(transaction.context).items() if v is not None}
         else:
             transaction_context = {}
         event_data = {}
@@ -559,6 +583,9 @@ class Client(object):
             # parent id might already be set in the handler
             event_data.setdefault("parent_id", span.id if span else transaction.id)
             event_data["transaction_id"] = transaction.id
+            if transaction.tail_sampling:
+                # transactions with errors are kept, see elasticapm.sampling.TailSampler
+                transaction.tail_sampling_keep = True
             event_data["transaction"] = {
                 "sampled": transaction.is_sampled,
                 "type": transaction.transaction_type,
@@ -38,7 +38,7 @@ import socket
 import threading
 from datetime import timedelta
 
-from elasticapm.conf.constants import BASE_SANITIZE_FIELD_NAMES
+from elasticapm.conf.constants import BASE_SANITIZE_FIELD_NAMES, REQUEST_FIELDS
 from elasticapm.utils import compat, starmatch_to_regex
 from elasticapm.utils.logging import get_logger
 from elasticapm.utils.threading import IntervalTimer, ThreadManager
@@ -600,9 +600,29 @@ class Config(_ConfigBase):
     central_config = _BoolConfigValue("CENTRAL_CONFIG", default=True)
     api_request_size = _ConfigValue("API_REQUEST_SIZE", type=int, validators=[size_validator], default=768 * 1024)
     api_request_time = _DurationConfigValue("API_REQUEST_TIME", default=timedelta(seconds=10))
+    api_request_concurrency = _ConfigValue("API_REQUEST_CONCURRENCY", type=int, default=1)
+    api_request_streaming = _BoolConfigValue("API_REQUEST_STREAMING", default=False)
+    api_request_compression = _ConfigValue(
+        "API_REQUEST_COMPRESSION", validators=[EnumerationValidator(["gzip", "none"])], default="gzip"
+    )
+    json_serializer = _ConfigValue(
+        "JSON_SERIALIZER", validators=[EnumerationValidator(["auto", "orjson", "ujson", "stdlib"])], default="stdlib"
+    )
+    event_queue_type = _ConfigValue(
+        "EVENT_QUEUE_TYPE", validators=[EnumerationValidator(["chilled", "deque"])], default="chilled"
+    )
+    load_shedding = _BoolConfigValue("LOAD_SHEDDING", default=False)
+    deferred_serialization = _BoolConfigValue("DEFERRED_SERIALIZATION", default=False)
+    spool_directory = _ConfigValue("SPOOL_DIRECTORY", default=None)
+    spool_max_size = _ConfigValue("SPOOL_MAX_SIZE", type=int, validators=[size_validator], default=100 * 1024 * 1024)
     transaction_sample_rate = _ConfigValue(
         "TRANSACTION_SAMPLE_RATE", type=float, validators=[PrecisionValidator(4, 0.0001)], default=1.0
     )
+    transaction_sampler = _ConfigValue("TRANSACTION_SAMPLER", default=None)
+    adaptive_sampling_target = _ConfigValue("ADAPTIVE_SAMPLING_TARGET", type=float, default=1.0)
+    tail_sampling = _BoolConfigValue("TAIL_SAMPLING", default=False)
+    tail_sampling_min_duration = _DurationConfigValue("TAIL_SAMPLING_MIN_DURATION", default=timedelta(seconds=1))
+    tail_sampling_max_spans = _ConfigValue("TAIL_SAMPLING_MAX_SPANS", type=int, default=10000)
     transaction_max_spans = _ConfigValue("TRANSACTION_MAX_SPANS", type=int, default=500)
     stack_trace_limit = _ConfigValue("STACK_TRACE_LIMIT", type=int, default=50)
     span_frames_min_duration = _DurationConfigValue(
@@ -652,6 +672,13 @@ class Config(_ConfigBase):
     instrument = _BoolConfigValue("INSTRUMENT", default=True)
     enable_distributed_tracing = _BoolConfigValue("ENABLE_DISTRIBUTED_TRACING", default=True)
     capture_headers = _BoolConfigValue("CAPTURE_HEADERS", default=True)
+    request_headers_allowlist = _ListConfigValue(
+        "REQUEST_HEADERS_ALLOWLIST", type=lambda name: name.strip().lower(), default=[]
+    )
+    transaction_request_fields = _ListConfigValue(
+        "TRANSACTION_REQUEST_FIELDS", type=str.strip, default=list(REQUEST_FIELDS)
+    )
+    error_request_fields = _ListConfigValue("ERROR_REQUEST_FIELDS", type=str.strip, default=list(REQUEST_FIELDS))
     django_transaction_name_from_route = _BoolConfigValue("DJANGO_TRANSACTION_NAME_FROM_ROUTE", default=False)
     disable_log_record_factory = _BoolConfigValue("DISABLE_LOG_RECORD_FACTORY", default=False)
     use_elastic_traceparent_header = _BoolConfigValue("USE_ELASTIC_TRACEPARENT_HEADER", default=True)
@@ -72,6 +72,9 @@ KEYWORD_MAX_LENGTH = 1024
 
 HTTP_WITH_BODY = {"POST", "PUT", "PATCH", "DELETE"}
 
+# fields of the request context that can be left out (the method is always captured)
+REQUEST_FIELDS = ("url", "socket", "headers", "cookies", "env", "body")
+
 MASK = "[REDACTED]"
 
 EXCEPTION_CHAIN_MAX_DEPTH = 50
@@ -33,7 +33,7 @@ from types import TracebackType
 from typing import Optional, Type
 
 from elasticapm.conf.constants import LABEL_RE
-from elasticapm.traces import SpanType, capture_span, execution_context
+from elasticapm.traces import LazyContext, SpanType, capture_span, execution_context
 from elasticapm.utils import get_name_from_func
 
 
@@ -64,13 +64,20 @@ async def set_context(data, key="custom"):
 
     If the transaction is not sampled, this function becomes a no-op.
 
-    :param data: a dictionary, or a callable that returns a dictionary
+    :param data: a dictionary, a callable that returns an awaitable of a dictionary, or a LazyContext
     :param key: the namespace for this data
     """
     transaction = execution_context.get_transaction()
     if not (transaction and transaction.is_sampled):
         return
-    if callable(data):
+    if isinstance(data, LazyContext):
+        if key not in transaction.context:
+            transaction.context[key] = data
+            return
+        data = data.materialize()
+        if data is None:
+            return
+    elif callable(data):
         data = await data()
 
     # remove invalid characters from key names
@@ -45,10 +45,11 @@ from elasticapm import get_client as _get_client
 from elasticapm.base import Client
 from elasticapm.conf import constants
 from elasticapm.contrib.django.utils import get_raw_uri, iterate_with_template_sources
-from elasticapm.utils import compat, encoding, get_url_dict
+from elasticapm.traces import LazyContext
+from elasticapm.utils import compat, encoding, get_request_fields, get_url_dict
 from elasticapm.utils.logging import get_logger
 from elasticapm.utils.module_import import import_string
-from elasticapm.utils.wsgi import get_environ, get_headers
+from elasticapm.utils.wsgi import get_environ, get_header_dict
 
 __all__ = ("DjangoClient",)
 
@@ -114,23 +115,20 @@ class DjangoClient(Client):
 
         return user_info
 
-    def get_data_from_request(self, request, event_type):
-        result = {
-            "env": dict(get_environ(request.META)),
-            "method": request.method,
-            "socket": {"remote_address": request.META.get("REMOTE_ADDR")},
-            "cookies": dict(request.COOKIES),
-        }
-        if self.config.capture_headers:
-            request_headers = dict(get_headers(request.META))
-
-            for key, value in request_headers.items():
-                if isinstance(value, (int, float)):
-                    request_headers[key] = str(value)
-
-            result["headers"] = request_headers
-
-        if request.method in constants.HTTP_WITH_BODY:
+    def get_data_from_request(self, request, event_type, fields=None):
+        if fields is None:
+            fields = get_request_fields(self.config, event_type)
+        result = {"method": request.method}
+        if "env" in fields:
+            result["env"] = dict(get_environ(request.META))
+        if "socket" in fields:
+            result["socket"] = {"remote_address": request.META.get("REMOTE_ADDR")}
+        if "cookies" in fields:
+            result["cookies"] = dict(request.COOKIES)
+        if "headers" in fields and self.config.capture_headers:
+            result["headers"] = get_header_dict(request.META, self.config.request_headers_allowlist)
+
+        if "body" in fields and request.method in constants.HTTP_WITH_BODY:
             capture_body = self.config.capture_body in ("all", event_type)
             if not capture_body:
                 result["body"] = "[REDACTED]"
@@ -151,10 +149,31 @@ class DjangoClient(Client):
                 if data is not None:
                     result["body"] = data
 
-        url = get_raw_uri(request)
-        result["url"] = get_url_dict(url)
+        if "url" in fields:
+            url = get_raw_uri(request)
+            result["url"] = get_url_dict(url)
         return result
 
+    def get_lazy_data_from_request(self, request, event_type):
+        """
+        Returns a LazyContext for the request data, which is only collected when
+        the transaction is serialized. The body is read right away, as the input
+        stream is not usable anymore once the response has been sent.
+        """
+        fields = get_request_fields(self.config, event_type)
+        if "body" in fields:
+            body = self.get_data_from_request(request, event_type, fields=("body",))
+            fields = [field for field in fields if field != "body"]
+        else:
+            body = {}
+
+        def load():
+            data = self.get_data_from_request(request, event_type, fields=fields)
+            data.update(body)
+            return data
+
+        return LazyContext(load)
+
     def get_data_from_response(self, response, event_type):
         result = {"status_code": response.status_code}
 
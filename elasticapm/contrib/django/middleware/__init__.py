@@ -174,7 +174,7 @@ class TracingMiddleware(MiddlewareMixin, ElasticAPMClientMiddlewareMixin):
                 if not getattr(request, "_elasticapm_name_set", False):
                     elasticapm.set_transaction_name(self.get_transaction_name(request), override=False)
                 elasticapm.set_context(
-                    lambda: self.client.get_data_from_request(request, constants.TRANSACTION), "request"
+                    lambda: self.client.get_lazy_data_from_request(request, constants.TRANSACTION), "request"
                 )
                 elasticapm.set_context(
                     lambda: self.client.get_data_from_response(response, constants.TRANSACTION), "response"
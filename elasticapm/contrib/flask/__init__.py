@@ -176,13 +176,13 @@ class ElasticAPM(object):
     def request_started(self, app):
         if (not self.app.debug or self.client.config.debug) and not self.client.should_ignore_url(request.path):
             trace_parent = TraceParent.from_headers(request.headers)
-            self.client.begin_transaction("request", trace_parent=trace_parent)
+            # the URL rule is already known, so that it can be taken into account for sampling
+            rule = request.url_rule.rule if request.url_rule is not None else ""
+            rule = build_name_with_http_method_prefix(rule, request)
+            self.client.begin_transaction("request", trace_parent=trace_parent, name=rule)
             elasticapm.set_context(
                 lambda: get_data_from_request(request, self.client.config, constants.TRANSACTION), "request"
             )
-            rule = request.url_rule.rule if request.url_rule is not None else ""
-            rule = build_name_with_http_method_prefix(rule, request)
-            elasticapm.set_transaction_name(rule, override=False)
 
     def request_finished(self, app, response):
         if not self.app.debug or self.client.config.debug:
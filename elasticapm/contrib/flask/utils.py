@@ -33,7 +33,7 @@ from werkzeug.exceptions import ClientDisconnected
 
 from elasticapm.conf import constants
 from elasticapm.utils import compat, get_url_dict
-from elasticapm.utils.wsgi import get_environ, get_headers
+from elasticapm.utils.wsgi import get_environ, get_header_dict
 
 
 def get_data_from_request(request, config, event_type):
@@ -44,7 +44,7 @@ def get_data_from_request(request, config, event_type):
         "cookies": request.cookies,
     }
     if config.capture_headers:
-        result["headers"] = dict(get_headers(request.environ))
+        result["headers"] = get_header_dict(request.environ, config.request_headers_allowlist)
     if request.method in constants.HTTP_WITH_BODY:
         if config.capture_body not in ("all", event_type):
             result["body"] = "[REDACTED]"
@@ -31,26 +31,30 @@
 
 from __future__ import absolute_import
 
-import asyncio
 import functools
+from collections import OrderedDict
 from typing import Dict, Optional
 
 import starlette
 from starlette.requests import Request
 from starlette.routing import Match, Mount
-from starlette.types import ASGIApp, Message
+from starlette.types import ASGIApp
 
 import elasticapm
 import elasticapm.instrumentation.control
 from elasticapm.base import Client
 from elasticapm.conf import constants
 from elasticapm.contrib.asyncio.traces import set_context
-from elasticapm.contrib.starlette.utils import get_body, get_data_from_request, get_data_from_response
+from elasticapm.contrib.starlette.utils import BodyTee, get_data_from_request, get_data_from_response, get_request_data
+from elasticapm.traces import LazyContext
 from elasticapm.utils.disttracing import TraceParent
 from elasticapm.utils.logging import get_logger
 
 logger = get_logger("elasticapm.errors.client")
 
+# maximum number of resolved route names that are kept per middleware
+ROUTE_NAME_CACHE_SIZE = 1000
+
 
 def make_apm_client(config: Optional[Dict] = None, client_cls=Client, **defaults) -> Client:
     """Builds ElasticAPM client.
@@ -122,6 +126,8 @@ class ElasticAPM:
         # If we ever make this a general-use ASGI middleware we should use
         # `asgiref.conpatibility.guarantee_single_callable(app)` here
         self.app = app
+        self._route_names = OrderedDict()
+        self._route_names_routes = (None, 0)
 
     async def __call__(self, scope, receive, send):
         """
@@ -145,36 +151,22 @@ class ElasticAPM:
                 elasticapm.set_transaction_result(result, override=False)
             await send(message)
 
-        # When we consume the body from receive, we replace the streaming
-        # mechanism with a mocked version -- this workaround came from
-        # https://github.com/encode/starlette/issues/495#issuecomment-513138055
-        body = b""
-        while True:
-            message = await receive()
-            if not message:
-                break
-            if message["type"] == "http.request":
-                b = message.get("body", b"")
-                if b:
-                    body += b
-                if not message.get("more_body", False):
-                    break
-            if message["type"] == "http.disconnect":
-                break
-
-        async def _receive() -> Message:
-            await asyncio.sleep(0)
-            return {"type": "http.request", "body": body}
-
-        request = Request(scope, receive=_receive)
-        await self._request_started(request)
+        # The body is only captured if it can end up in an event. In that case
+        # the application keeps streaming it, and we only keep a bounded copy.
+        if self.client.config.capture_body in ("all", constants.TRANSACTION, constants.ERROR):
+            receive = body = BodyTee(receive)
+        else:
+            body = None
+
+        request = Request(scope, receive=receive)
+        await self._request_started(request, body)
 
         try:
-            await self.app(scope, _receive, wrapped_send)
+            await self.app(scope, receive, wrapped_send)
             elasticapm.set_transaction_outcome(constants.OUTCOME.SUCCESS, override=False)
         except Exception:
             await self.capture_exception(
-                context={"request": await get_data_from_request(request, self.client.config, constants.ERROR)}
+                context={"request": await get_data_from_request(request, self.client.config, constants.ERROR, body)}
             )
             elasticapm.set_transaction_result("HTTP 5xx", override=False)
             elasticapm.set_transaction_outcome(constants.OUTCOME.FAILURE, override=False)
@@ -202,31 +194,52 @@ class ElasticAPM:
         """
         self.client.capture_message(*args, **kwargs)
 
-    async def _request_started(self, request: Request):
+    async def _request_started(self, request: Request, body: Optional[BodyTee] = None):
         """Captures the begin of the request processing to APM.
 
         Args:
             request (Request)
+            body (BodyTee): captures the request body while the app reads it
         """
-        # When we consume the body, we replace the streaming mechanism with
-        # a mocked version -- this workaround came from
-        # https://github.com/encode/starlette/issues/495#issuecomment-513138055
-        # and we call the workaround here to make sure that regardless of
-        # `capture_body` settings, we will have access to the body if we need it.
-        if self.client.config.capture_body != "off":
-            await get_body(request)
-
         if not self.client.should_ignore_url(request.url.path):
             trace_parent = TraceParent.from_headers(dict(request.headers))
             self.client.begin_transaction("request", trace_parent=trace_parent)
 
+            # the request data, including the body the app reads in the meantime,
+            # is only collected once the transaction is serialized
             await set_context(
-                lambda: get_data_from_request(request, self.client.config, constants.TRANSACTION), "request"
+                LazyContext(
+                    functools.partial(get_request_data, request, self.client.config, constants.TRANSACTION, body)
+                ),
+                "request",
             )
             transaction_name = self.get_route_name(request) or request.url.path
             elasticapm.set_transaction_name("{} {}".format(request.method, transaction_name), override=False)
 
     def get_route_name(self, request: Request) -> str:
+        """Returns the route name of the request, e.g. `/hi/{name}`
+
+        Resolving the route name means matching the request against the routes
+        of the app, so results are kept in an LRU cache. It is cleared if the
+        list of routes changes.
+        """
+        routes = request.app.routes
+        if self._route_names_routes != (id(routes), len(routes)):
+            self._route_names.clear()
+            self._route_names_routes = (id(routes), len(routes))
+        scope = request.scope
+        key = (scope["method"], scope.get("root_path", ""), scope["path"], request.headers.get("host"))
+        try:
+            route_name = self._route_names[key]
+        except KeyError:
+            route_name = self._route_names[key] = self._resolve_route_name(request)
+            if len(self._route_names) > ROUTE_NAME_CACHE_SIZE:
+                self._route_names.popitem(last=False)
+        else:
+            self._route_names.move_to_end(key)
+        return route_name
+
+    def _resolve_route_name(self, request: Request) -> str:
         app = request.app
         scope = request.scope
         routes = app.routes
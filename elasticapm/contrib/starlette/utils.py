@@ -28,51 +28,110 @@
 #  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import asyncio
+from typing import Optional
 
 from starlette.datastructures import Headers
 from starlette.requests import Request
-from starlette.types import Message
+from starlette.types import Message, Receive
 
 from elasticapm.conf import Config, constants
-from elasticapm.utils import get_url_dict
+from elasticapm.utils import get_request_fields, get_url_dict
 
+# the number of bytes of a request body that are kept for the request context
+BODY_MAX_LENGTH = 64 * 1024
 
-async def get_data_from_request(request: Request, config: Config, event_type: str) -> dict:
-    """Loads data from incoming request for APM capturing.
+
+class BodyTee(object):
+    """
+    Wraps an ASGI `receive` callable and keeps a copy of the first `max_length`
+    bytes of the request body while the application streams it.
+    """
+
+    __slots__ = ("receive", "max_length", "body")
+
+    def __init__(self, receive: Receive, max_length: int = BODY_MAX_LENGTH):
+        self.receive = receive
+        self.max_length = max_length
+        self.body = bytearray()
+
+    async def __call__(self) -> Message:
+        message = await self.receive()
+        if message["type"] == "http.request":
+            chunk = message.get("body")
+            remaining = self.max_length - len(self.body)
+            if chunk and remaining > 0:
+                self.body += chunk[:remaining]
+        return message
+
+    def decode(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+
+def get_request_data(request: Request, config: Config, event_type: str, body: Optional[BodyTee] = None) -> dict:
+    """Synchronous variant of `get_data_from_request`, which never reads the body itself.
 
     Args:
         request (Request)
         config (Config)
         event_type (str)
+        body (BodyTee): the captured request body, if any
 
     Returns:
         dict
     """
-    result = {
-        "method": request.method,
-        "socket": {"remote_address": _get_client_ip(request)},
-        "cookies": request.cookies,
-    }
-    if config.capture_headers:
-        result["headers"] = dict(request.headers)
-
-    if request.method in constants.HTTP_WITH_BODY:
+    fields = get_request_fields(config, event_type)
+    result = {"method": request.method}
+    if "socket" in fields:
+        result["socket"] = {"remote_address": _get_client_ip(request)}
+    if "cookies" in fields:
+        result["cookies"] = request.cookies
+    if "headers" in fields and config.capture_headers:
+        if config.request_headers_allowlist:
+            headers = request.headers
+            result["headers"] = {name: headers[name] for name in config.request_headers_allowlist if name in headers}
+        else:
+            result["headers"] = dict(request.headers)
+
+    if "body" in fields and request.method in constants.HTTP_WITH_BODY:
         if config.capture_body not in ("all", event_type):
             result["body"] = "[REDACTED]"
-        else:
-            body = None
-            try:
-                body = await get_body(request)
-            except Exception:
-                pass
-            if body is not None:
-                result["body"] = body
+        elif body is not None:
+            result["body"] = body.decode()
 
-    result["url"] = get_url_dict(str(request.url))
+    if "url" in fields:
+        result["url"] = get_url_dict(str(request.url))
 
     return result
 
 
+async def get_data_from_request(
+    request: Request, config: Config, event_type: str, body: Optional[BodyTee] = None
+) -> dict:
+    """Loads data from incoming request for APM capturing.
+
+    Args:
+        request (Request)
+        config (Config)
+        event_type (str)
+        body (BodyTee): if given, the body is taken from it instead of being read from the request
+
+    Returns:
+        dict
+    """
+    result = get_request_data(request, config, event_type, body)
+    if (
+        body is None
+        and "body" not in result
+        and request.method in constants.HTTP_WITH_BODY
+        and "body" in get_request_fields(config, event_type)
+    ):
+        try:
+            result["body"] = await get_body(request)
+        except Exception:
+            pass
+    return result
+
+
 async def get_data_from_response(message: dict, config: Config, event_type: str) -> dict:
     """Loads data from response for APM capturing.
 
@@ -29,11 +29,11 @@
 #  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 
 
-import random
 import sys
 
 from elasticapm.conf.constants import EXCEPTION_CHAIN_MAX_DEPTH
 from elasticapm.utils import varmap
+from elasticapm.utils.disttracing import generate_trace_id
 from elasticapm.utils.encoding import keyword_field, shorten, to_unicode
 from elasticapm.utils.logging import get_logger
 from elasticapm.utils.stacks import get_culprit, get_stack_info, iter_traceback_frames
@@ -134,7 +134,7 @@ class Exception(BaseEvent):
             message = "%s: %s" % (exc_type, to_unicode(exc_value)) if exc_value else str(exc_type)
 
         data = {
-            "id": "%032x" % random.getrandbits(128),
+            "id": generate_trace_id(),
             "culprit": keyword_field(culprit),
             "exception": {
                 "message": message,
@@ -196,7 +196,7 @@ class Message(BaseEvent):
         message = param_message["message"] % params if params else param_message["message"]
         data = kwargs.get("data", {})
         message_data = {
-            "id": "%032x" % random.getrandbits(128),
+            "id": generate_trace_id(),
             "log": {
                 "level": keyword_field(level or "error"),
                 "logger_name": keyword_field(logger_name or "__root__"),
@@ -30,19 +30,52 @@
 
 
 import threading
+import timeit
 
 from elasticapm.instrumentation import register
+from elasticapm.utils.logging import get_logger
+
+logger = get_logger("elasticapm.instrument")
 
 _lock = threading.Lock()
 
 
 def instrument():
     """
-    Instruments all registered methods/functions with a wrapper
+    Instruments all registered methods/functions with a wrapper.
+
+    Methods of packages that haven't been imported yet are instrumented
+    once the package is imported.
     """
     with _lock:
+        start = timeit.default_timer()
         for obj in register.get_instrumentation_objects():
             obj.instrument()
+        duration = timeit.default_timer() - start
+    report = get_instrumentation_report()
+    logger.debug(
+        "Instrumentation took %.2fms. Instrumented: %s. Waiting for import: %s",
+        duration * 1000,
+        ", ".join(sorted(name for name, info in report.items() if info["instrumented"])) or "-",
+        ", ".join(sorted({package for info in report.values() for package in info["waiting_for"]})) or "-",
+    )
+
+
+def get_instrumentation_report():
+    """
+    Returns a dictionary with an entry per enabled instrumentation name, containing
+    the instrumented methods, the packages it is still waiting for to be
+    imported, and the time spent patching in milliseconds.
+    """
+    report = {}
+    for obj in register.get_instrumentation_objects():
+        if not obj.instrumented:
+            continue
+        info = report.setdefault(obj.name, {"instrumented": [], "waiting_for": [], "duration": 0.0})
+        info["instrumented"] = sorted(info["instrumented"] + [".".join(key) for key in obj.originals])
+        info["waiting_for"] = sorted(set(info["waiting_for"]) | obj.waiting_for)
+        info["duration"] += obj.instrument_duration * 1000
+    return report
 
 
 def uninstrument():
@@ -63,7 +63,7 @@ class AioHttpClientInstrumentation(AsyncAbstractInstrumentedModule):
 
             parent_id = leaf_span.id if leaf_span else transaction.id
             trace_parent = transaction.trace_parent.copy_from(
-                span_id=parent_id, trace_options=TracingOptions(recorded=True)
+                span_id=parent_id, trace_options=TracingOptions(recorded=not transaction.tail_sampling)
             )
             headers = kwargs.get("headers") or {}
             self._set_disttracing_headers(headers, trace_parent, transaction)
@@ -30,6 +30,8 @@
 
 import functools
 import os
+import sys
+import timeit
 
 from elasticapm.traces import execution_context
 from elasticapm.utils import wrapt
@@ -60,8 +62,10 @@ class AbstractInstrumentedModule(object):
 
     The `instrument()` method will be called for each InstrumentedModule
     listed in the instrument register (elasticapm.instrumentation.register),
-    and each method in the `instrument_list` will be wrapped (using wrapt)
-    with the `call_if_sampling()` function, which (by default) will either
+    and registers a post-import hook for the top-level package of each module
+    in the `instrument_list`. Once that package is imported, each method in
+    the `instrument_list` will be wrapped (using wrapt) with the
+    `call_if_sampling()` function, which (by default) will either
     call the wrapped function by itself, or pass it into `call()` to be
     called if there is a transaction active.
 
@@ -100,6 +104,12 @@ class AbstractInstrumentedModule(object):
     def __init__(self):
         self.originals = {}
         self.instrumented = False
+        # top-level packages that have a post-import hook registered, and the
+        # subset of them that hasn't been imported yet
+        self._hooked_packages = set()
+        self.waiting_for = set()
+        # total time spent patching, in seconds
+        self.instrument_duration = 0.0
 
         assert self.name is not None
 
@@ -121,6 +131,13 @@ class AbstractInstrumentedModule(object):
         return self.instrument_list
 
     def instrument(self):
+        """
+        Registers a post-import hook for each package in the instrument list.
+
+        The actual patching is deferred until the package is imported by the
+        application (or done right away if it already has been imported), so
+        instrumenting a library that is installed, but never used, costs nothing.
+        """
         if self.instrumented:
             return
 
@@ -129,7 +146,41 @@ class AbstractInstrumentedModule(object):
             logger.debug("Skipping instrumentation of %s. %s is set.", self.name, skip_env_var)
             return
         try:
-            instrument_list = self.get_instrument_list()
+            packages = {module.split(".", 1)[0] for module, method in self.get_instrument_list()}
+        except ImportError as ex:
+            logger.debug("Skipping instrumentation of %s. %s", self.name, ex)
+            packages = set()
+        self.instrumented = True
+        for package in packages:
+            if package not in self._hooked_packages:
+                self._hooked_packages.add(package)
+                self.waiting_for.add(package)
+                # fires immediately if the package has already been imported
+                wrapt.register_post_import_hook(self._instrument_package, package)
+            elif package in sys.modules:
+                self._instrument_package(sys.modules[package])
+            else:
+                self.waiting_for.add(package)
+
+    def _instrument_package(self, package):
+        """
+        Post-import hook that patches the methods of the instrument list that
+        live in the given top-level package.
+
+        This is called from within the import of the package, so any error
+        is logged instead of raised.
+        """
+        if not self.instrumented:
+            return
+        package_name = package.__name__
+        self.waiting_for.discard(package_name)
+        start = timeit.default_timer()
+        try:
+            instrument_list = [
+                (module, method)
+                for module, method in self.get_instrument_list()
+                if module.split(".", 1)[0] == package_name
+            ]
             skipped_modules = set()
             instrumented_methods = []
 
@@ -162,24 +213,25 @@ class AbstractInstrumentedModule(object):
                     logger.debug("Skipping instrumentation of %s.%s: %s", module, method, ex)
             if instrumented_methods:
                 logger.debug("Instrumented %s, %s", self.name, ", ".join(".".join(m) for m in instrumented_methods))
-
         except ImportError as ex:
             logger.debug("Skipping instrumentation of %s. %s", self.name, ex)
-        self.instrumented = True
+        except Exception:
+            logger.warning("Instrumentation of %s failed", self.name, exc_info=True)
+        self.instrument_duration += timeit.default_timer() - start
 
     def uninstrument(self):
-        if not self.instrumented or not self.originals:
+        if not self.instrumented:
             return
         uninstrumented_methods = []
-        for module, method in self.get_instrument_list():
-            if (module, method) in self.originals:
-                parent, attribute, wrapper = wrapt.resolve_path(module, method)
-                wrapt.apply_patch(parent, attribute, self.originals[(module, method)])
-                uninstrumented_methods.append((module, method))
+        for (module, method), original in self.originals.items():
+            parent, attribute, wrapper = wrapt.resolve_path(module, method)
+            wrapt.apply_patch(parent, attribute, original)
+            uninstrumented_methods.append((module, method))
         if uninstrumented_methods:
             logger.debug("Uninstrumented %s, %s", self.name, ", ".join(".".join(m) for m in uninstrumented_methods))
         self.instrumented = False
         self.originals = {}
+        self.waiting_for = set()
 
     def call_if_sampling(self, module, method, wrapped, instance, args, kwargs):
         """
@@ -89,7 +89,7 @@ class Httplib2Instrumentation(AbstractInstrumentedModule):
             # In this case, the transaction.id is used
             parent_id = leaf_span.id if leaf_span else transaction.id
             trace_parent = transaction.trace_parent.copy_from(
-                span_id=parent_id, trace_options=TracingOptions(recorded=True)
+                span_id=parent_id, trace_options=TracingOptions(recorded=not transaction.tail_sampling)
             )
             self._set_disttracing_headers(params["headers"], trace_parent, transaction)
             if leaf_span:
@@ -83,7 +83,7 @@ class HTTPCoreAsyncInstrumentation(AsyncAbstractInstrumentedModule):
                 # transaction_max_spans limit. In this case, the transaction.id is used
                 parent_id = leaf_span.id if leaf_span else transaction.id
                 trace_parent = transaction.trace_parent.copy_from(
-                    span_id=parent_id, trace_options=TracingOptions(recorded=True)
+                    span_id=parent_id, trace_options=TracingOptions(recorded=not transaction.tail_sampling)
                 )
                 utils.set_disttracing_headers(headers, trace_parent, transaction)
             response = await wrapped(*args, **kwargs)
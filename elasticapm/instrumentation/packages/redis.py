@@ -30,6 +30,8 @@
 
 from __future__ import absolute_import
 
+import sys
+
 from elasticapm.instrumentation.packages.base import AbstractInstrumentedModule
 from elasticapm.traces import capture_span, execution_context
 
@@ -39,6 +41,10 @@ class Redis3CheckMixin(object):
     instrument_list = []
 
     def get_instrument_list(self):
+        if "redis" not in sys.modules:
+            # don't import redis only to check its version. This is called
+            # again from the post-import hook once redis has been imported.
+            return self.instrument_list
         try:
             from redis import VERSION
 
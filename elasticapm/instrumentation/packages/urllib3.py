@@ -123,7 +123,7 @@ class Urllib3Instrumentation(AbstractInstrumentedModule):
 
             parent_id = leaf_span.id if leaf_span else transaction.id
             trace_parent = transaction.trace_parent.copy_from(
-                span_id=parent_id, trace_options=TracingOptions(recorded=True)
+                span_id=parent_id, trace_options=TracingOptions(recorded=not transaction.tail_sampling)
             )
             args, kwargs = update_headers(args, kwargs, instance, transaction, trace_parent)
             if leaf_span:
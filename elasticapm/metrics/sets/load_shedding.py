@@ -0,0 +1,61 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+from __future__ import absolute_import
+
+from elasticapm.metrics.base_metrics import MetricsSet
+
+
+class LoadSheddingMetricSet(MetricsSet):
+    """
+    The current load shedding level, and how many events, spans and stack traces were dropped
+    since the last collection.
+    """
+
+    def __init__(self, registry):
+        super(LoadSheddingMetricSet, self).__init__(registry)
+        self._level = self.gauge("agent.load_shedding.level")
+        self._dropped_events = self.counter("agent.load_shedding.events.dropped", reset_on_collect=True)
+        self._dropped_spans = self.counter("agent.load_shedding.spans.dropped", reset_on_collect=True)
+        self._skipped_stack_traces = self.counter("agent.load_shedding.stacktraces.skipped", reset_on_collect=True)
+        self._last_counts = (0, 0, 0)
+
+    def before_collect(self):
+        load_shedder = self._registry.client.load_shedder
+        if not load_shedder:
+            return
+        self._level.val = load_shedder.level
+        counts = (load_shedder.dropped_events, load_shedder.dropped_spans, load_shedder.skipped_stack_traces)
+        for counter, count, last_count in zip(
+            (self._dropped_events, self._dropped_spans, self._skipped_stack_traces), counts, self._last_counts
+        ):
+            counter.inc(count - last_count)
+        self._last_counts = counts
@@ -0,0 +1,67 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+from __future__ import absolute_import
+
+from elasticapm.metrics.base_metrics import MetricsSet
+
+
+class TransportMetricSet(MetricsSet):
+    """
+    Metrics about the agent's own transport, e.g. how well the request bodies compress
+    and how much CPU time is spent compressing them.
+    """
+
+    def __init__(self, registry):
+        super(TransportMetricSet, self).__init__(registry)
+        self._flushes = self.counter("agent.transport.flushes", reset_on_collect=True)
+        self._uncompressed_bytes = self.counter("agent.transport.bytes.uncompressed", reset_on_collect=True)
+        self._compressed_bytes = self.counter("agent.transport.bytes.compressed", reset_on_collect=True)
+        self._compression_ratio = self.gauge("agent.transport.compression.ratio", reset_on_collect=True)
+        self._compression_time = self.timer("agent.transport.compression.cpu", reset_on_collect=True, unit="us")
+
+    def record_flush(self, uncompressed_size, compressed_size, compression_time):
+        """
+        Records the statistics of a single flush
+
+        :param uncompressed_size: size of the request body before compression, in bytes
+        :param compressed_size: size of the request body after compression, in bytes
+        :param compression_time: CPU time spent compressing the request body, in seconds
+        """
+        self._flushes.inc()
+        self._uncompressed_bytes.inc(uncompressed_size)
+        self._compressed_bytes.inc(compressed_size)
+        self._compression_time.update(int(compression_time * 1000000))
+
+    def before_collect(self):
+        uncompressed, compressed = self._uncompressed_bytes.val, self._compressed_bytes.val
+        if uncompressed and compressed:
+            self._compression_ratio.val = round(uncompressed / compressed, 2)
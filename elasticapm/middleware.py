@@ -32,7 +32,7 @@
 import sys
 
 from elasticapm.utils import get_url_dict
-from elasticapm.utils.wsgi import get_current_url, get_environ, get_headers
+from elasticapm.utils.wsgi import get_current_url, get_environ, get_header_dict
 
 
 class ElasticAPM(object):
@@ -66,7 +66,7 @@ class ElasticAPM(object):
                 "request": {
                     "method": environ.get("REQUEST_METHOD"),
                     "url": get_url_dict(get_current_url(environ)),
-                    "headers": dict(get_headers(environ)),
+                    "headers": get_header_dict(environ, self.client.config.request_headers_allowlist),
                     "env": dict(get_environ(environ)),
                 }
             },
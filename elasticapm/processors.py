@@ -29,13 +29,14 @@
 #  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 
 
+import re
 import warnings
 from collections import defaultdict
 
 from elasticapm.conf.constants import BASE_SANITIZE_FIELD_NAMES, ERROR, MASK, SPAN, TRANSACTION
 from elasticapm.utils import varmap
 from elasticapm.utils.encoding import force_text
-from elasticapm.utils.stacks import get_lines_from_file
+from elasticapm.utils.stacks import get_source_file
 
 
 def for_events(*events):
@@ -218,24 +219,22 @@ def sanitize_http_request_body(client, event):
 
 @for_events(ERROR, SPAN)
 def add_context_lines_to_frames(client, event):
-    # divide frames up into source files before reading from disk. This should help
-    # with utilizing the disk cache better
-    #
-    # TODO: further optimize by only opening each file once and reading all needed source
-    # TODO: blocks at once.
+    # divide frames up into source files, so that the source of each file is only
+    # looked up once, and all context lines of that file are served from it
     per_file = defaultdict(list)
     _process_stack_frames(
         event,
         lambda frame: per_file[frame["context_metadata"][0]].append(frame) if "context_metadata" in frame else None,
     )
     for frames in per_file.values():
-        for frame in frames:
+        source_file = None
+        for i, frame in enumerate(frames):
             # context_metadata key has been set in elasticapm.utils.stacks.get_frame_info for
             # all frames for which we should gather source code context lines
             fname, lineno, context_lines, loader, module_name = frame.pop("context_metadata")
-            pre_context, context_line, post_context = get_lines_from_file(
-                fname, lineno, context_lines, loader, module_name
-            )
+            if i == 0:
+                source_file = get_source_file(fname, loader, module_name)
+            pre_context, context_line, post_context = source_file.get_context_lines(lineno, context_lines)
             if context_line:
                 frame["pre_context"] = pre_context
                 frame["context_line"] = context_line
@@ -269,14 +268,87 @@ def _sanitize(key, value, **kwargs):
     if not key:  # key can be a NoneType
         return value
 
-    key = key.lower()
-    for field in sanitize_field_names:
-        if field.match(key.strip()):
-            # store mask as a fixed length for security
-            return MASK
+    matcher = _field_name_matcher
+    if matcher.field_names is not sanitize_field_names or matcher.length != len(sanitize_field_names):
+        matcher = _get_field_name_matcher(sanitize_field_names)
+    if matcher(key):
+        # store mask as a fixed length for security
+        return MASK
     return value
 
 
+_FIELD_NAME_MEMO_MAX = 1000
+_FIELD_NAME_MATCHERS_MAX = 16
+_SCOPED_FLAGS = (("i", re.IGNORECASE), ("m", re.MULTILINE), ("s", re.DOTALL), ("x", re.VERBOSE))
+
+
+class _FieldNameMatcher(object):
+    """
+    Matches field names against all patterns of `sanitize_field_names` with a
+    single regex, and remembers the result for the field names it has seen.
+    The memo is cleared once it reaches _FIELD_NAME_MEMO_MAX entries.
+    """
+
+    __slots__ = ("field_names", "length", "match", "memo")
+
+    def __init__(self, field_names):
+        self.field_names = field_names
+        self.length = len(field_names)
+        self.match = self._combine(field_names)
+        self.memo = {}
+
+    @staticmethod
+    def _combine(patterns):
+        parts = []
+        for pattern in patterns:
+            flags = pattern.flags & ~re.UNICODE
+            if not isinstance(pattern.pattern, str) or flags & ~(re.IGNORECASE | re.MULTILINE | re.DOTALL | re.VERBOSE):
+                break
+            enabled = "".join(letter for letter, flag in _SCOPED_FLAGS if flags & flag)
+            disabled = "".join(letter for letter, flag in _SCOPED_FLAGS if not flags & flag)
+            parts.append("(?%s%s:%s)" % (enabled, "-" + disabled if disabled else "", pattern.pattern))
+        else:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("error")
+                    return re.compile("|".join(parts) or "(?!)").match
+            except (re.error, Warning):
+                pass
+        # patterns that can't be combined are matched one after the other
+        return lambda key: any(pattern.match(key) for pattern in patterns)
+
+    def __call__(self, key) -> bool:
+        try:
+            return self.memo[key]
+        except KeyError:
+            result = bool(self.match(key.lower().strip()))
+            if len(self.memo) >= _FIELD_NAME_MEMO_MAX:
+                self.memo.clear()
+            self.memo[key] = result
+            return result
+
+
+def _get_field_name_matcher(field_names):
+    """
+    Returns the matcher for the given patterns. Matchers are cached per set of patterns, so
+    that equal `sanitize_field_names` lists (e.g. of several clients) share a matcher.
+    """
+    global _field_name_matcher
+    key = tuple((pattern.pattern, pattern.flags) for pattern in field_names)
+    matcher = _field_name_matchers.get(key)
+    if matcher is None:
+        if len(_field_name_matchers) >= _FIELD_NAME_MATCHERS_MAX:
+            _field_name_matchers.clear()
+        matcher = _field_name_matchers[key] = _FieldNameMatcher(field_names)
+    _field_name_matcher = matcher
+    return matcher
+
+
+# Maps tuples of (pattern, flags) to matchers, see _get_field_name_matcher
+_field_name_matchers = {}
+_field_name_matcher = _get_field_name_matcher(BASE_SANITIZE_FIELD_NAMES)
+
+
 def _sanitize_string(unsanitized, itemsep, kvsep, sanitize_field_names=BASE_SANITIZE_FIELD_NAMES):
     """
     sanitizes a string that contains multiple key/value items
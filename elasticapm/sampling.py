@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import threading
+import timeit
+from collections import OrderedDict
+
+from elasticapm.conf import constants
+from elasticapm.utils.logging import get_logger
+
+logger = get_logger("elasticapm.sampling")
+
+
+class Sampler(object):
+    """
+    Base class of transaction samplers, see the `transaction_sampler` config option.
+
+    A sampler decides on the sample rate of each transaction that starts a new trace.
+    Transactions that continue a trace use the sampling decision of the trace parent instead.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def sample_rate(self, transaction_type, transaction_name, sample_rate):
+        """
+        Returns the sample rate of a new transaction, between 0 and 1, with a precision of 4 digits
+
+        :param transaction_type: type of the transaction, e.g. "request"
+        :param transaction_name: name of the transaction, or None if it isn't known when it starts
+        :param sample_rate: the configured `transaction_sample_rate`
+        """
+        return sample_rate
+
+
+class _Bucket(object):
+    __slots__ = ("rate", "seen", "since", "throughput")
+
+    def __init__(self, now):
+        self.rate = 1.0
+        # transactions seen since the last adjustment
+        self.seen = 0
+        self.since = now
+        # smoothed transactions per second, None until the first adjustment
+        self.throughput = None
+
+
+class AdaptiveSampler(Sampler):
+    """
+    Adjusts the sample rate of each transaction type and name, so that roughly `adaptive_sampling_target`
+    transactions per second are sampled for each of them. High-volume endpoints get a low sample rate,
+    while rarely called endpoints are sampled completely.
+
+    The throughput of each endpoint is measured over the metrics interval, and the sample rates are adjusted
+    once per interval. New endpoints start with a sample rate of 1, which is lowered early once they used
+    up the samples of the first interval. The configured `transaction_sample_rate` is the upper bound
+    of all sample rates.
+
+    Most framework integrations only know the transaction type when a transaction starts, in which case
+    all transactions of the same type share a sample rate.
+    """
+
+    MIN_SAMPLE_RATE = 0.0001
+    # endpoints beyond this number share one sample rate
+    MAX_BUCKETS = 1000
+    DEFAULT_INTERVAL = 30.0
+
+    def __init__(self, client):
+        super(AdaptiveSampler, self).__init__(client)
+        self.interval = client.config.metrics_interval.total_seconds() or self.DEFAULT_INTERVAL
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_adjustment = timeit.default_timer()
+
+    def sample_rate(self, transaction_type, transaction_name, sample_rate):
+        if not sample_rate:
+            return sample_rate
+        now = timeit.default_timer()
+        if now - self._last_adjustment >= self.interval:
+            self._adjust(now)
+        key = (transaction_type, transaction_name)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._get_bucket(key, now)
+        bucket.seen += 1
+        if bucket.throughput is None and bucket.seen > self.client.config.adaptive_sampling_target * self.interval:
+            # a new endpoint with a lot of traffic, don't wait for the end of the interval
+            self._update_rate(bucket, bucket.seen / max(now - bucket.since, 0.001))
+        return min(sample_rate, bucket.rate)
+
+    def _get_bucket(self, key, now):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.MAX_BUCKETS:
+                    key = None
+                    bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = _Bucket(now)
+            return bucket
+
+    def _update_rate(self, bucket, throughput):
+        bucket.throughput = throughput if bucket.throughput is None else (bucket.throughput + throughput) / 2
+        rate = self.client.config.adaptive_sampling_target / bucket.throughput if bucket.throughput else 1.0
+        # sample rates are limited to a precision of 4 digits
+        bucket.rate = min(1.0, max(self.MIN_SAMPLE_RATE, round(rate, 4)))
+
+    def _adjust(self, now):
+        with self._lock:
+            if now - self._last_adjustment < self.interval:
+                # another thread adjusted the sample rates in the meantime
+                return
+            self._last_adjustment = now
+            for key, bucket in list(self._buckets.items()):
+                if not bucket.seen:
+                    # endpoints without traffic start over once they are called again
+                    del self._buckets[key]
+                    continue
+                self._update_rate(bucket, bucket.seen / max(now - bucket.since, 0.001))
+                bucket.seen = 0
+                bucket.since = now
+        logger.debug("Adjusted sample rates of %d transaction types and names", len(self._buckets))
+
+
+class TailSampler(object):
+    """
+    Holds back the spans of transactions that weren't sampled when they started, until the transaction ends.
+    The transaction is kept if it took at least `min_duration` seconds, failed, or an error was captured
+    during it. Otherwise, it is dropped as decided when it started.
+
+    At most `max_spans` spans are held back, counting every transaction as one span as well. Beyond that,
+    the oldest transactions are evicted, and dropped when they end.
+    """
+
+    def __init__(self, min_duration, max_spans):
+        self.min_duration = min_duration
+        self.max_spans = max_spans
+        # counter of evicted transactions
+        self.evicted = 0
+        self._buffers = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def start(self, transaction):
+        """Starts holding back the spans of the given transaction"""
+        with self._lock:
+            self._buffers[transaction] = []
+            self._size += 1
+            self._evict()
+
+    def buffer(self, transaction, span):
+        """
+        Holds back a span of the given transaction. The span is discarded if the transaction was evicted.
+
+        :param span: the span event, as it would be queued otherwise
+        """
+        with self._lock:
+            buffer = self._buffers.get(transaction)
+            if buffer is not None:
+                buffer.append(span)
+                self._size += 1
+                self._evict()
+
+    def finish(self, transaction):
+        """
+        Decides whether to keep the given transaction, which has ended.
+
+        :return: the held back spans of the transaction if it is kept, None otherwise
+        """
+        with self._lock:
+            buffer = self._buffers.pop(transaction, None)
+            if buffer is not None:
+                self._size -= len(buffer) + 1
+        if buffer is not None and (
+            transaction.tail_sampling_keep
+            or transaction.outcome == constants.OUTCOME.FAILURE
+            or transaction._duration >= self.min_duration
+        ):
+            return buffer
+        return None
+
+    def _evict(self):
+        while self._size > self.max_spans and self._buffers:
+            transaction, buffer = self._buffers.popitem(last=False)
+            self._size -= len(buffer) + 1
+            self.evicted += 1
@@ -46,8 +46,9 @@ from elasticapm.conf.constants import LABEL_RE, SPAN, TRANSACTION
 from elasticapm.context import init_execution_context
 from elasticapm.metrics.base_metrics import Timer
 from elasticapm.utils import encoding, get_name_from_func, nested_key, url_to_destination_resource
-from elasticapm.utils.disttracing import TraceParent, TracingOptions
+from elasticapm.utils.disttracing import TraceParent, TracingOptions, generate_span_id, generate_trace_id
 from elasticapm.utils.logging import get_logger
+from elasticapm.utils.stacks import FrameSnapshot
 from elasticapm.utils.time import time_to_perf_counter
 
 __all__ = ("capture_span", "label", "set_transaction_name", "set_custom_context", "set_user_context")
@@ -63,51 +64,114 @@ execution_context = init_execution_context()
 SpanType = Union["Span", "DroppedSpan"]
 
 
+# used to lazily create the lock of a span, see BaseSpan._get_lock
+_lock_creation_lock = threading.Lock()
+
+
 class ChildDuration(object):
-    __slots__ = ("obj", "_nesting_level", "_start", "_duration", "_lock")
+    """
+    Tracks the time during which at least one child of a span was running.
+    Not thread-safe, callers need to hold the lock of the span.
+    """
+
+    __slots__ = ("_nesting_level", "_start", "duration")
 
-    def __init__(self, obj: "BaseSpan"):
-        self.obj = obj
+    def __init__(self):
         self._nesting_level: int = 0
         self._start: float = 0
-        self._duration: timedelta = timedelta(seconds=0)
-        self._lock = threading.Lock()
+        # in seconds
+        self.duration: float = 0.0
 
     def start(self, timestamp: float):
-        with self._lock:
-            self._nesting_level += 1
-            if self._nesting_level == 1:
-                self._start = timestamp
+        self._nesting_level += 1
+        if self._nesting_level == 1:
+            self._start = timestamp
 
     def stop(self, timestamp: float):
-        with self._lock:
-            self._nesting_level -= 1
-            if self._nesting_level == 0:
-                self._duration += timedelta(seconds=timestamp - self._start)
-
-    @property
-    def duration(self) -> timedelta:
-        return self._duration
+        self._nesting_level -= 1
+        if self._nesting_level == 0:
+            self.duration += timestamp - self._start
 
 
 class BaseSpan(object):
+    # Spans are created in large numbers, so they use slots, and dicts, locks
+    # etc. are only created once they are needed. Durations are stored as
+    # seconds and only converted to milliseconds in `to_dict`.
+    __slots__ = (
+        "_child_durations",
+        "_labels",
+        "_lock",
+        "_duration",
+        "outcome",
+        "compression_buffer",
+        "start_time",
+        "ended_time",
+        # set by the OpenTelemetry bridge
+        "otel_wrapper",
+    )
+
     def __init__(self, labels=None, start=None):
-        self._child_durations = ChildDuration(self)
-        self.labels = {}
+        self._child_durations: Optional[ChildDuration] = None
+        self._labels: Optional[dict] = None
+        self._lock: Optional[threading.Lock] = None
         self.outcome: Optional[str] = None
         self.compression_buffer: Optional[Union[Span, DroppedSpan]] = None
-        self.compression_buffer_lock = threading.Lock()
         self.start_time: float = time_to_perf_counter(start) if start is not None else _time_func()
         self.ended_time: Optional[float] = None
-        self.duration: Optional[timedelta] = None
+        self._duration: Optional[float] = None
         if labels:
             self.label(**labels)
 
+    @property
+    def labels(self) -> dict:
+        if self._labels is None:
+            self._labels = {}
+        return self._labels
+
+    @labels.setter
+    def labels(self, labels: dict):
+        self._labels = labels
+
+    @property
+    def duration(self) -> Optional[timedelta]:
+        return timedelta(seconds=self._duration) if self._duration is not None else None
+
+    @duration.setter
+    def duration(self, duration: Optional[Union[timedelta, float]]):
+        self._duration = duration.total_seconds() if isinstance(duration, timedelta) else duration
+
+    def _get_lock(self) -> threading.Lock:
+        """
+        Returns the lock of this span, creating it on first use. Only spans with
+        children need a lock, which are the minority.
+        """
+        lock = self._lock
+        if lock is None:
+            with _lock_creation_lock:
+                if self._lock is None:
+                    self._lock = threading.Lock()
+                lock = self._lock
+        return lock
+
     def child_started(self, timestamp):
-        self._child_durations.start(timestamp)
+        with self._get_lock():
+            if self._child_durations is None:
+                self._child_durations = ChildDuration()
+            self._child_durations.start(timestamp)
+
+    @property
+    def child_duration(self) -> float:
+        """Time in seconds during which at least one child of this span was running"""
+        return self._child_durations.duration if self._child_durations is not None else 0.0
 
-    def child_ended(self, child: SpanType):
-        with self.compression_buffer_lock:
+    def child_ended(self, child: SpanType, timestamp: Optional[float] = None):
+        """
+        Handles a child that ended. If breakdown metrics are collected, timestamp is the end time
+        of the child, which stops the child duration timer under the same lock.
+        """
+        with self._get_lock():
+            if timestamp is not None and self._child_durations is not None:
+                self._child_durations.stop(timestamp)
             if not child.is_compression_eligible():
                 if self.compression_buffer:
                     self.compression_buffer.report()
@@ -121,7 +185,10 @@ class BaseSpan(object):
 
     def end(self, skip_frames: int = 0, duration: Optional[timedelta] = None):
         self.ended_time = _time_func()
-        self.duration = duration if duration is not None else timedelta(seconds=self.ended_time - self.start_time)
+        if duration is None:
+            self._duration = self.ended_time - self.start_time
+        else:
+            self.duration = duration
         if self.compression_buffer:
             self.compression_buffer.report()
             self.compression_buffer = None
@@ -152,7 +219,7 @@ class BaseSpan(object):
 
     @staticmethod
     def get_dist_tracing_id() -> str:
-        return "%016x" % random.getrandbits(64)
+        return generate_span_id()
 
     @property
     def tracer(self) -> "Tracer":
@@ -160,6 +227,35 @@ class BaseSpan(object):
 
 
 class Transaction(BaseSpan):
+    __slots__ = (
+        "id",
+        "trace_parent",
+        "timestamp",
+        "name",
+        "result",
+        "transaction_type",
+        "_tracer",
+        "transaction",
+        "config_span_compression_enabled",
+        "config_span_compression_exact_match_max_duration",
+        "config_span_compression_same_kind_max_duration",
+        "config_exit_span_min_duration",
+        "config_transaction_max_spans",
+        "config_deferred_serialization",
+        "config_span_stack_trace_min_duration",
+        "dropped_spans",
+        "context",
+        "_is_sampled",
+        "sample_rate",
+        "_span_counter",
+        "_span_timers",
+        "_span_timers_lock",
+        "_dropped_span_statistics",
+        "_breakdown",
+        "tail_sampling",
+        "tail_sampling_keep",
+    )
+
     def __init__(
         self,
         tracer: "Tracer",
@@ -187,11 +283,11 @@ class Transaction(BaseSpan):
             This is reported to the APM server so that unsampled transactions can
             be extrapolated.
         """
-        self.id = self.get_dist_tracing_id()
+        self.id = generate_span_id()
         if not trace_parent:
             trace_parent = TraceParent(
                 constants.TRACE_CONTEXT_VERSION,
-                "%032x" % random.getrandbits(128),
+                generate_trace_id(),
                 self.id,
                 TracingOptions(recorded=is_sampled),
             )
@@ -210,6 +306,9 @@ class Transaction(BaseSpan):
         self.config_span_compression_same_kind_max_duration = tracer.config.span_compression_same_kind_max_duration
         self.config_exit_span_min_duration = tracer.config.exit_span_min_duration
         self.config_transaction_max_spans = tracer.config.transaction_max_spans
+        self.config_deferred_serialization = tracer.config.deferred_serialization
+        # in seconds, negative if stack traces are disabled
+        self.config_span_stack_trace_min_duration = tracer.span_stack_trace_min_duration.total_seconds()
 
         self.dropped_spans: int = 0
         self.context: Dict[str, Any] = {}
@@ -220,6 +319,9 @@ class Transaction(BaseSpan):
         self._span_timers: Dict[Tuple[str, str], Timer] = defaultdict(Timer)
         self._span_timers_lock = threading.Lock()
         self._dropped_span_statistics = defaultdict(lambda: {"count": 0, "duration.sum.us": 0})
+        # whether this transaction is recorded although it wasn't sampled, see elasticapm.sampling.TailSampler
+        self.tail_sampling = False
+        self.tail_sampling_keep = False
         try:
             self._breakdown = self.tracer._agent._metrics.get_metricset(
                 "elasticapm.metrics.sets.breakdown.BreakdownMetricSet"
@@ -249,7 +351,7 @@ class Transaction(BaseSpan):
                     reset_on_collect=True,
                     unit="us",
                     **{"span.type": "app", "transaction.name": self.name, "transaction.type": self.transaction_type},
-                ).update((self.duration - self._child_durations.duration).total_seconds() * 1_000_000)
+                ).update((self._duration - self.child_duration) * 1_000_000)
 
     def _begin_span(
         self,
@@ -267,12 +369,22 @@ class Transaction(BaseSpan):
     ):
         parent_span = execution_context.get_span()
         tracer = self.tracer
+        load_shedder = tracer.load_shedder
         if parent_span and parent_span.leaf:
             span = DroppedSpan(parent_span, leaf=True)
         elif self.config_transaction_max_spans and self._span_counter > self.config_transaction_max_spans - 1:
             self.dropped_spans += 1
             span = DroppedSpan(parent_span, context=context)
+        elif load_shedder and not leaf and load_shedder.drop_internal_spans:
+            self.dropped_spans += 1
+            load_shedder.dropped_spans += 1
+            span = DroppedSpan(parent_span, context=context)
         else:
+            if load_shedder:
+                # exit spans that are children of spans dropped due to load shedding are attached to the closest
+                # ancestor that wasn't dropped
+                while isinstance(parent_span, DroppedSpan):
+                    parent_span = parent_span.parent
             span = Span(
                 transaction=self,
                 name=name,
@@ -287,7 +399,10 @@ class Transaction(BaseSpan):
                 sync=sync,
                 start=start,
             )
-            span.frames = tracer.frames_collector_func()
+            if not load_shedder or load_shedder.collect_span_frames:
+                span.frames = tracer.frames_collector_func()
+            else:
+                load_shedder.skipped_stack_traces += 1
             self._span_counter += 1
         if auto_activate:
             execution_context.set_span(span)
@@ -360,7 +475,7 @@ class Transaction(BaseSpan):
         the RUM transaction with the backend transaction.
         """
         if self.trace_parent.span_id == self.id:
-            self.trace_parent.span_id = "%016x" % random.getrandbits(64)
+            self.trace_parent.span_id = generate_span_id()
             logger.debug("Set parent id to generated %s", self.trace_parent.span_id)
         return self.trace_parent.span_id
 
@@ -371,7 +486,7 @@ class Transaction(BaseSpan):
             "trace_id": self.trace_parent.trace_id,
             "name": encoding.keyword_field(self.name or ""),
             "type": encoding.keyword_field(self.transaction_type),
-            "duration": self.duration.total_seconds() * 1000,
+            "duration": self._duration * 1000,
             "result": encoding.keyword_field(str(self.result)),
             "timestamp": int(self.timestamp * 1_000_000),  # microseconds
             "outcome": self.outcome,
@@ -414,14 +529,22 @@ class Transaction(BaseSpan):
             for key, value in attributes.items():
                 result["context"]["tags"][key] = value
         if self.is_sampled:
+            for key, value in list(self.context.items()):
+                if isinstance(value, LazyContext):
+                    value = value.materialize()
+                    if value is None:
+                        # incomplete context data could be rejected by the APM Server, e.g. a request without method
+                        del self.context[key]
+                    else:
+                        self.context[key] = value
             result["context"] = self.context
         return result
 
-    def track_span_duration(self, span_type, span_subtype, self_duration):
+    def track_span_duration(self, span_type, span_subtype, self_duration: float):
         # TODO: once asynchronous spans are supported, we should check if the transaction is already finished
         # TODO: and, if it has, exit without tracking.
         with self._span_timers_lock:
-            self._span_timers[(span_type, span_subtype)].update(self_duration.total_seconds() * 1_000_000)
+            self._span_timers[(span_type, span_subtype)].update(self_duration * 1_000_000)
 
     @property
     def is_sampled(self) -> bool:
@@ -450,7 +573,7 @@ class Transaction(BaseSpan):
                 resource = span.context["destination"]["service"]["resource"]
                 stats = self._dropped_span_statistics[(resource, span.outcome)]
                 stats["count"] += 1
-                stats["duration.sum.us"] += int(span.duration.total_seconds() * 1_000_000)
+                stats["duration.sum.us"] += int(span._duration * 1_000_000)
             except KeyError:
                 pass
 
@@ -463,20 +586,15 @@ class Span(BaseSpan):
         "type",
         "subtype",
         "action",
-        "context",
+        "_context",
         "leaf",
         "dist_tracing_propagated",
         "timestamp",
-        "start_time",
-        "ended_time",
-        "duration",
         "parent",
         "parent_span_id",
         "frames",
-        "labels",
         "sync",
-        "outcome",
-        "_child_durations",
+        "composite",
     )
 
     def __init__(
@@ -509,10 +627,10 @@ class Span(BaseSpan):
         :param sync: indicate if the span was executed synchronously or asynchronously
         :param start: timestamp, mostly useful for testing
         """
-        self.id = self.get_dist_tracing_id()
+        self.id = generate_span_id()
         self.transaction = transaction
         self.name = name
-        self.context = context if context is not None else {}
+        self._context = context
         self.leaf = leaf
         # timestamp is bit of a mix of monotonic and non-monotonic time sources.
         # we take the (non-monotonic) transaction timestamp, and add the (monotonic) difference of span
@@ -526,20 +644,30 @@ class Span(BaseSpan):
         self.subtype = span_subtype
         self.action = span_action
         self.dist_tracing_propagated = False
-        self.composite: Dict[str, Any] = {}
+        self.composite: Optional[Dict[str, Any]] = None
         super(Span, self).__init__(labels=labels, start=start)
         self.timestamp = transaction.timestamp + (self.start_time - transaction.start_time)
         if self.transaction._breakdown:
             p = self.parent if self.parent else self.transaction
             p.child_started(self.start_time)
 
+    @property
+    def context(self) -> dict:
+        if self._context is None:
+            self._context = {}
+        return self._context
+
+    @context.setter
+    def context(self, context: Optional[dict]):
+        self._context = context
+
     def to_dict(self) -> dict:
         if (
             self.composite
             and self.composite["compression_strategy"] == "same_kind"
-            and nested_key(self.context, "destination", "service", "resource")
+            and nested_key(self._context, "destination", "service", "resource")
         ):
-            name = "Calls to " + self.context["destination"]["service"]["resource"]
+            name = "Calls to " + self._context["destination"]["service"]["resource"]
         else:
             name = self.name
         result = {
@@ -553,18 +681,16 @@ class Span(BaseSpan):
             "subtype": encoding.keyword_field(self.subtype),
             "action": encoding.keyword_field(self.action),
             "timestamp": int(self.timestamp * 1000000),  # microseconds
-            "duration": self.duration.total_seconds() * 1000,
+            "duration": self._duration * 1000,
             "outcome": self.outcome,
         }
         if self.transaction.sample_rate is not None:
             result["sample_rate"] = float(self.transaction.sample_rate)
         if self.sync is not None:
             result["sync"] = self.sync
-        if self.labels:
-            if self.context is None:
-                self.context = {}
-            self.context["tags"] = self.labels
-        if self.context:
+        if self._labels:
+            self.context["tags"] = self._labels
+        if self._context:
             self.autofill_resource_context()
             # otel attributes and spankind need to be top-level
             if "otel_spankind" in self.context:
@@ -584,11 +710,13 @@ class Span(BaseSpan):
                     self.context["tags"][key] = value
             result["context"] = self.context
         if self.frames:
+            if callable(self.frames):
+                self.frames = self.frames()
             result["stacktrace"] = self.frames
         if self.composite:
             result["composite"] = {
                 "compression_strategy": self.composite["compression_strategy"],
-                "sum": self.composite["sum"].total_seconds() * 1000,
+                "sum": self.composite["sum"] * 1000,
                 "count": self.composite["count"],
             }
         return result
@@ -600,11 +728,11 @@ class Span(BaseSpan):
         :param other_span: another span object
         :return: bool
         """
-        resource = nested_key(self.context, "destination", "service", "resource")
+        resource = nested_key(self._context, "destination", "service", "resource")
         return bool(
             self.type == other_span.type
             and self.subtype == other_span.subtype
-            and (resource and resource == nested_key(other_span.context, "destination", "service", "resource"))
+            and (resource and resource == nested_key(other_span._context, "destination", "service", "resource"))
         )
 
     def is_exact_match(self, other_span: SpanType) -> bool:
@@ -639,33 +767,44 @@ class Span(BaseSpan):
         """
         self.autofill_resource_context()
         super().end(skip_frames, duration)
-        tracer = self.transaction.tracer
-        if (
-            tracer.span_stack_trace_min_duration >= timedelta(seconds=0)
-            and self.duration >= tracer.span_stack_trace_min_duration
-            and self.frames
-        ):
-            self.frames = tracer.frames_processing_func(self.frames)[skip_frames:]
-        else:
-            self.frames = None
+        transaction = self.transaction
+        if self.frames:
+            stack_trace_min_duration = transaction.config_span_stack_trace_min_duration
+            if stack_trace_min_duration < 0 or self._duration < stack_trace_min_duration:
+                self.frames = None
+            else:
+                tracer = transaction.tracer
+                # the stack is only walked if the span is slow enough to need a stack trace
+                frames = self.frames() if callable(self.frames) else self.frames
+                if frames and isinstance(frames[0], tuple) and isinstance(frames[0][0], FrameSnapshot):
+                    # Frame snapshots are resolved when the span is serialized, which doesn't happen
+                    # for compressed spans, and happens on the transport thread with deferred_serialization
+                    self.frames = functools.partial(tracer.frames_processing_func, frames[skip_frames:])
+                else:
+                    self.frames = tracer.frames_processing_func(frames)[skip_frames:]
         current_span = execution_context.get_span()
         # Because otel can detach context without ending the span, we need to
         # make sure we only unset the span if it's currently set.
         if current_span is self:
             execution_context.unset_span()
 
-        p = self.parent if self.parent else self.transaction
-        if self.transaction._breakdown:
-            p._child_durations.stop(self.start_time + self.duration.total_seconds())
-            self.transaction.track_span_duration(
-                self.type, self.subtype, self.duration - self._child_durations.duration
-            )
-        p.child_ended(self)
+        p = self.parent if self.parent else transaction
+        if transaction._breakdown:
+            transaction.track_span_duration(self.type, self.subtype, self._duration - self.child_duration)
+            p.child_ended(self, self.start_time + self._duration)
+        else:
+            p.child_ended(self)
 
     def report(self) -> None:
-        if self.discardable and self.duration < self.transaction.config_exit_span_min_duration:
+        if self.discardable and self._duration < self.transaction.config_exit_span_min_duration.total_seconds():
             self.transaction.track_dropped_span(self)
             self.transaction.dropped_spans += 1
+        elif self.transaction.tail_sampling:
+            # serialized only if the transaction is kept
+            self.tracer.tail_sampler.buffer(self.transaction, self.to_dict)
+        elif self.transaction.config_deferred_serialization:
+            # the span won't change anymore, so it's safe to serialize it on the transport thread
+            self.tracer.queue_func(SPAN, self.to_dict)
         else:
             self.tracer.queue_func(SPAN, self.to_dict())
 
@@ -677,10 +816,10 @@ class Span(BaseSpan):
             return False
 
         if not self.composite:
-            self.composite = {"compression_strategy": compression_strategy, "count": 1, "sum": self.duration}
+            self.composite = {"compression_strategy": compression_strategy, "count": 1, "sum": self._duration}
         self.composite["count"] += 1
-        self.composite["sum"] += sibling.duration
-        self.duration = timedelta(seconds=sibling.ended_time - self.start_time)
+        self.composite["sum"] += sibling._duration
+        self._duration = sibling.ended_time - self.start_time
         self.transaction._span_counter -= 1
         return True
 
@@ -690,7 +829,8 @@ class Span(BaseSpan):
                 "exact_match"
                 if (
                     self.is_exact_match(sibling)
-                    and sibling.duration <= self.transaction.config_span_compression_exact_match_max_duration
+                    and sibling._duration
+                    <= self.transaction.config_span_compression_exact_match_max_duration.total_seconds()
                 )
                 else None
             )
@@ -699,7 +839,8 @@ class Span(BaseSpan):
                 "same_kind"
                 if (
                     self.is_same_kind(sibling)
-                    and sibling.duration <= self.transaction.config_span_compression_same_kind_max_duration
+                    and sibling._duration
+                    <= self.transaction.config_span_compression_same_kind_max_duration.total_seconds()
                 )
                 else None
             )
@@ -709,12 +850,12 @@ class Span(BaseSpan):
         if not self.is_same_kind(sibling):
             return None
         if self.name == sibling.name:
-            max_duration = self.transaction.config_span_compression_exact_match_max_duration
-            if self.duration <= max_duration and sibling.duration <= max_duration:
+            max_duration = self.transaction.config_span_compression_exact_match_max_duration.total_seconds()
+            if self._duration <= max_duration and sibling._duration <= max_duration:
                 return "exact_match"
             return None
-        max_duration = self.transaction.config_span_compression_same_kind_max_duration
-        if self.duration <= max_duration and sibling.duration <= max_duration:
+        max_duration = self.transaction.config_span_compression_same_kind_max_duration.total_seconds()
+        if self._duration <= max_duration and sibling._duration <= max_duration:
             return "same_kind"
         return None
 
@@ -731,31 +872,24 @@ class Span(BaseSpan):
 
     def autofill_resource_context(self):
         """Automatically fills "resource" fields based on other fields"""
-        if self.context:
-            resource = nested_key(self.context, "destination", "service", "resource")
-            if not resource and (self.leaf or any(k in self.context for k in ("destination", "db", "message", "http"))):
-                type_info = self.subtype or self.type
-                instance = nested_key(self.context, "db", "instance")
-                queue_name = nested_key(self.context, "message", "queue", "name")
-                http_url = nested_key(self.context, "http", "url")
-                if instance:
-                    resource = f"{type_info}/{instance}"
-                elif queue_name:
-                    resource = f"{type_info}/{queue_name}"
-                elif http_url:
-                    resource = url_to_destination_resource(http_url)
-                else:
-                    resource = type_info
-                if "destination" not in self.context:
-                    self.context["destination"] = {}
-                if "service" not in self.context["destination"]:
-                    self.context["destination"]["service"] = {}
-                self.context["destination"]["service"]["resource"] = resource
-                # set fields that are deprecated, but still required by APM Server API
-                if "name" not in self.context["destination"]["service"]:
-                    self.context["destination"]["service"]["name"] = ""
-                if "type" not in self.context["destination"]["service"]:
-                    self.context["destination"]["service"]["type"] = ""
+        # this runs for every span, so the context is only looked up once. Instrumentations that
+        # already know the resource set it when starting the span, and return early here
+        context = self._context
+        if not context or nested_key(context, "destination", "service", "resource"):
+            return
+        if self.leaf or "destination" in context or "db" in context or "message" in context or "http" in context:
+            type_info = self.subtype or self.type
+            resource = nested_key(context, "db", "instance") or nested_key(context, "message", "queue", "name")
+            if resource:
+                resource = f"{type_info}/{resource}"
+            else:
+                http_url = nested_key(context, "http", "url")
+                resource = url_to_destination_resource(http_url) if http_url else type_info
+            service = context.setdefault("destination", {}).setdefault("service", {})
+            service["resource"] = resource
+            # set fields that are deprecated, but still required by APM Server API
+            service.setdefault("name", "")
+            service.setdefault("type", "")
 
     def __str__(self):
         return "{}/{}/{}".format(self.name, self.type, self.subtype)
@@ -766,7 +900,7 @@ class Span(BaseSpan):
 
 
 class DroppedSpan(BaseSpan):
-    __slots__ = ("leaf", "parent", "id", "context", "outcome", "dist_tracing_propagated")
+    __slots__ = ("leaf", "parent", "id", "context", "dist_tracing_propagated")
 
     def __init__(self, parent, leaf=False, start=None, context=None):
         self.parent = parent
@@ -784,7 +918,7 @@ class DroppedSpan(BaseSpan):
     def child_started(self, timestamp):
         pass
 
-    def child_ended(self, child: SpanType):
+    def child_ended(self, child: SpanType, timestamp: Optional[float] = None):
         pass
 
     def update_context(self, key, data):
@@ -823,6 +957,9 @@ class Tracer(object):
         self.frames_processing_func = frames_processing_func
         self.frames_collector_func = frames_collector_func
         self._agent = agent
+        self.load_shedder = getattr(agent, "load_shedder", None)
+        self.sampler = getattr(agent, "sampler", None)
+        self.tail_sampler = getattr(agent, "tail_sampler", None)
         self._ignore_patterns = [re.compile(p) for p in config.transactions_ignore_patterns or []]
 
     @property
@@ -846,7 +983,7 @@ class Tracer(object):
             else:
                 return self.config.span_frames_min_duration
 
-    def begin_transaction(self, transaction_type, trace_parent=None, start=None, auto_activate=True):
+    def begin_transaction(self, transaction_type, trace_parent=None, start=None, auto_activate=True, name=None):
         """
         Start a new transactions and bind it in a thread-local variable
 
@@ -854,29 +991,43 @@ class Tracer(object):
         :param trace_parent: an optional TraceParent object
         :param start: override the start timestamp, mostly useful for testing
         :param auto_activate: whether to set this transaction in execution_context
+        :param name: name of the transaction, if it is already known
 
         :returns the Transaction object
         """
+        tail_sampling = False
         if trace_parent:
             is_sampled = bool(trace_parent.trace_options.recorded)
             sample_rate = trace_parent.tracestate_dict.get(constants.TRACESTATE.SAMPLE_RATE)
         else:
-            is_sampled = (
-                self.config.transaction_sample_rate == 1.0 or self.config.transaction_sample_rate > random.random()
-            )
+            sample_rate = self.config.transaction_sample_rate
+            if self.sampler:
+                sample_rate = self.sampler.sample_rate(transaction_type, name, sample_rate)
+            if self.load_shedder:
+                sample_rate = self.load_shedder.transaction_sample_rate(sample_rate)
+            is_sampled = sample_rate == 1.0 or sample_rate > random.random()
             if not is_sampled:
                 sample_rate = "0"
+                # the transaction is recorded anyway, and dropped at the end unless it turns out to be interesting
+                tail_sampling = self.tail_sampler is not None
             else:
-                sample_rate = str(self.config.transaction_sample_rate)
+                sample_rate = str(sample_rate)
 
         transaction = Transaction(
             self,
             transaction_type,
             trace_parent=trace_parent,
-            is_sampled=is_sampled,
+            is_sampled=is_sampled or tail_sampling,
             start=start,
             sample_rate=sample_rate,
         )
+        if name is not None:
+            transaction.name = str(name)
+        if tail_sampling:
+            # downstream services still get the head-based sampling decision
+            transaction.trace_parent = transaction.trace_parent.copy_from(trace_options=TracingOptions(recorded=False))
+            transaction.tail_sampling = True
+            self.tail_sampler.start(transaction)
         if trace_parent is None:
             transaction.trace_parent.add_tracestate(constants.TRACESTATE.SAMPLE_RATE, sample_rate)
         if auto_activate:
@@ -896,15 +1047,34 @@ class Tracer(object):
             if transaction.name is None:
                 transaction.name = str(transaction_name) if transaction_name is not None else ""
             transaction.end(duration=duration)
+            if transaction.tail_sampling:
+                self._finish_tail_sampling(transaction)
             if self._should_ignore(transaction.name):
                 return
             if not transaction.is_sampled and self._agent.check_server_version(gte=(8, 0)):
                 return
             if transaction.result is None:
                 transaction.result = result
-            self.queue_func(TRANSACTION, transaction.to_dict())
+            if transaction.config_deferred_serialization:
+                self.queue_func(TRANSACTION, transaction.to_dict)
+            else:
+                self.queue_func(TRANSACTION, transaction.to_dict())
         return transaction
 
+    def _finish_tail_sampling(self, transaction):
+        spans = self.tail_sampler.finish(transaction)
+        if spans is None:
+            # report the transaction like any other unsampled transaction
+            transaction.is_sampled = False
+            transaction._span_counter = 0
+            transaction.dropped_spans = 0
+            transaction._dropped_span_statistics.clear()
+            return
+        # the transaction keeps its sample rate of 0, which matches the tracestate. It doesn't represent any
+        # other transactions, as the unsampled population is already represented by the sampled transactions.
+        for span in spans:
+            self.queue_func(SPAN, span)
+
     def _should_ignore(self, transaction_name):
         for pattern in self._ignore_patterns:
             if pattern.search(transaction_name):
@@ -1139,13 +1309,48 @@ def get_span_id():
     return span.id
 
 
+class LazyContext(object):
+    """
+    Context data that is only computed when the transaction is serialized, which
+    happens on the transport thread if `deferred_serialization` is enabled, and
+    not at all if the transaction is dropped. Data that is set on the same key
+    in the meantime is applied on top of it. If the data can't be computed,
+    the key is left out, including the data set in the meantime.
+    """
+
+    __slots__ = ("loader", "updates")
+
+    def __init__(self, loader: Callable[[], dict]):
+        self.loader = loader
+        self.updates = {}
+
+    def update(self, data: dict):
+        self.updates.update(data)
+
+    def materialize(self) -> Optional[dict]:
+        """
+        :return: the context data, or None if it couldn't be computed
+        """
+        try:
+            data = self.loader()
+        except Exception:
+            logger.warning("Failed to capture context data", exc_info=True)
+            return None
+        data.update(self.updates)
+        return data
+
+    def __deepcopy__(self, memo):
+        # errors copy the context of the transaction, which needs the actual data
+        return self.materialize()
+
+
 def set_context(data, key="custom"):
     """
     Attach contextual data to the current transaction and errors that happen during the current transaction.
 
     If the transaction is not sampled, this function becomes a no-op.
 
-    :param data: a dictionary, or a callable that returns a dictionary
+    :param data: a dictionary, a callable that returns a dictionary, or a LazyContext
     :param key: the namespace for this data
     """
     transaction = execution_context.get_transaction()
@@ -1153,6 +1358,13 @@ def set_context(data, key="custom"):
         return
     if callable(data):
         data = data()
+    if isinstance(data, LazyContext):
+        if key not in transaction.context:
+            transaction.context[key] = data
+            return
+        data = data.materialize()
+        if data is None:
+            return
 
     # remove invalid characters from key names
     for k in list(data.keys()):
@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import asyncio
+import os
+import random
+import ssl
+import threading
+import timeit
+from collections import deque
+
+import aiohttp
+
+from elasticapm.transport.exceptions import TransportException
+from elasticapm.transport.http import Transport as HTTPTransport
+from elasticapm.utils.logging import get_logger
+from elasticapm.utils.threading import ThreadManager
+
+logger = get_logger("elasticapm.transport.asyncio")
+
+
+def _client_timeout(seconds):
+    # aiohttp.ClientTimeout was added in aiohttp 3.3, older versions take the total timeout in seconds
+    if hasattr(aiohttp, "ClientTimeout"):
+        return aiohttp.ClientTimeout(total=seconds)
+    return seconds
+
+
+def _get_running_loop():
+    # returns None if no event loop is running in the current thread
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class AsyncioTransport(HTTPTransport):
+    """
+    A transport that processes events and sends them to the APM Server on an asyncio event loop
+
+    The event processor runs as a task on the event loop of the thread that queues the first event,
+    e.g. the loop of an ASGI server. Events queued on that loop are handed to the task directly,
+    events queued in other threads are handed over with `call_soon_threadsafe`. If no event loop
+    is running when the first event is queued, a dedicated event loop is started in a background thread.
+
+    Requests to the APM Server are sent with aiohttp, which keeps connections alive between requests.
+    Fetching the server information and the central configuration, as well as replaying the spool,
+    is done with blocking requests, as these requests are rare.
+    """
+
+    max_queue_size = 10000
+    # number of events that are processed in the executor at once
+    batch_size = 100
+
+    def __init__(self, url, *args, queue_chill_count=500, queue_chill_time=1.0, **kwargs):
+        super(AsyncioTransport, self).__init__(
+            url, *args, queue_chill_count=queue_chill_count, queue_chill_time=queue_chill_time, **kwargs
+        )
+        self._chill_until = queue_chill_count
+        self._max_chill_time = queue_chill_time
+        self._start_lock = threading.Lock()
+        self._loop = None
+        self._loop_pid = None
+        self._loop_thread = None
+        self._pending = deque()
+        self._wakeup = None
+        self._last_wakeup = 0
+        self._buffer = None
+        self._session = None
+        self._send_semaphore = None
+        self._send_tasks = set()
+
+    def queue(self, event_type, data, flush=False):
+        self._flushed.clear()
+        chill = not (event_type == "close" or flush)
+        loop = self._get_loop()
+        if loop is _get_running_loop():
+            self._put((event_type, data, flush), chill)
+        else:
+            try:
+                loop.call_soon_threadsafe(self._put, (event_type, data, flush), chill)
+            except RuntimeError:  # the event loop has been closed in the meantime
+                logger.debug("Event of type %s dropped due to closed event loop", event_type)
+
+    def _put(self, item, chill=True):
+        if len(self._pending) >= self.max_queue_size:
+            logger.debug("Event of type %s dropped due to full event queue", item[0])
+            if self._load_shedder:
+                self._load_shedder.record_dropped_event()
+            return
+        self._pending.append(item)
+        if self._wakeup is not None and (
+            not chill
+            or len(self._pending) > self._chill_until
+            or timeit.default_timer() - self._last_wakeup > self._max_chill_time
+        ):
+            self._wakeup.set()
+            self._last_wakeup = timeit.default_timer()
+
+    def _get_loop(self):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            with self._start_lock:
+                loop = self._loop
+                if loop is None or loop.is_closed():
+                    loop = self._start(_get_running_loop())
+        return loop
+
+    def _start(self, loop):
+        """
+        Starts the event processor task on the given loop, or on a dedicated loop if `loop` is None
+        """
+        self._loop_thread = None
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(
+                target=self._run_loop, args=(loop,), name="eapm event processor thread"
+            )
+            self._loop_thread.daemon = True
+            self._loop_thread.start()
+        self._loop = loop
+        self._pending = deque()
+        self._wakeup = None
+        self._buffer = None
+        self._session = None
+        self._send_tasks = set()
+        if loop is _get_running_loop():
+            loop.create_task(self._process_queue_async())
+        else:
+            loop.call_soon_threadsafe(loop.create_task, self._process_queue_async())
+        return loop
+
+    def _run_loop(self, loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def _process_queue_async(self):
+        self._wakeup = asyncio.Event()
+        self._send_semaphore = asyncio.Semaphore(self._max_concurrent_requests)
+        loop = _get_running_loop()
+        try:
+            if self.client and not self.client.server_version:
+                await loop.run_in_executor(None, self.fetch_server_info)
+            # Rebuild the metadata to capture new process information
+            if self.client:
+                self._metadata = self.client.build_metadata()
+                self._metadata_bytes = None
+            max_flush_time = self._randomized_flush_time()
+            while True:
+                if not self._pending:
+                    since_last_flush = timeit.default_timer() - self._last_flush
+                    timeout = max(0, max_flush_time - since_last_flush) if max_flush_time else None
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                if self._load_shedder:
+                    self._load_shedder.update(len(self._pending), self.max_queue_size)
+                forced_flush = False
+                while self._pending:
+                    batch = []
+                    close = False
+                    while self._pending and len(batch) < self.batch_size:
+                        event_type, data, flush = self._pending.popleft()
+                        if event_type == "close":
+                            close = True
+                            break
+                        forced_flush = forced_flush or flush
+                        if data is not None:
+                            batch.append((event_type, data))
+                    if batch:
+                        # processors can read source files, and serializing and compressing the events
+                        # takes a while, so that is done in the executor to keep the event loop responsive
+                        await loop.run_in_executor(None, self._write_events, batch)
+                        queue_size = self._buffer.tell() if self._buffer is not None else 0
+                        if self._max_buffer_size and queue_size > self._max_buffer_size:
+                            logger.debug(
+                                "flushing since queue size %d bytes > max_queue_size %d bytes",
+                                queue_size,
+                                self._max_buffer_size,
+                            )
+                            await self._flush_async()
+                    if close:
+                        if self._buffer is not None:
+                            await self._flush_async()
+                        await self._wait_for_sends()
+                        if self._spool is not None:
+                            self._spool.close()
+                            self._spool = None
+                        return  # time to go home!
+                if forced_flush:
+                    logger.debug("forced flush")
+                elif not max_flush_time or timeit.default_timer() - self._last_flush < max_flush_time:
+                    continue
+                if self._buffer is not None:
+                    await self._flush_async(forced_flush=forced_flush)
+                if forced_flush:
+                    # a forced flush is only done once the data (and everything flushed before it) has been sent
+                    await self._wait_for_sends()
+                self._last_flush = timeit.default_timer()
+                max_flush_time = self._randomized_flush_time()
+                self._flushed.set()
+        except Exception:
+            logger.error("Exception in the event processor task of the asyncio transport", exc_info=True)
+        finally:
+            if self._session is not None:
+                await self._session.close()
+                self._session = None
+            self._flushed.set()
+            if self._loop_thread is not None and self._closed:
+                loop.stop()
+
+    def _randomized_flush_time(self):
+        # add some randomness to timeout to avoid stampedes of several workers that are booted at the same time
+        return self._max_flush_time_seconds * random.uniform(0.9, 1.1) if self._max_flush_time_seconds else None
+
+    def _write_events(self, events):
+        for event_type, data in events:
+            self._write_event(event_type, data)
+
+    def _write_event(self, event_type, data):
+        data = self._process_event(event_type, data)
+        if data is None:
+            return
+        if self._buffer is None:
+            self._buffer = self._init_buffer()
+            # Write metadata just in time to allow for late metadata changes (such as in lambda)
+            self._write_metadata(self._buffer)
+        self._buffer.write(self._json_serializer({event_type: data}) + b"\n")
+        self._counts[event_type] += 1
+
+    async def _flush_async(self, forced_flush=False):
+        buffer, self._buffer = self._buffer, None
+        data = self._close_buffer(buffer)
+        if data is None:
+            return
+        # waits if `api_request_concurrency` requests are in flight
+        await self._send_semaphore.acquire()
+        task = asyncio.ensure_future(self._send_async(data, forced_flush=forced_flush))
+        self._send_tasks.add(task)
+        task.add_done_callback(self._send_tasks.discard)
+
+    async def _wait_for_sends(self):
+        if self._send_tasks:
+            await asyncio.wait(list(self._send_tasks))
+
+    async def _send_async(self, data, forced_flush=False):
+        start = timeit.default_timer()
+        try:
+            await self.send_async(data, forced_flush=forced_flush)
+        except Exception as e:
+            # writes the data to the spool, if enabled
+            await _get_running_loop().run_in_executor(
+                None, self._handle_send_fail, data, e, timeit.default_timer() - start
+            )
+        else:
+            self._handle_send_success(timeit.default_timer() - start)
+            if self._spool is not None:
+                await _get_running_loop().run_in_executor(None, self._replay_spool)
+        finally:
+            self._send_semaphore.release()
+
+    async def send_async(self, data, forced_flush=False):
+        headers = {k.decode("ascii"): v.decode("ascii") for k, v in self._headers.items()}
+        headers.update(super(HTTPTransport, self).auth_headers)
+        url = self._url
+        if forced_flush:
+            url = f"{url}?flushed=true"
+        try:
+            async with self.session.post(
+                url, data=data, headers=headers, timeout=_client_timeout(self._timeout)
+            ) as response:
+                body = await response.read()
+                logger.debug("Sent request, url=%s size=%.2fkb status=%s", url, len(data) / 1024.0, response.status)
+        except asyncio.TimeoutError:
+            message = "Connection to APM Server timed out (url: %s, timeout: %s seconds)" % (self._url, self._timeout)
+            raise TransportException(message, data, print_trace=False)
+        except aiohttp.ClientError as e:
+            raise TransportException("Unable to reach APM Server: %s (url: %s)" % (e, self._url), data)
+        self._raise_for_status(response.status, body, data)
+        return response.headers.get("Location")
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self._max_concurrent_requests, ssl=self._ssl)
+            # trust_env enables the same proxy environment variables that are used by the blocking transport
+            self._session = aiohttp.ClientSession(connector=connector, trust_env=True)
+        return self._session
+
+    @property
+    def _ssl(self):
+        if not self._url.startswith("https"):
+            return None
+        if self._server_cert:
+            return aiohttp.Fingerprint(bytes.fromhex(self.cert_fingerprint))
+        if not self._verify_server_cert:
+            return False
+        return ssl.create_default_context(cafile=self.ca_certs)
+
+    def start_thread(self, pid=None):
+        # don't start the threads of the blocking transport, events are processed by a task on an event loop
+        ThreadManager.start_thread(self, pid=pid)
+        if self._loop_pid != self.pid and not self._closed:
+            self.handle_fork()
+            if self._spool is not None:
+                # the spool of the parent process is locked by the parent, open our own
+                self._spool.release()
+            self._spool = self._init_spool()
+            with self._start_lock:
+                self._loop = None
+                self._loop_pid = self.pid
+                loop = _get_running_loop()
+                if loop is not None:
+                    self._start(loop)
+
+    def close(self):
+        """
+        Flushes the queued events and stops the event processor task.
+
+        If called on the event loop of the transport, the flush is only triggered, as waiting for it would
+        block the loop. If the event loop isn't running anymore, the queued events are sent with a blocking request.
+        """
+        if self._closed or self._loop_pid != os.getpid():
+            return
+        self._closed = True
+        loop = self._loop
+        if loop is None:
+            return
+        if loop.is_closed() or not loop.is_running():
+            self._close_sync()
+            return
+        self.queue("close", None)
+        if loop is not _get_running_loop() and not self._flushed.wait(timeout=self._max_flush_time_seconds):
+            logger.error("Closing the transport connection timed out.")
+
+    stop_thread = close
+
+    def _close_sync(self):
+        while self._pending:
+            event_type, data, flush = self._pending.popleft()
+            if data is not None:
+                if self._metadata is None and self.client:
+                    self._metadata = self.client.build_metadata()
+                    self._metadata_bytes = None
+                self._write_event(event_type, data)
+        if self._buffer is not None:
+            buffer, self._buffer = self._buffer, None
+            data = self._close_buffer(buffer)
+            if data is not None:
+                self._send(data)
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        self._flushed.set()
+
+    def flush(self):
+        """
+        Trigger a flush of the queue.
+
+        If called on the event loop of the transport, this method returns immediately, as waiting for
+        the flush would block the loop.
+        """
+        if self._get_loop() is _get_running_loop():
+            self.queue(None, None, flush=True)
+        else:
+            super(AsyncioTransport, self).flush()
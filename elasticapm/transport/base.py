@@ -31,7 +31,6 @@
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import gzip
-import io
 import os
 import queue as _queue
 import random
@@ -39,8 +38,11 @@ import sys
 import threading
 import time
 import timeit
-from collections import defaultdict
+from collections import defaultdict, deque
 
+from elasticapm.transport.buffer import GZIP, EventBuffer, StreamingBody
+from elasticapm.transport.exceptions import TransportException
+from elasticapm.transport.spool import DiskSpool
 from elasticapm.utils import json_encoder
 from elasticapm.utils.logging import get_logger
 from elasticapm.utils.threading import ThreadManager
@@ -61,7 +63,8 @@ class Transport(ThreadManager):
         self,
         client,
         compress_level=5,
-        json_serializer=json_encoder.dumps,
+        compression=GZIP,
+        json_serializer=None,
         queue_chill_count=500,
         queue_chill_time=1.0,
         processors=None,
@@ -70,19 +73,34 @@ class Transport(ThreadManager):
         """
         Create a new Transport instance
 
-        :param compress_level: GZip compress level. If zero, no GZip compression will be used
-        :param json_serializer: serializer to use for JSON encoding
+        :param compress_level: GZip compress level, between 0 and 9
+        :param compression: compression of the request body, "gzip" or "none"
+        :param json_serializer: serializer to use for JSON encoding. Must return a string. If not set,
+                                the serializer configured with the `json_serializer` setting is used.
         :param kwargs:
         """
         self.client = client
         self.state = TransportState()
+        self._load_shedder = getattr(client, "load_shedder", None)
         self._metadata = None
+        self._metadata_bytes = None
         self._compress_level = min(9, max(0, compress_level if compress_level is not None else 0))
-        self._json_serializer = json_serializer
+        self._compression = compression
+        self._metrics = None
+        if json_serializer is not None:
+            self._json_serializer = lambda value: json_serializer(value).encode("utf-8")
+        else:
+            self._json_serializer = json_encoder.get_bytes_serializer(
+                client.config.json_serializer if client else "stdlib"
+            )
         self._queued_data = None
         self._event_queue = self._init_event_queue(chill_until=queue_chill_count, max_chill_time=queue_chill_time)
-        self._is_chilled_queue = isinstance(self._event_queue, ChilledQueue)
+        self._is_chilled_queue = isinstance(self._event_queue, (ChilledQueue, DequeQueue))
         self._thread = None
+        self._send_queue = None
+        self._send_threads = []
+        self._spool = None
+        self._spool_replay_lock = threading.Lock()
         self._last_flush = timeit.default_timer()
         self._counts = defaultdict(int)
         self._flushed = threading.Event()
@@ -99,6 +117,18 @@ class Transport(ThreadManager):
     def _max_buffer_size(self):
         return self.client.config.api_request_size if self.client else None
 
+    @property
+    def _event_queue_type(self):
+        return self.client.config.event_queue_type if self.client else "chilled"
+
+    @property
+    def _streaming(self):
+        return self.client.config.api_request_streaming if self.client else False
+
+    @property
+    def _max_concurrent_requests(self):
+        return max(1, self.client.config.api_request_concurrency or 1) if self.client else 1
+
     def queue(self, event_type, data, flush=False):
         try:
             self._flushed.clear()
@@ -107,14 +137,18 @@ class Transport(ThreadManager):
 
         except _queue.Full:
             logger.debug("Event of type %s dropped due to full event queue", event_type)
+            if self._load_shedder:
+                self._load_shedder.record_dropped_event()
 
     def _process_queue(self):
         # Rebuild the metadata to capture new process information
         if self.client:
             self._metadata = self.client.build_metadata()
+            self._metadata_bytes = None
 
         buffer = self._init_buffer()
         buffer_written = False
+        stream = None
         # add some randomness to timeout to avoid stampedes of several workers that are booted at the same time
         max_flush_time = (
             self._max_flush_time_seconds * random.uniform(0.9, 1.1) if self._max_flush_time_seconds else None
@@ -134,26 +168,41 @@ class Transport(ThreadManager):
             if event_type == "close":
                 if buffer_written:
                     try:
-                        self._flush(buffer)
+                        if stream is not None:
+                            self._flush_stream(buffer, stream)
+                        else:
+                            self._flush(buffer)
                     except Exception as exc:
                         logger.error(
                             "Exception occurred while flushing the buffer "
                             "before closing the transport connection: {0}".format(exc)
                         )
+                self._stop_send_threads()
+                if self._spool is not None:
+                    self._spool.close()
+                    self._spool = None
                 self._flushed.set()
                 return  # time to go home!
 
+            if self._load_shedder:
+                self._load_shedder.update(self._event_queue.qsize(), self._event_queue.maxsize)
+
             if data is not None:
                 data = self._process_event(event_type, data)
                 if data is not None:
                     if not buffer_written:
                         # Write metadata just in time to allow for late metadata changes (such as in lambda)
                         self._write_metadata(buffer)
-                    buffer.write((self._json_serializer({event_type: data}) + "\n").encode("utf-8"))
+                        stream = self._open_stream()
+                    buffer.write(self._json_serializer({event_type: data}) + b"\n")
                     buffer_written = True
                     self._counts[event_type] += 1
+                    if stream is not None:
+                        # once all queued events are processed, send the pending events right away, even if
+                        # it isn't worth compressing them as a chunk yet
+                        stream.write(buffer.drain(compress_pending=self._event_queue.empty()))
 
-            queue_size = 0 if buffer.fileobj is None else buffer.fileobj.tell()
+            queue_size = buffer.tell()
 
             forced_flush = flush
             if forced_flush:
@@ -174,7 +223,9 @@ class Transport(ThreadManager):
                 )
                 flush = True
             if flush:
-                if buffer_written:
+                if stream is not None:
+                    self._flush_stream(buffer, stream, forced_flush=forced_flush)
+                elif buffer_written:
                     self._flush(buffer, forced_flush=forced_flush)
                 elif forced_flush and "/localhost:" in self.client.config.server_url:
                     # No data on buffer, but due to manual flush we should send
@@ -184,12 +235,23 @@ class Transport(ThreadManager):
                 self._last_flush = timeit.default_timer()
                 buffer = self._init_buffer()
                 buffer_written = False
+                stream = None
                 max_flush_time = (
                     self._max_flush_time_seconds * random.uniform(0.9, 1.1) if self._max_flush_time_seconds else None
                 )
                 self._flushed.set()
 
     def _process_event(self, event_type, data):
+        if callable(data):
+            # serialization of spans and transactions is deferred to this thread if `deferred_serialization`
+            # is enabled, in which case their `to_dict` method is queued instead of the result
+            try:
+                data = data()
+            except Exception:
+                logger.warning(
+                    "Dropped event of type %s due to exception during serialization", event_type, exc_info=True
+                )
+                return None
         # Run the data through processors
         for processor in self._processors:
             if not hasattr(processor, "event_types") or event_type in processor.event_types:
@@ -215,12 +277,13 @@ class Transport(ThreadManager):
         return data
 
     def _init_buffer(self):
-        buffer = gzip.GzipFile(fileobj=io.BytesIO(), mode="w", compresslevel=self._compress_level)
-        return buffer
+        return EventBuffer(compression=self._compression, compress_level=self._compress_level)
 
     def _write_metadata(self, buffer):
-        data = (self._json_serializer({"metadata": self._metadata}) + "\n").encode("utf-8")
-        buffer.write(data)
+        # the metadata is written at the start of every request body, so it is only serialized once
+        if self._metadata_bytes is None:
+            self._metadata_bytes = self._json_serializer({"metadata": self._metadata}) + b"\n"
+        buffer.write(self._metadata_bytes)
 
     def add_metadata(self, data):
         """
@@ -240,8 +303,11 @@ class Transport(ThreadManager):
                     self._metadata[key] = val
         else:
             self._metadata = data
+        self._metadata_bytes = None
 
     def _init_event_queue(self, chill_until, max_chill_time):
+        if self._event_queue_type == "deque":
+            return DequeQueue(maxsize=10000, chill_until=chill_until, max_chill_time=max_chill_time)
         # some libraries like eventlet monkeypatch queue.Queue and switch out the implementation.
         # In those cases we can't rely on internals of queue.Queue to be there, so we simply use
         # their queue and forgo the optimizations of ChilledQueue. In the case of eventlet, this
@@ -263,25 +329,222 @@ class Transport(ThreadManager):
         Flush the queue. This method should only be called from the event processing queue
         :return: None
         """
+        data = self._close_buffer(buffer)
+        if data is None:
+            return
+        send_queue = self._send_queue
+        if send_queue is None:
+            self._send(data, forced_flush=forced_flush)
+            return
+        # blocks if all sender threads are busy and the send queue is full, which in turn lets
+        # the event queue fill up instead of buffering an unbounded amount of payloads in memory
+        send_queue.put((data, forced_flush))
+        if forced_flush:
+            # a forced flush is only done once the data (and everything queued before it) has been sent
+            send_queue.join()
+
+    def _open_stream(self):
+        """
+        Starts a streaming request to the APM Server if `api_request_streaming` is enabled
+
+        :return: a StreamingBody to write the compressed events to, or None if the events should be sent
+                 in a single request body when flushing
+        """
+        send_queue = self._send_queue
+        if not self._streaming or send_queue is None or not self.state.should_try():
+            return None
+        stream = StreamingBody()
+        send_queue.put((stream, False))
+        return stream
+
+    def _flush_stream(self, buffer, stream, forced_flush=False):
+        """
+        Writes the remaining data to the streaming request and closes it
+        """
+        data = buffer.close()
+        self._record_flush(buffer, data)
+        stream.write(buffer.drain())
+        stream.close(data)
+        send_queue = self._send_queue
+        if forced_flush and send_queue is not None:
+            send_queue.join()
+            # the URL of the streaming request was fixed when it was opened, so the forced flush is
+            # signalled with an additional empty request with the flushed=true query param once all
+            # data has been sent, e.g. for the AWS Lambda extension
+            try:
+                self.send(self._init_buffer().close(), forced_flush=True)
+            except Exception as e:
+                logger.error("Failed to signal forced flush to the APM Server: %s", e)
+
+    def _close_buffer(self, buffer):
+        """
+        Closes the buffer and returns its data, or None if the data should not be sent due to the
+        transport failure back-off.
+        """
         if not self.state.should_try():
-            logger.error("dropping flushed data due to transport failure back-off")
+            if self._spool is not None:
+                self._spool_data(buffer.close())
+            else:
+                logger.error("dropping flushed data due to transport failure back-off")
+            return None
+        data = buffer.close()
+        self._record_flush(buffer, data)
+        return data
+
+    def _record_flush(self, buffer, data):
+        metrics = self._get_metrics()
+        if metrics:
+            metrics.record_flush(buffer.uncompressed_size, len(data), buffer.compression_time)
+
+    def _get_metrics(self):
+        if self._metrics is None and self.client:
+            try:
+                self._metrics = self.client._metrics.get_metricset(
+                    "elasticapm.metrics.sets.transport.TransportMetricSet"
+                )
+            except (LookupError, AttributeError):
+                self._metrics = False
+        return self._metrics
+
+    def _send(self, data, forced_flush=False):
+        start = timeit.default_timer()
+        streaming = isinstance(data, StreamingBody)
+        try:
+            self.send(data, forced_flush=forced_flush)
+        except Exception as e:
+            if streaming:
+                # the payload is only complete once the event processor closes the stream
+                data = data.wait()
+            self._handle_send_fail(data, e, None if streaming else timeit.default_timer() - start)
         else:
-            fileobj = buffer.fileobj  # get a reference to the fileobj before closing the gzip file
-            buffer.close()
+            # streaming requests are open until the next flush, their duration says nothing about the APM Server
+            self._handle_send_success(None if streaming else timeit.default_timer() - start)
+            if self._spool is not None:
+                self._replay_spool()
+
+    def _handle_send_success(self, duration):
+        if self._load_shedder:
+            self._load_shedder.record_send(duration, success=True)
+        self.handle_transport_success()
+
+    def _handle_send_fail(self, data, exception, duration):
+        if self._load_shedder:
+            self._load_shedder.record_send(duration, success=False)
+        self.handle_transport_fail(exception)
+        if self._spool is not None and isinstance(exception, TransportException) and exception.retryable:
+            self._spool_data(data)
+
+    def _init_spool(self):
+        directory = self.client.config.spool_directory if self.client else None
+        if not directory:
+            return None
+        if not DiskSpool.is_supported():
+            logger.warning("The spool_directory setting is not supported on this platform, disabling the spool")
+            return None
+        try:
+            return DiskSpool(directory, self.client.config.spool_max_size)
+        except OSError as e:
+            logger.warning("Could not open spool directory %s, disabling the spool: %s", directory, e)
+            return None
+
+    def _spool_data(self, data):
+        try:
+            self._spool.append(data, encoding=self._compression)
+            logger.debug("spooled %d bytes due to transport failure", len(data))
+        except OSError as e:
+            logger.error("dropping flushed data, could not write it to the spool: %s", e)
 
-            # StringIO on Python 2 does not have getbuffer, so we need to fall back to getvalue
-            data = fileobj.getbuffer() if hasattr(fileobj, "getbuffer") else fileobj.getvalue()
+    def _replay_spool(self):
+        """
+        Sends the payloads in the spool in the order they were spooled. Stops at the first
+        payload that fails to send, it will be retried after the next successful request.
+        """
+        # only one sender thread replays the spool at a time
+        if not self._spool_replay_lock.acquire(False):
+            return
+        try:
+            while True:
+                spooled = self._spool.peek()
+                if spooled is None:
+                    return
+                data, encoding, token = spooled
+                try:
+                    self.send(self._encode_spooled(data, encoding))
+                except Exception as e:
+                    if isinstance(e, TransportException) and e.retryable:
+                        self.handle_transport_fail(e)
+                        return
+                    logger.error("dropping spooled data that was rejected by the APM Server: %s", e)
+                self._spool.consume(token)
+        except OSError as e:
+            logger.error("Could not read from the spool: %s", e)
+        finally:
+            self._spool_replay_lock.release()
+
+    def _encode_spooled(self, data, encoding):
+        """
+        Converts a spooled payload to the compression of this transport, which the Content-Encoding
+        header of its requests is based on. The payload may have been spooled with another
+        `api_request_compression`, e.g. by an earlier process whose spool was adopted.
+        """
+        if encoding == self._compression:
+            return data
+        if encoding == GZIP:
+            data = gzip.decompress(data)
+        if self._compression == GZIP:
+            data = gzip.compress(data, compresslevel=self._compress_level)
+        return data
+
+    def _process_send_queue(self, send_queue):
+        while True:
+            data, forced_flush = send_queue.get()
             try:
-                self.send(data, forced_flush=forced_flush)
-                self.handle_transport_success()
-            except Exception as e:
-                self.handle_transport_fail(e)
+                if data is None:
+                    return  # time to go home!
+                self._send(data, forced_flush=forced_flush)
+            finally:
+                send_queue.task_done()
+
+    def _start_send_threads(self):
+        """
+        Starts the sender threads, which send compressed payloads to the APM Server. This allows
+        the event processor thread to continue processing and compressing events while up to
+        `api_request_concurrency` requests are in flight.
+        """
+        concurrency = self._max_concurrent_requests
+        send_queue = _queue.Queue(maxsize=concurrency)
+        send_threads = []
+        for i in range(concurrency):
+            thread = threading.Thread(
+                target=self._process_send_queue, args=(send_queue,), name="eapm event sender thread %d" % i
+            )
+            thread.daemon = True
+            thread.start()
+            send_threads.append(thread)
+        self._send_queue = send_queue
+        self._send_threads = send_threads
+
+    def _stop_send_threads(self):
+        send_queue, send_threads = self._send_queue, self._send_threads
+        if send_queue is None:
+            return
+        for _ in send_threads:
+            send_queue.put((None, False))
+        for thread in send_threads:
+            thread.join()
+        self._send_queue = None
+        self._send_threads = []
 
     def start_thread(self, pid=None):
         super(Transport, self).start_thread(pid=pid)
         if (not self._thread or self.pid != self._thread.pid) and not self._closed:
             self.handle_fork()
+            if self._spool is not None:
+                # the spool of the parent process is locked by the parent, open our own
+                self._spool.release()
+            self._spool = self._init_spool()
             try:
+                self._start_send_threads()
                 self._thread = threading.Thread(target=self._process_queue, name="eapm event processor thread")
                 self._thread.daemon = True
                 self._thread.pid = self.pid
@@ -425,3 +688,69 @@ class ChilledQueue(_queue.Queue, object):
             ):
                 self.not_empty.notify()
                 self._last_unchill = time.time()
+
+
+class DequeQueue(object):
+    """
+    A queue based on collections.deque that doesn't acquire a lock when putting items into it
+
+    Appending to and popping from a deque are atomic operations, so many producer threads
+    can put events into the queue without contending for a lock. Similar to ChilledQueue,
+    the consumer is only woken up if more than `chill_until` items are in the queue, or
+    `max_chill_time` seconds have passed since the last wake-up.
+
+    Note: `maxsize` is enforced on a best-effort basis. Concurrent producers can overshoot it
+    by a few items. The queue never blocks producers, `block` and `timeout` are ignored in `put`.
+    """
+
+    def __init__(self, maxsize=0, chill_until=100, max_chill_time=1.0):
+        self.maxsize = maxsize
+        self._chill_until = chill_until
+        self._max_chill_time = max_chill_time
+        self._last_unchill = time.time()
+        self._deque = deque()
+        self._not_empty = threading.Event()
+
+    def put(self, item, block=True, timeout=None, chill=True):
+        if self.maxsize > 0 and len(self._deque) >= self.maxsize:
+            raise _queue.Full
+        self._deque.append(item)
+        if not chill or len(self._deque) > self._chill_until:
+            self._last_unchill = time.time()
+            self._not_empty.set()
+        else:
+            now = time.time()
+            if now - self._last_unchill > self._max_chill_time:
+                self._last_unchill = now
+                self._not_empty.set()
+
+    def get(self, block=True, timeout=None):
+        try:
+            return self._deque.popleft()
+        except IndexError:
+            if not block:
+                raise _queue.Empty
+        if timeout is not None and timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        endtime = None if timeout is None else time.time() + timeout
+        while True:
+            # clear the event before checking the deque again. Producers set the event *after*
+            # appending, so we can't miss a wake-up between the check and the wait.
+            self._not_empty.clear()
+            try:
+                return self._deque.popleft()
+            except IndexError:
+                pass
+            if endtime is None:
+                self._not_empty.wait()
+            else:
+                remaining = endtime - time.time()
+                if remaining <= 0.0:
+                    raise _queue.Empty
+                self._not_empty.wait(remaining)
+
+    def qsize(self):
+        return len(self._deque)
+
+    def empty(self):
+        return not self._deque
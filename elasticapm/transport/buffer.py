@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import io
+import queue
+import time
+import zlib
+
+# time.thread_time is only available in Python 3.7+
+_thread_time = getattr(time, "thread_time", time.process_time)
+
+GZIP = "gzip"
+NONE = "none"
+
+
+class EventBuffer(object):
+    """
+    Collects serialized events and compresses them in chunks
+
+    Events are accumulated in a bytearray, and only handed to the compressor
+    once `chunk_size` bytes are pending. Compared to compressing every single event,
+    this reduces the overhead per event considerably.
+    """
+
+    def __init__(self, compression=GZIP, compress_level=5, chunk_size=16 * 1024):
+        """
+        :param compression: "gzip" or "none"
+        :param compress_level: compression level, between 0 and 9
+        :param chunk_size: number of pending uncompressed bytes that triggers compression
+        """
+        self._pending = bytearray()
+        self._output = io.BytesIO()
+        self._chunk_size = chunk_size
+        if compression == GZIP:
+            # a window size of 16 + MAX_WBITS makes zlib write a gzip header and trailer
+            self._compressor = zlib.compressobj(compress_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        else:
+            self._compressor = None
+        self._closed = False
+        self._drained = 0
+        self.uncompressed_size = 0
+        self.compression_time = 0.0
+
+    def write(self, data):
+        self._pending += data
+        self.uncompressed_size += len(data)
+        if len(self._pending) >= self._chunk_size:
+            self._compress_pending()
+
+    def tell(self):
+        """
+        Returns the number of bytes that have been written to the output so far
+
+        Note that this excludes pending data that hasn't been compressed yet.
+        """
+        return self._output.tell()
+
+    def close(self):
+        """
+        Compresses any pending data and finishes the compressed stream
+
+        :return: a memoryview of the compressed data
+        """
+        if not self._closed:
+            self._compress_pending()
+            if self._compressor:
+                start = _thread_time()
+                self._output.write(self._compressor.flush())
+                self.compression_time += _thread_time() - start
+            self._closed = True
+        return self._output.getbuffer()
+
+    def drain(self, compress_pending=True):
+        """
+        Returns the compressed data that hasn't been drained yet. Used to stream the compressed data
+        while events are still being written.
+
+        :param compress_pending: compress pending data first, even if less than `chunk_size` bytes are pending
+        :return: a bytes object, empty if there is no new compressed data
+        """
+        if compress_pending and not self._closed:
+            self._compress_pending()
+        # copy the data, as the output can't be resized while a view of it exists
+        with self._output.getbuffer() as view:
+            data = bytes(view[self._drained :])
+        self._drained += len(data)
+        return data
+
+    def _compress_pending(self):
+        if not self._pending:
+            return
+        if self._compressor:
+            start = _thread_time()
+            self._output.write(self._compressor.compress(self._pending))
+            # a sync flush empties the compressor's internal buffer, so that `tell()` reflects all
+            # compressed data. It keeps the compression dictionary, so the effect on the ratio is negligible.
+            self._output.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+            self.compression_time += _thread_time() - start
+        else:
+            self._output.write(self._pending)
+        self._pending.clear()
+
+
+class StreamingBody(object):
+    """
+    A request body that is written to while the request is being sent
+
+    Iterating over the body yields the written chunks, blocking until the next chunk is written,
+    until the body is closed.
+    """
+
+    def __init__(self):
+        self._chunks = queue.Queue()
+        self.size = 0
+        self.data = None
+
+    def write(self, data):
+        if data:
+            self.size += len(data)
+            self._chunks.put(data)
+
+    def close(self, data):
+        """
+        Closes the body
+
+        :param data: the complete body, used if the request fails
+        """
+        self.data = data
+        self._chunks.put(None)
+
+    def wait(self):
+        """
+        Waits until the body is closed, discarding any chunks that haven't been sent
+
+        :return: the complete body
+        """
+        for _ in self:
+            pass
+        return self.data
+
+    def __iter__(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            yield chunk
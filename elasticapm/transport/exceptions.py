@@ -33,7 +33,8 @@
 
 
 class TransportException(Exception):
-    def __init__(self, message, data=None, print_trace=True):
+    def __init__(self, message, data=None, print_trace=True, retryable=True):
         super(TransportException, self).__init__(message)
         self.data = data
         self.print_trace = print_trace
+        self.retryable = retryable
@@ -40,6 +40,7 @@ from urllib.request import getproxies_environment, proxy_bypass_environment
 import urllib3
 from urllib3.exceptions import MaxRetryError, TimeoutError
 
+from elasticapm.transport.buffer import StreamingBody
 from elasticapm.transport.exceptions import TransportException
 from elasticapm.transport.http_base import HTTPTransportBase
 from elasticapm.utils import json_encoder, read_pem_file
@@ -79,12 +80,17 @@ class Transport(HTTPTransportBase):
         url = self._url
         if forced_flush:
             url = f"{url}?flushed=true"
+        kwargs = {}
+        if isinstance(data, StreamingBody):
+            # the body is sent while it is being written, so it can't be sent again on retries
+            kwargs = {"chunked": True, "retries": False}
         try:
             try:
                 response = self.http.urlopen(
-                    "POST", url, body=data, headers=headers, timeout=self._timeout, preload_content=False
+                    "POST", url, body=data, headers=headers, timeout=self._timeout, preload_content=False, **kwargs
                 )
-                logger.debug("Sent request, url=%s size=%.2fkb status=%s", url, len(data) / 1024.0, response.status)
+                size = data.size if kwargs else len(data)
+                logger.debug("Sent request, url=%s size=%.2fkb status=%s", url, size / 1024.0, response.status)
             except Exception as e:
                 print_trace = True
                 if isinstance(e, MaxRetryError) and isinstance(e.reason, TimeoutError):
@@ -97,30 +103,37 @@ class Transport(HTTPTransportBase):
                     message = "Unable to reach APM Server: %s (url: %s)" % (e, self._url)
                 raise TransportException(message, data, print_trace=print_trace)
             body = response.read()
-            if response.status >= 400:
-                if response.status == 429:  # rate-limited
-                    message = "Temporarily rate limited: "
-                    print_trace = False
-                else:
-                    message = "HTTP %s: " % response.status
-                    print_trace = True
-                message += body.decode("utf8", errors="replace")[:10000]
-                raise TransportException(message, data, print_trace=print_trace)
+            self._raise_for_status(response.status, body, data)
             return response.getheader("Location")
         finally:
             if response:
                 response.close()
 
+    def _raise_for_status(self, status, body, data):
+        if status >= 400:
+            if status == 429:  # rate-limited
+                message = "Temporarily rate limited: "
+                print_trace = False
+            else:
+                message = "HTTP %s: " % status
+                print_trace = True
+            message += body.decode("utf8", errors="replace")[:10000]
+            # client errors other than rate limiting will fail again if the data is resent
+            retryable = status == 429 or status >= 500
+            raise TransportException(message, data, print_trace=print_trace, retryable=retryable)
+
     @property
     def http(self) -> urllib3.PoolManager:
         if not self._http:
             url_parts = urllib.parse.urlparse(self._url)
             proxies = getproxies_environment()
             proxy_url = proxies.get("https", proxies.get("http", None))
+            # allow one pooled connection per sender thread, otherwise concurrent requests would block on the pool
+            pool_kwargs = dict(self._pool_kwargs, maxsize=self._max_concurrent_requests)
             if proxy_url and not proxy_bypass_environment(url_parts.netloc):
-                self._http = urllib3.ProxyManager(proxy_url, **self._pool_kwargs)
+                self._http = urllib3.ProxyManager(proxy_url, **pool_kwargs)
             else:
-                self._http = urllib3.PoolManager(**self._pool_kwargs)
+                self._http = urllib3.PoolManager(**pool_kwargs)
         return self._http
 
     def handle_fork(self) -> None:
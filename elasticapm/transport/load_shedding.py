@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import threading
+import timeit
+
+from elasticapm.utils.logging import get_logger
+
+logger = get_logger("elasticapm.transport.load_shedding")
+
+
+class LoadShedder(object):
+    """
+    Tracks how well the transport keeps up with the events produced by the app, and progressively
+    reduces the amount of work done by the agent if it doesn't.
+
+    The shed level is raised by one step per `interval` as long as the transport is under pressure,
+    i.e. the event queue is more than half full, events were dropped because the queue was full,
+    requests to the APM Server failed, or took longer than `max_send_time` on average.
+    It is lowered by one step once there was no pressure for `cooldown` seconds.
+
+    The levels are cumulative:
+
+     * 1: don't collect stack traces for spans
+     * 2: drop spans that aren't exit spans
+     * 3 and above: halve the effective transaction sample rate for every level
+    """
+
+    NONE = 0
+    SKIP_SPAN_FRAMES = 1
+    DROP_INTERNAL_SPANS = 2
+    REDUCE_SAMPLING = 3
+    MAX_LEVEL = 6
+
+    HIGH_WATERMARK = 0.5
+    LOW_WATERMARK = 0.25
+
+    def __init__(self, max_send_time, interval=1.0, cooldown=10.0):
+        self.level = self.NONE
+        self.max_send_time = max_send_time
+        self.interval = interval
+        self.cooldown = cooldown
+        # counters, these are read by the LoadSheddingMetricSet
+        self.dropped_events = 0
+        self.dropped_spans = 0
+        self.skipped_stack_traces = 0
+        self._lock = threading.Lock()
+        self._last_update = timeit.default_timer()
+        self._last_pressure = self._last_update
+        self._last_dropped_events = 0
+        self._send_count = 0
+        self._send_time = 0.0
+        self._send_failures = 0
+
+    @property
+    def collect_span_frames(self):
+        return self.level < self.SKIP_SPAN_FRAMES
+
+    @property
+    def drop_internal_spans(self):
+        return self.level >= self.DROP_INTERNAL_SPANS
+
+    def transaction_sample_rate(self, sample_rate):
+        """
+        Returns the sample rate to use instead of the configured `sample_rate` at the current shed level
+        """
+        if self.level < self.REDUCE_SAMPLING or not sample_rate:
+            return sample_rate
+        # sample rates are limited to a precision of 4 digits
+        return max(0.0001, round(sample_rate * 0.5 ** (self.level - self.REDUCE_SAMPLING + 1), 4))
+
+    def record_dropped_event(self):
+        self.dropped_events += 1
+
+    def record_send(self, duration, success):
+        """
+        :param duration: duration of the request in seconds, or None if it shouldn't be taken into account
+        :param success: whether the request was successful
+        """
+        with self._lock:
+            if duration is not None:
+                self._send_count += 1
+                self._send_time += duration
+            if not success:
+                self._send_failures += 1
+
+    def update(self, queue_size, max_queue_size):
+        """
+        Re-evaluates the shed level. This is cheap to call if less than `interval` seconds passed since the last
+        evaluation, so it can be called for every processed event.
+
+        :param queue_size: current number of events in the event queue
+        :param max_queue_size: maximum number of events in the event queue
+        :return: the shed level
+        """
+        now = timeit.default_timer()
+        if now - self._last_update < self.interval:
+            return self.level
+        with self._lock:
+            self._last_update = now
+            send_count, send_time, send_failures = self._send_count, self._send_time, self._send_failures
+            self._send_count, self._send_time, self._send_failures = 0, 0.0, 0
+        dropped_events = self.dropped_events - self._last_dropped_events
+        self._last_dropped_events = self.dropped_events
+        fill = float(queue_size) / max_queue_size if max_queue_size else 0.0
+        under_pressure = (
+            fill > self.HIGH_WATERMARK
+            or dropped_events > 0
+            or send_failures > 0
+            or bool(self.max_send_time and send_count and send_time / send_count > self.max_send_time)
+        )
+        level = self.level
+        if under_pressure:
+            self._last_pressure = now
+            level = min(self.MAX_LEVEL, level + 1)
+        elif fill < self.LOW_WATERMARK and level and now - self._last_pressure >= self.cooldown:
+            # restart the cooldown, so that the level is lowered one step at a time
+            self._last_pressure = now
+            level -= 1
+        if level != self.level:
+            logger.info(
+                "Changing load shedding level from %d to %d (event queue %d%% full)", self.level, level, fill * 100
+            )
+            self.level = level
+        return level
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import mmap
+import os
+import struct
+import threading
+
+from elasticapm.utils.logging import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = get_logger("elasticapm.transport.spool")
+
+# length of the payload and of its encoding, followed by the encoding and the payload
+_RECORD_HEADER = struct.Struct("!IB")
+_SEGMENT_SUFFIX = ".seg"
+_LOCK_FILE = "lock"
+_LOCK_ATTEMPTS = 10
+
+
+class DiskSpool(object):
+    """
+    An append-only, disk-backed spool for request bodies that couldn't be sent to the APM Server
+
+    Payloads are appended to segment files in a directory that is specific to the current
+    process. Segments are rolled once they exceed `segment_size`, and the oldest segments
+    are evicted if the total size of the spool exceeds `max_size`. Payloads are read back
+    in the order they were appended, using memory maps of the (immutable) older segments.
+
+    Each process holds a lock on its directory. Directories of processes that exited
+    without emptying their spool are adopted by the next process that opens the spool.
+
+    Delivery is at-least-once: if the process dies while replaying a segment, the
+    payloads of that segment are replayed again by the process that adopts it.
+
+    Each payload is stored with its encoding, as the encoding used by the process that
+    adopts the spool may differ.
+    """
+
+    def __init__(self, directory, max_size, segment_size=4 * 1024 * 1024):
+        self._base_directory = directory
+        self._directory = os.path.join(directory, str(os.getpid()))
+        self._max_size = max_size
+        self._segment_size = min(segment_size, max_size)
+        self._lock = threading.Lock()
+        self._lock_fd = None
+        self._segments = []  # ids of segments, oldest first
+        self._sizes = {}
+        self._write_file = None
+        self._read_map = None
+        self._read_offset = 0
+        self.dropped = 0
+        for _ in range(_LOCK_ATTEMPTS):
+            # another process may adopt and remove the directory until we hold the lock
+            os.makedirs(self._directory, exist_ok=True)
+            try:
+                self._lock_fd = _lock_file(os.path.join(self._directory, _LOCK_FILE))
+            except FileNotFoundError:
+                continue
+            if self._lock_fd is not None:
+                break
+        else:
+            raise OSError("Could not lock spool directory %s" % self._directory)
+        self._load_segments()
+        self._adopt_orphans()
+
+    @classmethod
+    def is_supported(cls):
+        return fcntl is not None
+
+    @property
+    def size(self):
+        return sum(self._sizes.values())
+
+    def __len__(self):
+        return len(self._segments)
+
+    def append(self, data, encoding=""):
+        """
+        Appends a payload to the spool, evicting the oldest segments if necessary
+
+        :param data: a bytes-like object
+        :param encoding: the encoding of the payload, e.g. "gzip"
+        """
+        encoding = encoding.encode("ascii")
+        with self._lock:
+            if self._write_file is None or self._sizes[self._segments[-1]] >= self._segment_size:
+                self._roll_segment()
+            segment_id = self._segments[-1]
+            self._write_file.write(_RECORD_HEADER.pack(len(data), len(encoding)) + encoding)
+            self._write_file.write(data)
+            self._write_file.flush()
+            self._sizes[segment_id] += _RECORD_HEADER.size + len(encoding) + len(data)
+            while self.size > self._max_size and len(self._segments) > 1:
+                self._evict_oldest()
+
+    def peek(self):
+        """
+        Returns the oldest payload in the spool without removing it, or None if the spool is empty
+
+        :return: a tuple of (payload, encoding, token), where token has to be passed to `consume()`
+        """
+        with self._lock:
+            while self._segments:
+                segment_id = self._segments[0]
+                if self._read_map is None:
+                    if self._write_file is not None and segment_id == self._segments[-1]:
+                        # never read from the segment we're writing to
+                        self._close_write_file()
+                    self._read_map = self._open_map(segment_id)
+                    self._read_offset = 0
+                record = self._read_record(self._read_map, self._read_offset)
+                if record is not None:
+                    payload, encoding, next_offset = record
+                    return payload, encoding, (segment_id, next_offset)
+                self._remove_segment(segment_id)
+            return None
+
+    def consume(self, token):
+        """
+        Removes the payload identified by the token returned by `peek()` from the spool
+        """
+        segment_id, next_offset = token
+        with self._lock:
+            if self._segments and self._segments[0] == segment_id and self._read_map is not None:
+                self._read_offset = next_offset
+                if self._read_record(self._read_map, next_offset) is None:
+                    self._remove_segment(segment_id)
+
+    def close(self):
+        """
+        Closes the spool. If it is empty, its directory is removed, otherwise it is kept so that the
+        spooled payloads can be adopted by another process.
+        """
+        with self._lock:
+            self._close_write_file()
+            self._close_read_map()
+            if not self._segments:
+                try:
+                    for name in os.listdir(self._directory):
+                        os.unlink(os.path.join(self._directory, name))
+                    os.rmdir(self._directory)
+                except OSError:
+                    pass
+            self._release_lock()
+
+    def release(self):
+        """
+        Releases all file handles without modifying the spool. Used in forked child processes,
+        as the spool belongs to the parent process.
+        """
+        with self._lock:
+            self._close_write_file()
+            self._close_read_map()
+            self._release_lock()
+
+    def _release_lock(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _read_record(self, mapped, offset):
+        """
+        :return: a tuple of (payload, encoding, offset of the next record), or None if there is no complete record
+        """
+        if mapped is None or offset + _RECORD_HEADER.size > len(mapped):
+            return None
+        length, encoding_length = _RECORD_HEADER.unpack_from(mapped, offset)
+        start = offset + _RECORD_HEADER.size + encoding_length
+        end = start + length
+        if end > len(mapped):
+            # truncated record, e.g. because the process died while writing it
+            return None
+        return mapped[start:end], mapped[start - encoding_length : start].decode("ascii"), end
+
+    def _segment_path(self, segment_id, directory=None):
+        return os.path.join(directory or self._directory, "%020d%s" % (segment_id, _SEGMENT_SUFFIX))
+
+    def _list_segments(self, directory):
+        return sorted(
+            int(name[: -len(_SEGMENT_SUFFIX)]) for name in os.listdir(directory) if name.endswith(_SEGMENT_SUFFIX)
+        )
+
+    def _load_segments(self):
+        for segment_id in self._list_segments(self._directory):
+            self._segments.append(segment_id)
+            self._sizes[segment_id] = os.path.getsize(self._segment_path(segment_id))
+
+    def _adopt_orphans(self):
+        for name in sorted(os.listdir(self._base_directory)):
+            directory = os.path.join(self._base_directory, name)
+            if directory == self._directory or not os.path.isdir(directory):
+                continue
+            lock_path = os.path.join(directory, _LOCK_FILE)
+            try:
+                lock_fd = _lock_file(lock_path)
+            except OSError:
+                continue  # directory is in use by a running process
+            if lock_fd is None:
+                continue  # directory was adopted by another process in the meantime
+            try:
+                for segment_id in self._list_segments(directory):
+                    new_id = self._segments[-1] + 1 if self._segments else 0
+                    os.rename(self._segment_path(segment_id, directory), self._segment_path(new_id))
+                    self._segments.append(new_id)
+                    self._sizes[new_id] = os.path.getsize(self._segment_path(new_id))
+                    logger.debug("Adopted spool segment %s from %s", segment_id, directory)
+                os.unlink(lock_path)
+                os.rmdir(directory)
+            except OSError as e:
+                logger.warning("Could not adopt spool directory %s: %s", directory, e)
+            finally:
+                os.close(lock_fd)
+        while self.size > self._max_size and self._segments:
+            self._evict_oldest()
+
+    def _roll_segment(self):
+        self._close_write_file()
+        segment_id = self._segments[-1] + 1 if self._segments else 0
+        self._segments.append(segment_id)
+        self._sizes[segment_id] = 0
+        self._write_file = open(self._segment_path(segment_id), "ab")
+
+    def _close_write_file(self):
+        if self._write_file is not None:
+            self._write_file.close()
+            self._write_file = None
+
+    def _open_map(self, segment_id):
+        with open(self._segment_path(segment_id), "rb") as f:
+            try:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                return None
+
+    def _close_read_map(self):
+        if self._read_map is not None:
+            self._read_map.close()
+            self._read_map = None
+        self._read_offset = 0
+
+    def _remove_segment(self, segment_id):
+        if self._segments[0] == segment_id:
+            self._close_read_map()
+        if self._write_file is not None and segment_id == self._segments[-1]:
+            self._close_write_file()
+        self._segments.remove(segment_id)
+        self._sizes.pop(segment_id, None)
+        try:
+            os.unlink(self._segment_path(segment_id))
+        except OSError:
+            pass
+
+    def _evict_oldest(self):
+        segment_id = self._segments[0]
+        if self._read_map is not None:
+            records = self._count_records(self._read_map, self._read_offset)
+        else:
+            mapped = self._open_map(segment_id)
+            records = self._count_records(mapped, 0)
+            if mapped is not None:
+                mapped.close()
+        self.dropped += records
+        logger.warning("Spool size limit reached, dropping %d spooled payloads", records)
+        self._remove_segment(segment_id)
+
+    def _count_records(self, mapped, offset):
+        count = 0
+        while True:
+            record = self._read_record(mapped, offset)
+            if record is None:
+                return count
+            count += 1
+            offset = record[2]
+
+
+def _lock_file(path):
+    """
+    Opens and exclusively locks the file at the given path
+
+    :return: the file descriptor, or None if the file was removed or replaced before the lock was acquired,
+             in which case the lock is worthless
+    :raises OSError: if the file is locked by another process
+    """
+    fd = os.open(path, os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = None
+        fd_stat = os.fstat(fd)
+    except OSError:
+        os.close(fd)
+        raise
+    if stat is None or not os.path.samestat(stat, fd_stat):
+        os.close(fd)
+        return None
+    return fd
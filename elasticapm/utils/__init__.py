@@ -95,6 +95,15 @@ def build_name_with_http_method_prefix(name, request):
     return " ".join((request.method, name)) if name else name
 
 
+def get_request_fields(config, event_type: str) -> list:
+    """
+    Returns the fields of the request context that are captured for events of the given type
+    """
+    if event_type == constants.ERROR:
+        return config.error_request_fields
+    return config.transaction_request_fields
+
+
 def is_master_process() -> bool:
     # currently only recognizes uwsgi master process
     try:
@@ -28,6 +28,7 @@
 #  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import copy
 import os
 import re
 
@@ -43,6 +44,8 @@ container_id_regexp = re.compile(
     "^(?:[0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4,})$", re.IGNORECASE
 )
 
+_container_metadata = None
+
 
 def get_cgroup_container_metadata():
     """
@@ -55,12 +58,19 @@ def get_cgroup_container_metadata():
             "pod": {"uid": "90d81341_92de_11e7_8cf2_507b9d4141fa"}
         }
 
+    The file is only read on the first call, as the cgroup of a process doesn't change.
+
     :return: a dictionary with the detected ids or {}
     """
-    if not os.path.exists(CGROUP_PATH):
-        return {}
-    with open(CGROUP_PATH) as f:
-        return parse_cgroups(f) or {}
+    global _container_metadata
+    if _container_metadata is None:
+        if not os.path.exists(CGROUP_PATH):
+            _container_metadata = {}
+        else:
+            with open(CGROUP_PATH) as f:
+                _container_metadata = parse_cgroups(f) or {}
+    # callers modify the returned dictionary, don't hand out the cached one
+    return copy.deepcopy(_container_metadata)
 
 
 def parse_cgroups(filehandle):
@@ -30,6 +30,7 @@
 
 import ctypes
 import itertools
+import os
 import re
 
 from elasticapm.conf import constants
@@ -37,6 +38,48 @@ from elasticapm.utils.logging import get_logger
 
 logger = get_logger("elasticapm.utils")
 
+# IDs are cut from a block of random bytes that is hex-encoded in one go, which
+# is considerably cheaper than formatting a random integer for every single ID.
+# Popping from / extending a list is atomic, so the pools can be shared between
+# threads without a lock.
+_ID_BLOCK_SIZE = 1024
+_SPAN_ID_SLICES = tuple(slice(i, i + 16) for i in range(0, _ID_BLOCK_SIZE * 2, 16))
+_TRACE_ID_SLICES = tuple(slice(i, i + 32) for i in range(0, _ID_BLOCK_SIZE * 2, 32))
+_span_ids = []
+_trace_ids = []
+
+
+def generate_span_id() -> str:
+    """
+    Returns a random 64 bit ID, hex-encoded, as used for transaction and span IDs
+    """
+    while True:
+        try:
+            return _span_ids.pop()
+        except IndexError:
+            _span_ids.extend(map(os.urandom(_ID_BLOCK_SIZE).hex().__getitem__, _SPAN_ID_SLICES))
+
+
+def generate_trace_id() -> str:
+    """
+    Returns a random 128 bit ID, hex-encoded, as used for trace and error IDs
+    """
+    while True:
+        try:
+            return _trace_ids.pop()
+        except IndexError:
+            _trace_ids.extend(map(os.urandom(_ID_BLOCK_SIZE).hex().__getitem__, _TRACE_ID_SLICES))
+
+
+def _clear_id_pools():
+    # a forked child must not hand out the IDs its parent already has in store
+    del _span_ids[:]
+    del _trace_ids[:]
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_clear_id_pools)
+
 
 class TraceParent(object):
     __slots__ = ("version", "trace_id", "span_id", "trace_options", "tracestate", "tracestate_dict", "is_legacy")
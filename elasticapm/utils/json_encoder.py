@@ -38,6 +38,16 @@ try:
 except ImportError:
     import simplejson as json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
 
 class BetterJSONEncoder(json.JSONEncoder):
     ENCODERS = {
@@ -58,13 +68,87 @@ class BetterJSONEncoder(json.JSONEncoder):
             return str(obj)
 
 
+# JSONEncoder instances don't hold any state between calls, so we can reuse a single instance
+_encoder = BetterJSONEncoder()
+
+
 def better_decoder(data):
     return data
 
 
 def dumps(value, **kwargs):
-    return json.dumps(value, cls=BetterJSONEncoder, **kwargs)
+    if kwargs:
+        return json.dumps(value, cls=BetterJSONEncoder, **kwargs)
+    return _encoder.encode(value)
 
 
 def loads(value, **kwargs):
     return json.loads(value, object_hook=better_decoder)
+
+
+def _default(obj):
+    """Equivalent of BetterJSONEncoder.default for third party serializers"""
+    encoder = BetterJSONEncoder.ENCODERS.get(type(obj))
+    if encoder:
+        return encoder(obj)
+    return str(obj)
+
+
+def dumps_bytes(value):
+    """Serializes value to UTF-8 encoded JSON, using the standard library"""
+    return _encoder.encode(value).encode("utf-8")
+
+
+def dumps_bytes_orjson(value):
+    """
+    Serializes value to UTF-8 encoded JSON, using orjson.
+
+    Note that orjson serializes some types natively, e.g. UUIDs are serialized
+    with dashes, and NaN/Infinity as null. Values that orjson can't serialize (e.g.
+    integers that exceed 64 bit, or strings with lone surrogates), are serialized
+    with the standard library instead.
+    """
+    try:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        return dumps_bytes(value)
+
+
+def dumps_bytes_ujson(value):
+    """
+    Serializes value to UTF-8 encoded JSON, using ujson.
+
+    Values that ujson can't serialize (e.g. bytes that aren't valid UTF-8) are
+    serialized with the standard library instead.
+    """
+    try:
+        return ujson.dumps(value, default=_default, ensure_ascii=False, escape_forward_slashes=False).encode("utf-8")
+    except (TypeError, ValueError, OverflowError):
+        return dumps_bytes(value)
+
+
+BYTES_SERIALIZERS = {
+    "stdlib": (dumps_bytes, True),
+    "orjson": (dumps_bytes_orjson, orjson is not None),
+    "ujson": (dumps_bytes_ujson, ujson is not None),
+}
+
+
+def get_bytes_serializer(name="stdlib"):
+    """
+    Returns a function that serializes a value to UTF-8 encoded JSON
+
+    :param name: one of "stdlib", "auto", "orjson" or "ujson". With "auto", the fastest installed
+                 serializer is used. If the requested serializer isn't installed, this falls back
+                 to the standard library. Only "stdlib" is guaranteed to produce the output of
+                 `BetterJSONEncoder` for all values.
+    :return: a callable that takes a single value and returns bytes
+    """
+    if name == "auto":
+        for candidate in ("orjson", "ujson"):
+            serializer, available = BYTES_SERIALIZERS[candidate]
+            if available:
+                return serializer
+        return dumps_bytes
+    serializer, available = BYTES_SERIALIZERS.get(name, (dumps_bytes, True))
+    return serializer if available else dumps_bytes
@@ -30,11 +30,14 @@
 
 
 import fnmatch
+import functools
 import inspect
-import itertools
 import os
 import re
 import sys
+import threading
+import time
+from collections import OrderedDict
 from functools import lru_cache
 
 from elasticapm.utils.encoding import transform
@@ -42,66 +45,150 @@ from elasticapm.utils.encoding import transform
 _coding_re = re.compile(r"coding[:=]\s*([-\w.]+)")
 
 
-@lru_cache(512)
-def get_lines_from_file(filename, lineno, context_lines, loader=None, module_name=None):
+# Source files, see get_source_file
+_source_cache = OrderedDict()
+_source_cache_bytes = 0
+_source_cache_lock = threading.Lock()
+_SOURCE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+_SOURCE_CACHE_CHECK_INTERVAL = 1.0
+
+_newline_re = re.compile(r"\r\n|\r|\n")
+
+
+class SourceFile(object):
     """
-    Returns context_lines before and after lineno from file.
-    Returns (pre_context_lineno, pre_context, context_line, post_context).
+    The lines of a source file, as cached by get_source_file.
     """
-    lineno = lineno - 1
-    lower_bound = max(0, lineno - context_lines)
-    upper_bound = lineno + context_lines
 
-    source = None
-    if loader is not None and hasattr(loader, "get_source"):
-        result = get_source_lines_from_loader(loader, module_name, lineno, lower_bound, upper_bound)
-        if result is not None:
-            return result
+    __slots__ = ("lines", "mtime", "size", "checked_at")
 
-    if source is None:
-        try:
-            with open(filename, "rb") as file_obj:
-                encoding = "utf8"
-                # try to find encoding of source file by "coding" header
-                # if none is found, utf8 is used as a fallback
-                for line in itertools.islice(file_obj, 0, 2):
-                    match = _coding_re.search(line.decode("utf8"))
-                    if match:
-                        encoding = match.group(1)
-                        break
-                file_obj.seek(0)
-                lines = [
-                    str(line, encoding, "replace") for line in itertools.islice(file_obj, lower_bound, upper_bound + 1)
-                ]
-                offset = lineno - lower_bound
-                return (
-                    [line.strip("\r\n") for line in lines[0:offset]],
-                    lines[offset].strip("\r\n"),
-                    [line.strip("\r\n") for line in lines[offset + 1 :]] if len(lines) > offset else [],
-                )
-        except (OSError, IOError, IndexError):
-            pass
-    return None, None, None
+    def __init__(self, lines, mtime, checked_at):
+        self.lines = lines
+        self.mtime = mtime
+        self.size = sum(len(line) + 1 for line in lines) if lines else 0
+        self.checked_at = checked_at
+
+    def get_context_lines(self, lineno, context_lines):
+        """
+        Returns context_lines before and after lineno.
+        Returns (pre_context, context_line, post_context).
+        """
+        return get_context_lines(self.lines, lineno, context_lines)
 
 
-def get_source_lines_from_loader(loader, module_name, lineno, lower_bound, upper_bound):
+def get_source_file(filename, loader=None, module_name=None):
+    """
+    Returns a SourceFile with the lines of the given file. Its lines are None if the source isn't available.
+
+    If the module has a loader that can provide the source, it is used. Otherwise, the file is read.
+    Sources are cached up to a total of _SOURCE_CACHE_MAX_BYTES, and are read again if the
+    modification time of the file has changed. The modification time is checked at most once
+    every _SOURCE_CACHE_CHECK_INTERVAL seconds.
+    """
+    key = (filename, module_name)
+    now = time.monotonic()
+    with _source_cache_lock:
+        cached = _source_cache.get(key)
+        if cached is not None and now - cached.checked_at < _SOURCE_CACHE_CHECK_INTERVAL:
+            _source_cache.move_to_end(key)
+            return cached
     try:
-        source = loader.get_source(module_name)
-    except ImportError:
-        # ImportError: Loader for module cProfile cannot handle module __main__
+        mtime = os.stat(filename).st_mtime
+    except (OSError, TypeError, ValueError):
+        mtime = None
+    with _source_cache_lock:
+        cached = _source_cache.get(key)
+        if cached is not None and cached.mtime == mtime:
+            cached.checked_at = now
+            _source_cache.move_to_end(key)
+            return cached
+
+    source_file = SourceFile(_read_source_lines(filename, loader, module_name), mtime, now)
+
+    global _source_cache_bytes
+    with _source_cache_lock:
+        if key in _source_cache:
+            _source_cache_bytes -= _source_cache.pop(key).size
+        if source_file.size <= _SOURCE_CACHE_MAX_BYTES:
+            _source_cache[key] = source_file
+            _source_cache_bytes += source_file.size
+            while _source_cache_bytes > _SOURCE_CACHE_MAX_BYTES:
+                _source_cache_bytes -= _source_cache.popitem(last=False)[1].size
+    return source_file
+
+
+def get_source_lines(filename, loader=None, module_name=None):
+    """
+    Returns the lines of a source file as a list of strings, or None if the source isn't available.
+    """
+    return get_source_file(filename, loader, module_name).lines
+
+
+def clear_source_cache():
+    global _source_cache_bytes
+    with _source_cache_lock:
+        _source_cache.clear()
+        _source_cache_bytes = 0
+
+
+def _read_source_lines(filename, loader, module_name):
+    if loader is not None and hasattr(loader, "get_source"):
+        try:
+            source = loader.get_source(module_name)
+        except ImportError:
+            # ImportError: Loader for module cProfile cannot handle module __main__
+            pass
+        else:
+            return _split_lines(source) if source is not None else None
+    try:
+        with open(filename, "rb") as file_obj:
+            source = file_obj.read()
+    except (OSError, IOError, TypeError, ValueError):
         return None
-    if source is not None:
-        source = source.splitlines()
-    else:
-        return None, None, None
+    encoding = "utf8"
+    # try to find encoding of source file by "coding" header
+    # if none is found, utf8 is used as a fallback
+    for line in source.split(b"\n", 2)[:2]:
+        match = _coding_re.search(line.decode("utf8", "replace"))
+        if match:
+            encoding = match.group(1)
+            break
     try:
-        pre_context = [line.strip("\r\n") for line in source[lower_bound:lineno]]
-        context_line = source[lineno].strip("\r\n")
-        post_context = [line.strip("\r\n") for line in source[(lineno + 1) : upper_bound + 1]]
-    except IndexError:
+        source = str(source, encoding, "replace")
+    except LookupError:
+        # unknown encoding
+        source = str(source, "utf8", "replace")
+    return _split_lines(source)
+
+
+def _split_lines(source):
+    # like str.splitlines, but only splitting on line boundaries that Python counts for line numbers
+    lines = _newline_re.split(source)
+    if lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+def get_context_lines(source_lines, lineno, context_lines):
+    """
+    Returns context_lines before and after lineno from the given source lines.
+    Returns (pre_context, context_line, post_context).
+    """
+    lineno = lineno - 1
+    if not source_lines or not 0 <= lineno < len(source_lines):
         # the file may have changed since it was loaded into memory
         return None, None, None
-    return pre_context, context_line, post_context
+    lower_bound = max(0, lineno - context_lines)
+    upper_bound = lineno + context_lines
+    return source_lines[lower_bound:lineno], source_lines[lineno], source_lines[lineno + 1 : upper_bound + 1]
+
+
+def get_lines_from_file(filename, lineno, context_lines, loader=None, module_name=None):
+    """
+    Returns context_lines before and after lineno from file.
+    Returns (pre_context, context_line, post_context).
+    """
+    return get_source_file(filename, loader, module_name).get_context_lines(lineno, context_lines)
 
 
 def get_culprit(frames, include_paths=None, exclude_paths=None):
@@ -180,7 +267,45 @@ def iter_traceback_frames(tb, config=None):
         yield frame
 
 
-def iter_stack_frames(frames=None, start_frame=None, skip=0, skip_top_modules=(), config=None):
+class FrameSnapshot(object):
+    """
+    The parts of a frame that are needed to get the frame info if no local
+    variables are collected. Unlike the frame, it doesn't keep the local
+    variables and the rest of the stack alive, so it can be kept around
+    until the frame info is needed.
+    """
+
+    __slots__ = ("f_code", "f_globals")
+
+    f_locals = {}
+
+    def __init__(self, frame):
+        self.f_code = frame.f_code
+        self.f_globals = frame.f_globals
+
+
+def _is_hidden_frame(frame):
+    """
+    Checks for the ``__traceback_hide__`` local variable. Accessing ``f_locals``
+    of a function frame creates a dictionary of all its locals, so we first
+    check if the code of the frame uses that name at all.
+    """
+    try:
+        f_code = frame.f_code
+        if not any(
+            "__traceback_hide__" in names
+            for names in (f_code.co_varnames, f_code.co_names, f_code.co_cellvars, f_code.co_freevars)
+        ):
+            return False
+    except (AttributeError, TypeError):
+        pass
+    f_locals = getattr(frame, "f_locals", {})
+    return bool(_getitem_from_frame(f_locals, "__traceback_hide__"))
+
+
+def iter_stack_frames(
+    frames=None, start_frame=None, skip=0, skip_top_modules=(), config=None, snapshot=False, start_lineno=None
+):
     """
     Given an optional list of frames (defaults to current stack),
     iterates over all frames that do not contain the ``__traceback_hide__``
@@ -199,6 +324,8 @@ def iter_stack_frames(frames=None, start_frame=None, skip=0, skip_top_modules=()
     :param skip: number of frames to skip from the beginning
     :param skip_top_modules: tuple of strings
     :param config: agent configuration
+    :param snapshot: if True, yields FrameSnapshot objects instead of frames
+    :param start_lineno: line number to use for start_frame instead of its current line number
 
     """
     if not frames:
@@ -216,35 +343,69 @@ def iter_stack_frames(frames=None, start_frame=None, skip=0, skip_top_modules=()
         if not stop_ignoring and f_globals.get("__name__", "").startswith(skip_top_modules):
             continue
         stop_ignoring = True
-        f_locals = getattr(frame, "f_locals", {})
-        if not _getitem_from_frame(f_locals, "__traceback_hide__"):
+        if not _is_hidden_frame(frame):
             frames_count += 1
-            yield frame, frame.f_lineno
+            lineno = start_lineno if start_lineno is not None and frame is start_frame else frame.f_lineno
+            yield (FrameSnapshot(frame) if snapshot else frame), lineno
 
 
-def get_frame_info(
-    frame,
-    lineno,
-    with_locals=True,
-    library_frame_context_lines=None,
-    in_app_frame_context_lines=None,
-    include_paths_re=None,
-    exclude_paths_re=None,
-    locals_processor_func=None,
-):
-    # Support hidden frames
-    f_locals = getattr(frame, "f_locals", {})
-    if _getitem_from_frame(f_locals, "__traceback_hide__"):
+def capture_stack(start_frame, skip_top_modules=(), config=None, snapshot=False):
+    """
+    Cheaply captures the current stack, e.g. when a span starts.
+
+    Only the first frame that isn't in one of `skip_top_modules` and its current
+    line number are looked up. Walking the rest of the stack is deferred until the
+    returned function is called, e.g. once the span turns out to be slow enough
+    to need a stack trace. The function returns the frames like `iter_stack_frames`
+    does, and should be called while the captured frames are still executing,
+    as their line numbers (apart from the first one) are only looked up then.
+
+    :param start_frame: a Frame object
+    :param skip_top_modules: tuple of strings
+    :param config: agent configuration
+    :param snapshot: if True, the function returns FrameSnapshot objects instead of frames
+    :return: a function returning a list of (frame, lineno) tuples, or None
+    """
+    frame = start_frame
+    while frame is not None and frame.f_globals.get("__name__", "").startswith(skip_top_modules):
+        frame = frame.f_back
+    if frame is None:
         return None
+    return functools.partial(_walk_captured_stack, frame, frame.f_lineno, config, snapshot)
+
+
+def _walk_captured_stack(frame, lineno, config, snapshot):
+    return list(iter_stack_frames(start_frame=frame, config=config, snapshot=snapshot, start_lineno=lineno))
+
+
+# Static part of the frame info, see _get_static_frame_info
+_static_frame_info_cache = {}
+_STATIC_FRAME_INFO_CACHE_SIZE = 4096
+
+
+def _get_static_frame_info(frame, include_paths_re, exclude_paths_re):
+    """
+    Returns the parts of the frame info that only depend on the code object of the frame,
+    and the loader of its module.
+
+    The result is cached per code object. The cache is keyed on the id of the code object, as
+    code objects compare equal if they only differ in their file name, and the code object is
+    stored along with the result to make sure the id hasn't been reused. Code objects of reloaded
+    modules are new objects, so their frame info is computed again.
+    """
+    f_code = getattr(frame, "f_code", None)
+    key = (id(f_code), include_paths_re, exclude_paths_re)
+    cached = _static_frame_info_cache.get(key)
+    if cached is not None and cached[0] is f_code:
+        return cached[1], cached[2]
 
     f_globals = getattr(frame, "f_globals", {})
     loader = f_globals.get("__loader__")
     module_name = f_globals.get("__name__")
 
-    f_code = getattr(frame, "f_code", None)
     if f_code:
-        abs_path = frame.f_code.co_filename
-        function = frame.f_code.co_name
+        abs_path = f_code.co_filename
+        function = f_code.co_name
     else:
         abs_path = None
         function = None
@@ -260,22 +421,51 @@ def get_frame_info(
     if not filename:
         filename = abs_path
 
-    frame_result = {
+    info = {
         "abs_path": abs_path,
         "filename": filename,
         "module": module_name,
         "function": function,
-        "lineno": lineno,
         "library_frame": is_library_frame(abs_path, include_paths_re, exclude_paths_re),
     }
+    if f_code is not None:
+        if len(_static_frame_info_cache) >= _STATIC_FRAME_INFO_CACHE_SIZE:
+            try:
+                del _static_frame_info_cache[next(iter(_static_frame_info_cache))]
+            except (KeyError, RuntimeError, StopIteration):
+                # modified by another thread
+                pass
+        _static_frame_info_cache[key] = (f_code, info, loader)
+    return info, loader
+
+
+def get_frame_info(
+    frame,
+    lineno,
+    with_locals=True,
+    library_frame_context_lines=None,
+    in_app_frame_context_lines=None,
+    include_paths_re=None,
+    exclude_paths_re=None,
+    locals_processor_func=None,
+):
+    # Support hidden frames
+    if _is_hidden_frame(frame):
+        return None
+
+    static_info, loader = _get_static_frame_info(frame, include_paths_re, exclude_paths_re)
+    frame_result = dict(static_info)
+    frame_result["lineno"] = lineno
+    abs_path = frame_result["abs_path"]
 
     context_lines = library_frame_context_lines if frame_result["library_frame"] else in_app_frame_context_lines
     if context_lines and lineno is not None and abs_path:
         # context_metadata will be processed by elasticapm.processors.add_context_lines_to_frames.
         # This ensures that blocking operations (reading from source files) happens on the background
         # processing thread.
-        frame_result["context_metadata"] = (abs_path, lineno, int(context_lines / 2), loader, module_name)
+        frame_result["context_metadata"] = (abs_path, lineno, int(context_lines / 2), loader, frame_result["module"])
     if with_locals:
+        f_locals = getattr(frame, "f_locals", {})
         if f_locals is not None and not isinstance(f_locals, dict):
             # XXX: Genshi (and maybe others) have broken implementations of
             # f_locals that are not actually dictionaries
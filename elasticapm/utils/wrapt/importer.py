@@ -11,6 +11,7 @@ PY3 = sys.version_info[0] == 3
 
 if PY3:
     import importlib
+    import importlib.util
     string_types = str,
 else:
     string_types = basestring,
@@ -153,12 +154,55 @@ class _ImportHookChainedLoader:
     def __init__(self, loader):
         self.loader = loader
 
-    def load_module(self, fullname):
+        if hasattr(loader, "load_module"):
+            self.load_module = self._load_module
+        if hasattr(loader, "create_module"):
+            self.create_module = self._create_module
+        if hasattr(loader, "exec_module"):
+            self.exec_module = self._exec_module
+
+    def _set_loader(self, module):
+        # Set module's loader to self.loader unless it's already set to
+        # something else. Import machinery will set it to spec.loader if it
+        # is None, so handle None as well. The module may not support
+        # attribute assignment, in which case we simply skip it. Note that
+        # we also deal with __loader__ not existing at all. This is to future
+        # proof things due to proposal to remove the attribue as described
+        # in the GitHub issue at https://github.com/python/cpython/issues/77458.
+        # Also prior to Python 3.3, the __loader__ attribute was only set if
+        # a custom module loader was used. It isn't clear whether the attribute
+        # still existed in that case or was set to None.
+
+        class UNDEFINED: pass
+
+        if getattr(module, "__loader__", UNDEFINED) in (None, self):
+            try:
+                module.__loader__ = self.loader
+            except AttributeError:
+                pass
+
+        if (getattr(module, "__spec__", None) is not None
+                and getattr(module.__spec__, "loader", None) is self):
+            module.__spec__.loader = self.loader
+
+    def _load_module(self, fullname):
         module = self.loader.load_module(fullname)
+        self._set_loader(module)
         notify_module_loaded(module)
 
         return module
 
+    # Python 3.4 introduced create_module() and exec_module() instead of
+    # load_module() alone. Splitting the two steps.
+
+    def _create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def _exec_module(self, module):
+        self._set_loader(module)
+        self.loader.exec_module(module)
+        notify_module_loaded(module)
+
 class ImportHookFinder:
 
     def __init__(self):
@@ -218,6 +262,52 @@ class ImportHookFinder:
         finally:
             del self.in_progress[fullname]
 
+    @synchronized(_post_import_hooks_lock)
+    def find_spec(self, fullname, path=None, target=None):
+        # Since Python 3.4, you are meant to implement find_spec() method
+        # instead of find_module() and since Python 3.10 you get deprecation
+        # warnings if you don't define find_spec().
+
+        # If the module being imported is not one we have registered
+        # post import hooks for, we can return immediately. We will
+        # take no further part in the importing of this module.
+
+        if not fullname in _post_import_hooks:
+            return None
+
+        # When we are interested in a specific module, we will call back
+        # into the import system a second time to defer to the import
+        # finder that is supposed to handle the importing of the module.
+        # We set an in progress flag for the target module so that on
+        # the second time through we don't trigger another call back
+        # into the import system and cause a infinite loop.
+
+        if fullname in self.in_progress:
+            return None
+
+        self.in_progress[fullname] = True
+
+        # Now call back into the import system again.
+
+        try:
+            # This should only be Python 3 so find_spec() should always
+            # exist so don't need to check.
+
+            spec = importlib.util.find_spec(fullname)
+
+            # Replace the module spec's loader with a wrapped version
+            # but only if the spec has a loader.
+
+            loader = getattr(spec, "loader", None)
+
+            if loader and not isinstance(loader, _ImportHookChainedLoader):
+                spec.loader = _ImportHookChainedLoader(loader)
+
+            return spec
+
+        finally:
+            del self.in_progress[fullname]
+
 # Decorator for marking that a function should be called as a post
 # import hook when the target module is imported.
 
@@ -35,8 +35,44 @@ This module implements WSGI related helpers adapted from ``werkzeug.wsgi``
 :license: BSD, see LICENSE for more details.
 """
 
+from functools import lru_cache
 from urllib.parse import quote
 
+# Maps environ keys to header names, or to None for keys that are not headers.
+# The keys are nearly the same for every request, but as clients control them,
+# the cache is cleared once it reaches _HEADER_NAMES_MAX entries.
+_HEADER_NAMES_MAX = 1000
+_header_names = {}
+
+
+def _header_name(key):
+    key = str(key)
+    if key.startswith("HTTP_") and key not in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH"):
+        return key[5:].replace("_", "-").lower()
+    elif key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+        return key.replace("_", "-").lower()
+    return None
+
+
+def _cached_header_name(key):
+    try:
+        return _header_names[key]
+    except KeyError:
+        pass
+    name = _header_name(key)
+    if len(_header_names) >= _HEADER_NAMES_MAX:
+        _header_names.clear()
+    _header_names[key] = name
+    return name
+
+
+@lru_cache(256)
+def _environ_key(header_name):
+    key = header_name.upper().replace("-", "_")
+    if key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+        return key
+    return "HTTP_" + key
+
 
 # `get_headers` comes from `werkzeug.datastructures.EnvironHeaders`
 def get_headers(environ):
@@ -44,11 +80,30 @@ def get_headers(environ):
     Returns only proper HTTP headers.
     """
     for key, value in environ.items():
-        key = str(key)
-        if key.startswith("HTTP_") and key not in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH"):
-            yield key[5:].replace("_", "-").lower(), value
-        elif key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
-            yield key.replace("_", "-").lower(), value
+        name = _cached_header_name(key)
+        if name is not None:
+            yield name, value
+
+
+def get_header_dict(environ, allowlist=None):
+    """
+    Returns the HTTP headers of the environ as a dictionary, with numeric
+    values converted to strings.
+
+    :param environ: the WSGI environment
+    :param allowlist: if given, only headers with these (lowercase) names are returned
+    """
+    headers = {}
+    if allowlist:
+        for name in allowlist:
+            key = _environ_key(name)
+            if key in environ:
+                value = environ[key]
+                headers[name] = str(value) if isinstance(value, (int, float)) else value
+        return headers
+    for name, value in get_headers(environ):
+        headers[name] = str(value) if isinstance(value, (int, float)) else value
+    return headers
 
 
 def get_environ(environ):
@@ -0,0 +1,83 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import gzip
+import io
+
+import pytest
+
+from elasticapm.transport.buffer import EventBuffer
+from elasticapm.utils import json_encoder
+
+
+@pytest.fixture()
+def events():
+    span = {
+        "span": {
+            "id": "0123456789abcdef",
+            "transaction_id": "fedcba9876543210",
+            "trace_id": "0123456789abcdef0123456789abcdef",
+            "parent_id": "fedcba9876543210",
+            "name": "SELECT FROM users",
+            "type": "db",
+            "subtype": "postgresql",
+            "action": "query",
+            "timestamp": 1650000000000000,
+            "duration": 1.234,
+            "context": {"db": {"type": "sql", "statement": "SELECT * FROM users WHERE id = %s"}},
+            "outcome": "success",
+        }
+    }
+    return [json_encoder.dumps_bytes(span) + b"\n" for _ in range(500)]
+
+
+def test_gzipfile_per_event(benchmark, events):
+    """The previous implementation, which passed every event to a GzipFile"""
+
+    def compress():
+        buffer = gzip.GzipFile(fileobj=io.BytesIO(), mode="w", compresslevel=5)
+        for event in events:
+            buffer.write(event)
+        fileobj = buffer.fileobj
+        buffer.close()
+        return fileobj.getbuffer()
+
+    benchmark(compress)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "none"])
+def test_event_buffer(benchmark, events, compression):
+    def compress():
+        buffer = EventBuffer(compression=compression, compress_level=5)
+        for event in events:
+            buffer.write(event)
+        return buffer.close()
+
+    benchmark(compress)
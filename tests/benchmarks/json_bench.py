@@ -0,0 +1,82 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import elasticapm
+from elasticapm.conf.constants import ERROR, SPAN, TRANSACTION
+from elasticapm.utils import json_encoder
+
+SERIALIZERS = ["stdlib", "orjson", "ujson"]
+
+
+@pytest.fixture()
+def payloads(elasticapm_client):
+    """A realistic mix of events, as they are queued by a transaction with a few spans and an error"""
+    elasticapm_client.begin_transaction("request")
+    elasticapm.set_context({"method": "GET", "url": {"full": "http://localhost/foo?bar=baz"}}, "request")
+    elasticapm.label(customer="foo", tier=3)
+    for i in range(10):
+        with elasticapm.capture_span("SELECT FROM foo", span_type="db", span_subtype="postgresql", leaf=True):
+            pass
+    try:
+        raise ValueError("benchmark")
+    except ValueError:
+        elasticapm_client.capture_exception()
+    elasticapm_client.end_transaction("GET /foo", "HTTP 2xx")
+    events = elasticapm_client.events
+    return (
+        [{TRANSACTION: data} for data in events[TRANSACTION]]
+        + [{SPAN: data} for data in events[SPAN]]
+        + [{ERROR: data} for data in events[ERROR]]
+    )
+
+
+@pytest.mark.parametrize("name", SERIALIZERS)
+def test_serialize_events(benchmark, payloads, name):
+    if name != "stdlib":
+        pytest.importorskip(name)
+    serializer = json_encoder.get_bytes_serializer(name)
+
+    def serialize():
+        for payload in payloads:
+            serializer(payload)
+
+    benchmark(serialize)
+
+
+def test_serialize_events_legacy(benchmark, payloads):
+    """The serialization as done before the introduction of bytes serializers"""
+
+    def serialize():
+        for payload in payloads:
+            (json_encoder.dumps(payload, separators=(", ", ": ")) + "\n").encode("utf-8")
+
+    benchmark(serialize)
@@ -0,0 +1,286 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+End-to-end benchmarks of the agent pipeline, from starting a transaction to sending its events
+to a local stub APM Server:
+
+    Tracer.begin_transaction -> capture_span -> Span.end -> Client.queue -> Transport._process_queue -> send
+
+Some results can't be expressed as the duration of a single operation, these are added to the
+"extra_info" of the benchmark, e.g. when saving the results with `--benchmark-json`.
+"""
+
+import gc
+import tracemalloc
+
+import pytest
+from werkzeug.test import Client as WSGITestClient
+
+import elasticapm
+from elasticapm.base import Client
+from elasticapm.utils import get_url_dict
+from elasticapm.utils.wsgi import get_current_url, get_environ, get_header_dict
+
+
+@pytest.fixture()
+def stub_apm_server(httpserver):
+    httpserver.serve_content(code=202, content="")
+    return httpserver
+
+
+@pytest.fixture()
+def client(request, stub_apm_server):
+    config = {
+        "server_url": stub_apm_server.url,
+        "service_name": "benchmark",
+        "metrics_interval": "0ms",
+        "central_config": False,
+        "cloud_provider": "none",
+        "server_version": (8, 0),  # avoid making server_info request
+    }
+    config.update(getattr(request, "param", {}))
+    client = Client(**config)
+    yield client
+    client.close()
+
+
+def _percentile(data, percentile):
+    data = sorted(data)
+    return data[min(len(data) - 1, int(len(data) * percentile / 100.0))]
+
+
+@pytest.mark.parametrize("spans", [0, 10, 100])
+@pytest.mark.parametrize(
+    "client", [{}, {"deferred_serialization": True}], indirect=True, ids=["serialized", "deferred"]
+)
+def test_transaction_with_spans(benchmark, client, spans):
+    """Time the app spends recording a transaction with the given number of spans"""
+
+    def run():
+        client.begin_transaction("request")
+        for i in range(spans):
+            with elasticapm.capture_span("span %d" % i, span_type="db", span_subtype="postgresql", leaf=True):
+                pass
+        client.end_transaction("GET /", "HTTP 2xx")
+
+    benchmark(run)
+    benchmark.extra_info["spans"] = spans
+    if spans and benchmark.stats:
+        benchmark.extra_info["mean_seconds_per_span"] = benchmark.stats.stats.mean / spans
+
+
+@pytest.mark.parametrize(
+    "client",
+    [
+        {"breakdown_metrics": False, "span_stack_trace_min_duration": "1s"},
+        {"breakdown_metrics": True, "span_stack_trace_min_duration": "1s"},
+    ],
+    indirect=True,
+    ids=["no-breakdown", "breakdown"],
+)
+def test_span_end(benchmark, client):
+    """Time to end a fast db span inside a parent span, as done for most spans"""
+    spans = 100
+    client.tracer.queue_func = lambda *args: None
+
+    def setup():
+        transaction = client.begin_transaction("request")
+        transaction.begin_span("parent", "app")
+        children = [
+            transaction.begin_span(
+                "SELECT FROM users",
+                "db",
+                context={"db": {"type": "sql", "instance": "users"}},
+                leaf=True,
+                span_subtype="postgresql",
+                auto_activate=False,
+            )
+            for _ in range(spans)
+        ]
+        return (children,), {}
+
+    def run(children):
+        for span in children:
+            span.end()
+
+    benchmark.pedantic(run, setup=setup, rounds=500)
+    if benchmark.stats:
+        benchmark.extra_info["mean_seconds_per_span"] = benchmark.stats.stats.mean / spans
+
+
+def test_events_drained(benchmark, client):
+    """Time to serialize, compress and send queued events to the stub APM Server"""
+    events = 5000
+    span = {
+        "id": "0123456789abcdef",
+        "transaction_id": "fedcba9876543210",
+        "trace_id": "0123456789abcdef0123456789abcdef",
+        "parent_id": "fedcba9876543210",
+        "name": "SELECT FROM users",
+        "type": "db",
+        "subtype": "postgresql",
+        "action": "query",
+        "timestamp": 1650000000000000,
+        "duration": 1.234,
+        "context": {"db": {"type": "sql", "statement": "SELECT * FROM users WHERE id = %s"}},
+        "outcome": "success",
+    }
+
+    def run():
+        for _ in range(events):
+            client.queue("span", span)
+        client._transport.flush()
+
+    benchmark.pedantic(run, rounds=10)
+    benchmark.extra_info["events"] = events
+    if benchmark.stats:
+        benchmark.extra_info["events_per_second"] = events / benchmark.stats.stats.mean
+
+
+def test_memory_per_transaction(benchmark, client):
+    """Memory allocated by in-flight transactions with 10 spans each"""
+    transactions = 1000
+
+    def run():
+        in_flight = []
+        for _ in range(transactions):
+            transaction = client.tracer.begin_transaction("request", auto_activate=False)
+            for i in range(10):
+                span = transaction.begin_span("span %d" % i, "db", leaf=True, auto_activate=False)
+                span.end()
+            in_flight.append(transaction)
+        return in_flight
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        in_flight = run()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del in_flight
+    benchmark.pedantic(run, rounds=5)
+    benchmark.extra_info["bytes_per_transaction"] = allocated / transactions
+
+
+def test_memory_per_span(benchmark, client):
+    """Memory held by in-flight spans, half of them with a child span"""
+    spans = 1000
+
+    def run():
+        transaction = client.tracer.begin_transaction("request", auto_activate=False)
+        in_flight = []
+        for i in range(spans // 2):
+            span = transaction.begin_span("span %d" % i, "code", auto_activate=False)
+            child = transaction.begin_span("child %d" % i, "db", leaf=True, auto_activate=False)
+            in_flight.extend((span, child))
+        return transaction, in_flight
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        in_flight = run()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del in_flight
+    benchmark.pedantic(run, rounds=5)
+    benchmark.extra_info["bytes_per_span"] = allocated / spans
+
+
+def _wsgi_app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"ok"]
+
+
+def _traced_wsgi_app(client):
+    def app(environ, start_response):
+        client.begin_transaction("request")
+        try:
+            with elasticapm.capture_span("handler"):
+                return _wsgi_app(environ, start_response)
+        finally:
+            elasticapm.set_context(
+                lambda: {
+                    "method": environ["REQUEST_METHOD"],
+                    "url": get_url_dict(get_current_url(environ)),
+                    "headers": get_header_dict(environ),
+                    "env": dict(get_environ(environ)),
+                },
+                "request",
+            )
+            client.end_transaction("GET /", "HTTP 2xx")
+
+    return app
+
+
+@pytest.mark.parametrize("instrumented", [False, True], ids=["plain", "instrumented"])
+def test_wsgi_request_latency(benchmark, client, instrumented):
+    """
+    Latency of a request to a minimal WSGI app. Compare the p99 latency in "extra_info"
+    of the plain and the instrumented app to get the latency added by the agent.
+    """
+    test_client = WSGITestClient(_traced_wsgi_app(client) if instrumented else _wsgi_app)
+    benchmark.pedantic(test_client.get, args=("/?foo=bar",), rounds=1000)
+    if benchmark.stats:
+        benchmark.extra_info["p99_seconds"] = _percentile(benchmark.stats.stats.data, 99)
+
+
+@pytest.mark.parametrize("instrumented", [False, True], ids=["plain", "instrumented"])
+def test_asgi_request_latency(benchmark, client, instrumented):
+    """
+    Latency of a request to a minimal Starlette app. Compare the p99 latency in "extra_info"
+    of the plain and the instrumented app to get the latency added by the agent.
+    """
+    pytest.importorskip("starlette")
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.testclient import TestClient
+
+    from elasticapm.contrib.starlette import ElasticAPM
+
+    app = Starlette()
+
+    @app.route("/")
+    async def hi(request):
+        with elasticapm.capture_span("handler"):
+            return PlainTextResponse("ok")
+
+    if instrumented:
+        app.add_middleware(ElasticAPM, client=client)
+    with TestClient(app) as test_client:
+        benchmark.pedantic(test_client.get, args=("/?foo=bar",), rounds=1000)
+    if benchmark.stats:
+        benchmark.extra_info["p99_seconds"] = _percentile(benchmark.stats.stats.data, 99)
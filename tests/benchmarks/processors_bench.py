@@ -0,0 +1,84 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import copy
+
+import pytest
+
+from elasticapm import processors
+
+SANITIZE_PROCESSORS = [
+    processors.sanitize_http_request_cookies,
+    processors.sanitize_http_response_cookies,
+    processors.sanitize_http_headers,
+    processors.sanitize_http_wsgi_env,
+]
+
+
+@pytest.fixture()
+def request_event():
+    return {
+        "context": {
+            "request": {
+                "headers": {
+                    "host": "example.com",
+                    "user-agent": "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0",
+                    "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                    "accept-encoding": "gzip, deflate, br",
+                    "accept-language": "en-US,en;q=0.5",
+                    "authorization": "Bearer abc",
+                    "cache-control": "no-cache",
+                    "connection": "keep-alive",
+                    "cookie": "sessionid=abc; csrftoken=def; theme=dark; _ga=GA1.2.3; lang=en",
+                    "referer": "http://example.com/",
+                    "x-forwarded-for": "10.0.0.1",
+                    "x-request-id": "4bf92f3577b34da6",
+                },
+                "cookies": {"sessionid": "abc", "csrftoken": "def", "theme": "dark", "_ga": "GA1.2.3", "lang": "en"},
+                "env": {"REMOTE_ADDR": "10.0.0.1", "SERVER_NAME": "example.com", "SERVER_PORT": "80"},
+            },
+            "response": {"headers": {"content-type": "text/html", "set-cookie": "sessionid=abc; Path=/; HttpOnly"}},
+        }
+    }
+
+
+def test_sanitize_request(benchmark, elasticapm_client, request_event):
+    """Sanitize the headers, cookies and environ of an HTTP request and response"""
+
+    def sanitize(events):
+        event = events.pop()
+        for processor in SANITIZE_PROCESSORS:
+            event = processor(elasticapm_client, event)
+        return event
+
+    result = benchmark.pedantic(
+        sanitize, setup=lambda: (([copy.deepcopy(request_event)],), {}), rounds=2000, warmup_rounds=10
+    )
+    assert result["context"]["request"]["cookies"]["sessionid"] == processors.MASK
+    assert result["context"]["request"]["headers"]["authorization"] == processors.MASK
@@ -0,0 +1,80 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmarks for the agent's hot paths, using pytest-benchmark.
+
+The regular test run only runs each benchmark once. To measure timings, run e.g.
+
+    py.test tests/benchmarks/queue_bench.py --benchmark-enable
+"""
+
+import threading
+
+import pytest
+
+from elasticapm.transport.base import ChilledQueue, DequeQueue
+
+EVENTS_PER_PRODUCER = 2000
+
+
+def _drain(queue, count):
+    for _ in range(count):
+        queue.get(block=True, timeout=5)
+
+
+def _produce(queue, count):
+    put = queue.put
+    for i in range(count - 1):
+        put(i, block=False)
+    # the last event wakes up the consumer, similar to a flush
+    put(count - 1, block=False, chill=False)
+
+
+@pytest.mark.parametrize("producers", [1, 8, 64])
+@pytest.mark.parametrize("queue_class", [ChilledQueue, DequeQueue], ids=["chilled", "deque"])
+def test_queue_put_get(benchmark, queue_class, producers):
+    """Time to move EVENTS_PER_PRODUCER events per producer thread through the queue to a single consumer"""
+
+    def setup():
+        queue = queue_class(maxsize=0, chill_until=500, max_chill_time=1.0)
+        threads = [threading.Thread(target=_produce, args=(queue, EVENTS_PER_PRODUCER)) for _ in range(producers)]
+        consumer = threading.Thread(target=_drain, args=(queue, EVENTS_PER_PRODUCER * producers))
+        return (threads, consumer), {}
+
+    def run(threads, consumer):
+        consumer.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        consumer.join()
+
+    benchmark.pedantic(run, setup=setup, rounds=10)
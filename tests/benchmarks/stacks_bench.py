@@ -0,0 +1,67 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+from elasticapm import processors
+from elasticapm.utils import stacks
+from tests.utils.stacks import get_me_more_test_frames
+
+
+@pytest.mark.parametrize("with_locals", [False, True])
+def test_get_stack_info(benchmark, with_locals):
+    """Resolve a stack trace of 30 frames, as for a span or error"""
+    frames = list(stacks.iter_stack_frames(get_me_more_test_frames(30)))
+    include_paths_re = stacks.get_path_regex(["tests.*"])
+    exclude_paths_re = stacks.get_path_regex(["elasticapm.*"])
+
+    result = benchmark(
+        stacks.get_stack_info,
+        frames,
+        with_locals=with_locals,
+        library_frame_context_lines=1,
+        in_app_frame_context_lines=5,
+        include_paths_re=include_paths_re,
+        exclude_paths_re=exclude_paths_re,
+    )
+    assert len(result) == 30
+
+
+def test_add_context_lines_to_frames(benchmark):
+    """Add source context to the frames of an event, as done for each span and error"""
+    frames = list(stacks.iter_stack_frames(get_me_more_test_frames(30)))
+    stack_info = stacks.get_stack_info(frames, library_frame_context_lines=1, in_app_frame_context_lines=5)
+
+    def add_context_lines():
+        event = {"stacktrace": [dict(frame) for frame in stack_info]}
+        return processors.add_context_lines_to_frames(None, event)
+
+    result = benchmark(add_context_lines)
+    assert all("context_line" in frame for frame in result["stacktrace"])
@@ -0,0 +1,75 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import pytest  # isort:skip
+
+starlette = pytest.importorskip("starlette")  # isort:skip
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+from elasticapm.contrib.starlette import ElasticAPM
+
+
+@pytest.fixture()
+def large_app(elasticapm_client):
+    """An app with 300 routes, 100 of them in a mounted app"""
+
+    async def endpoint(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette()
+    sub = Starlette()
+    for i in range(200):
+        app.add_route("/resource{}/{{id}}".format(i), endpoint)
+    for i in range(100):
+        sub.add_route("/resource{}/{{id}}".format(i), endpoint)
+    app.mount("/sub", sub)
+    return app, ElasticAPM(app, client=elasticapm_client)
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_get_route_name(benchmark, large_app, cached):
+    """Name the transaction of a request to one of the last routes of a large app"""
+    app, middleware = large_app
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/sub/resource99/42",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"example.com")],
+        "app": app,
+    }
+    request = Request(scope)
+    get_route_name = middleware.get_route_name if cached else middleware._resolve_route_name
+
+    result = benchmark(get_route_name, request)
+    assert result == "/sub/resource99/{id}"
@@ -0,0 +1,76 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest  # isort:skip
+
+aiohttp = pytest.importorskip("aiohttp")  # isort:skip
+
+import asyncio
+
+from elasticapm.transport.asyncio import AsyncioTransport
+from elasticapm.transport.http import Transport
+
+REQUESTS = 200
+SPANS_PER_REQUEST = 10
+
+
+@pytest.mark.parametrize("transport_class", [Transport, AsyncioTransport], ids=["threaded", "asyncio"])
+def test_transport_on_event_loop(benchmark, waiting_httpserver, elasticapm_client, transport_class):
+    """
+    Time to queue the events of REQUESTS concurrent requests of an ASGI app on its event loop,
+    and to send them to a local HTTP server.
+    """
+    elasticapm_client.server_version = (8, 0)  # avoid making server_info request
+    waiting_httpserver.serve_content(code=202, content="")
+    loop = asyncio.new_event_loop()
+    transport = transport_class(waiting_httpserver.url, client=elasticapm_client)
+    span = {"id": "0123456789abcdef", "name": "SELECT FROM users", "type": "db", "duration": 1.234}
+
+    async def handle_request():
+        for _ in range(SPANS_PER_REQUEST):
+            transport.queue("span", span)
+            await asyncio.sleep(0)
+        transport.queue("transaction", {"id": "fedcba9876543210", "name": "GET /"})
+
+    async def run():
+        await asyncio.gather(*(handle_request() for _ in range(REQUESTS)))
+        transport.queue(None, None, flush=True)
+        # wait for the flush without blocking the event loop
+        await loop.run_in_executor(None, transport._flushed.wait, 5)
+
+    async def start():
+        transport.start_thread()
+
+    loop.run_until_complete(start())
+    try:
+        benchmark(lambda: loop.run_until_complete(run()))
+    finally:
+        loop.run_until_complete(loop.run_in_executor(None, transport.close))
+        loop.close()
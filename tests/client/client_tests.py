@@ -306,6 +306,16 @@ def test_send(sending_elasticapm_client):
     # assert 250 < request.content_length < 400
 
 
+@pytest.mark.parametrize("validating_httpserver", [{"skip_validate": True}], indirect=True)
+@pytest.mark.parametrize("sending_elasticapm_client", [{"api_request_compression": "none"}], indirect=True)
+def test_send_uncompressed(sending_elasticapm_client):
+    sending_elasticapm_client.queue("x", {})
+    sending_elasticapm_client.close()
+    request = sending_elasticapm_client.httpserver.requests[0]
+    assert "Content-Encoding" not in request.headers
+    assert sending_elasticapm_client.httpserver.payloads[0][1] == {"x": {}}
+
+
 @pytest.mark.flaky(reruns=3)  # test is flaky on Windows
 @pytest.mark.parametrize("sending_elasticapm_client", [{"disable_send": True}], indirect=True)
 def test_send_not_enabled(sending_elasticapm_client):
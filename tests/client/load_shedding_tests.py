@@ -0,0 +1,92 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest
+
+import elasticapm
+from elasticapm.conf import constants
+from elasticapm.transport.load_shedding import LoadShedder
+
+
+@pytest.mark.parametrize("elasticapm_client", [{"load_shedding": True}], indirect=True)
+def test_skip_span_frames(elasticapm_client):
+    elasticapm_client.load_shedder.level = LoadShedder.SKIP_SPAN_FRAMES
+    elasticapm_client.begin_transaction("test_type")
+    with elasticapm.capture_span("span", duration=1):
+        pass
+    elasticapm_client.end_transaction("test")
+    span = elasticapm_client.events[constants.SPAN][0]
+    assert "stacktrace" not in span
+    assert elasticapm_client.load_shedder.skipped_stack_traces == 1
+
+
+@pytest.mark.parametrize("elasticapm_client", [{"load_shedding": True}], indirect=True)
+def test_drop_internal_spans(elasticapm_client):
+    elasticapm_client.load_shedder.level = LoadShedder.DROP_INTERNAL_SPANS
+    transaction = elasticapm_client.begin_transaction("test_type")
+    with elasticapm.capture_span("internal"):
+        with elasticapm.capture_span("exit", leaf=True, span_type="db", span_subtype="postgresql", duration=1):
+            pass
+    elasticapm_client.end_transaction("test")
+    spans = elasticapm_client.events[constants.SPAN]
+    assert [span["name"] for span in spans] == ["exit"]
+    # the exit span is attached to the transaction, as its parent was dropped
+    assert spans[0]["parent_id"] == transaction.id
+    assert elasticapm_client.events[constants.TRANSACTION][0]["span_count"]["dropped"] == 1
+
+
+@pytest.mark.parametrize("elasticapm_client", [{"load_shedding": True, "transaction_sample_rate": 0.4}], indirect=True)
+def test_reduced_sample_rate(elasticapm_client):
+    elasticapm_client.load_shedder.level = LoadShedder.REDUCE_SAMPLING + 1
+    for _ in range(100):
+        transaction = elasticapm_client.begin_transaction("test_type")
+        if transaction.is_sampled:
+            assert transaction.sample_rate == "0.1"
+        else:
+            assert transaction.sample_rate == "0"
+        elasticapm_client.end_transaction("test")
+
+
+@pytest.mark.parametrize("elasticapm_client", [{"load_shedding": True, "metrics_interval": "30s"}], indirect=True)
+def test_load_shedding_metrics(elasticapm_client):
+    load_shedder = elasticapm_client.load_shedder
+    metricset = elasticapm_client._metrics.get_metricset("elasticapm.metrics.sets.load_shedding.LoadSheddingMetricSet")
+    load_shedder.level = 2
+    load_shedder.dropped_events = 3
+    load_shedder.dropped_spans = 4
+    samples = list(metricset.collect())[0]["samples"]
+    assert samples["agent.load_shedding.level"]["value"] == 2
+    assert samples["agent.load_shedding.events.dropped"]["value"] == 3
+    assert samples["agent.load_shedding.spans.dropped"]["value"] == 4
+    assert "agent.load_shedding.stacktraces.skipped" not in samples
+    load_shedder.dropped_events = 5
+    samples = list(metricset.collect())[0]["samples"]
+    assert samples["agent.load_shedding.events.dropped"]["value"] == 2
+    assert "agent.load_shedding.spans.dropped" not in samples
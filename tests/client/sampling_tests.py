@@ -0,0 +1,232 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import mock
+import pytest
+
+import elasticapm
+from elasticapm.conf import constants
+from elasticapm.sampling import AdaptiveSampler
+
+adaptive_sampling_config = {
+    "transaction_sampler": "elasticapm.sampling.AdaptiveSampler",
+    "adaptive_sampling_target": 1.0,
+    "metrics_interval": "10s",
+}
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def clock():
+    clock = Clock()
+    with mock.patch("elasticapm.sampling.timeit.default_timer", clock):
+        yield clock
+
+
+@pytest.mark.parametrize("elasticapm_client", [adaptive_sampling_config], indirect=True)
+def test_adaptive_sampler_rate_per_endpoint(elasticapm_client, clock):
+    sampler = AdaptiveSampler(elasticapm_client)
+    # 100 health checks per second, and a rare request every 5 seconds
+    for i in range(10):
+        for _ in range(100):
+            assert sampler.sample_rate("request", "GET /health", 1.0) <= 1.0
+            clock.now += 0.01
+        if i % 5 == 0:
+            assert sampler.sample_rate("request", "GET /rare", 1.0) == 1.0
+    clock.now += 0.01
+    sampler.sample_rate("request", "GET /health", 1.0)
+    assert sampler.sample_rate("request", "GET /health", 1.0) == pytest.approx(0.01, abs=0.005)
+    assert sampler.sample_rate("request", "GET /rare", 1.0) == 1.0
+
+
+@pytest.mark.parametrize("elasticapm_client", [adaptive_sampling_config], indirect=True)
+def test_adaptive_sampler_lowers_rate_of_new_endpoint_early(elasticapm_client, clock):
+    sampler = AdaptiveSampler(elasticapm_client)
+    for _ in range(10):
+        assert sampler.sample_rate("request", "GET /health", 1.0) == 1.0
+        clock.now += 0.001
+    # the 10 samples of the interval are used up after 10ms
+    assert sampler.sample_rate("request", "GET /health", 1.0) == pytest.approx(0.001, abs=0.0002)
+
+
+@pytest.mark.parametrize("elasticapm_client", [adaptive_sampling_config], indirect=True)
+def test_adaptive_sampler_forgets_idle_endpoints(elasticapm_client, clock):
+    sampler = AdaptiveSampler(elasticapm_client)
+    sampler.sample_rate("request", "GET /once", 1.0)
+    clock.now += 10
+    sampler.sample_rate("request", "GET /other", 1.0)
+    clock.now += 10
+    sampler.sample_rate("request", "GET /other", 1.0)
+    assert ("request", "GET /once") not in sampler._buckets
+
+
+@pytest.mark.parametrize("elasticapm_client", [adaptive_sampling_config], indirect=True)
+def test_adaptive_sampler_max_buckets(elasticapm_client, clock):
+    sampler = AdaptiveSampler(elasticapm_client)
+    with mock.patch.object(AdaptiveSampler, "MAX_BUCKETS", 2):
+        for i in range(5):
+            sampler.sample_rate("request", "GET /%d" % i, 1.0)
+    assert len(sampler._buckets) == 3
+    assert sampler._buckets[None].seen == 3
+
+
+@pytest.mark.parametrize("elasticapm_client", [adaptive_sampling_config], indirect=True)
+def test_adaptive_sampler_bounded_by_transaction_sample_rate(elasticapm_client, clock):
+    sampler = AdaptiveSampler(elasticapm_client)
+    assert sampler.sample_rate("request", "GET /", 0.5) == 0.5
+    assert sampler.sample_rate("request", "GET /", 0.0) == 0.0
+
+
+@pytest.mark.parametrize("elasticapm_client", [adaptive_sampling_config], indirect=True)
+def test_sample_rate_of_sampler_in_tracestate(elasticapm_client, clock):
+    sampler = elasticapm_client.tracer.sampler
+    assert isinstance(sampler, AdaptiveSampler)
+    sampler._get_bucket(("request", "GET /health"), clock.now).rate = 0.25
+    for _ in range(20):
+        transaction = elasticapm_client.begin_transaction("request", name="GET /health")
+        assert transaction.name == "GET /health"
+        expected = "0.25" if transaction.is_sampled else "0"
+        assert transaction.sample_rate == expected
+        assert transaction.trace_parent.tracestate_dict[constants.TRACESTATE.SAMPLE_RATE] == expected
+        elasticapm_client.end_transaction()
+
+
+def test_no_sampler_by_default(elasticapm_client):
+    assert elasticapm_client.tracer.sampler is None
+
+
+tail_sampling_config = {
+    "tail_sampling": True,
+    "tail_sampling_min_duration": "100ms",
+    "transaction_sample_rate": 0.0,
+}
+
+
+@pytest.mark.parametrize("elasticapm_client", [tail_sampling_config], indirect=True)
+def test_tail_sampling_keeps_slow_transaction(elasticapm_client):
+    transaction = elasticapm_client.begin_transaction("request")
+    assert transaction.is_sampled
+    # downstream services still get the head-based sampling decision
+    assert not transaction.trace_parent.trace_options.recorded
+    with elasticapm.capture_span("slow query", span_type="db", leaf=True, duration=0.2):
+        pass
+    elasticapm_client.end_transaction("GET /", "HTTP 2xx", duration=0.2)
+    spans = elasticapm_client.events[constants.SPAN]
+    assert [span["name"] for span in spans] == ["slow query"]
+    # kept transactions aren't counted in throughput metrics, so they aren't counted twice
+    assert spans[0]["sample_rate"] == 0.0
+    transaction_event = elasticapm_client.events[constants.TRANSACTION][0]
+    assert transaction_event["sampled"]
+    assert transaction_event["sample_rate"] == 0.0
+    assert transaction.trace_parent.tracestate_dict[constants.TRACESTATE.SAMPLE_RATE] == "0"
+    assert transaction_event["span_count"]["started"] == 1
+
+
+@pytest.mark.parametrize("elasticapm_client", [tail_sampling_config], indirect=True)
+def test_tail_sampling_drops_fast_transaction(elasticapm_client):
+    elasticapm_client.begin_transaction("request")
+    with elasticapm.capture_span("fast query", span_type="db", leaf=True, duration=0.01):
+        pass
+    elasticapm_client.end_transaction("GET /", "HTTP 2xx", duration=0.01)
+    assert not elasticapm_client.events[constants.SPAN]
+    # unsampled transactions aren't sent to APM Server 8.0+
+    assert not elasticapm_client.events[constants.TRANSACTION]
+    assert elasticapm_client.tail_sampler._size == 0
+
+
+@pytest.mark.parametrize("elasticapm_client", [dict(tail_sampling_config, server_version=(7, 16, 0))], indirect=True)
+def test_tail_sampling_dropped_transaction_reported_as_unsampled(elasticapm_client):
+    elasticapm_client.begin_transaction("request")
+    with elasticapm.capture_span("fast query", span_type="db", leaf=True, duration=0.01):
+        pass
+    elasticapm_client.end_transaction("GET /", "HTTP 2xx", duration=0.01)
+    transaction_event = elasticapm_client.events[constants.TRANSACTION][0]
+    assert not transaction_event["sampled"]
+    assert transaction_event["sample_rate"] == 0.0
+    assert transaction_event["span_count"] == {"started": 0, "dropped": 0}
+    assert "context" not in transaction_event
+
+
+@pytest.mark.parametrize("elasticapm_client", [tail_sampling_config], indirect=True)
+def test_tail_sampling_keeps_failed_transaction(elasticapm_client):
+    elasticapm_client.begin_transaction("request")
+    with elasticapm.capture_span("query", span_type="db", leaf=True, duration=0.01):
+        pass
+    elasticapm.set_transaction_outcome(constants.OUTCOME.FAILURE)
+    elasticapm_client.end_transaction("GET /", "HTTP 5xx", duration=0.01)
+    assert len(elasticapm_client.events[constants.SPAN]) == 1
+    assert elasticapm_client.events[constants.TRANSACTION][0]["sampled"]
+
+
+@pytest.mark.parametrize("elasticapm_client", [tail_sampling_config], indirect=True)
+def test_tail_sampling_keeps_transaction_with_error(elasticapm_client):
+    elasticapm_client.begin_transaction("request")
+    with elasticapm.capture_span("query", span_type="db", leaf=True, duration=0.01):
+        pass
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        elasticapm_client.capture_exception()
+    elasticapm_client.end_transaction("GET /", "HTTP 2xx", duration=0.01)
+    assert len(elasticapm_client.events[constants.SPAN]) == 1
+    assert elasticapm_client.events[constants.ERROR][0]["transaction"]["sampled"]
+    assert elasticapm_client.events[constants.TRANSACTION][0]["sampled"]
+
+
+@pytest.mark.parametrize("elasticapm_client", [dict(tail_sampling_config, tail_sampling_max_spans=3)], indirect=True)
+def test_tail_sampling_evicts_oldest_transaction(elasticapm_client):
+    tracer = elasticapm_client.tracer
+    first = tracer.begin_transaction("request", auto_activate=False)
+    second = tracer.begin_transaction("request", auto_activate=False)
+    for transaction in (first, second):
+        span = transaction.begin_span("query", "db", auto_activate=False)
+        span.end(duration=0.2)
+    # the two transactions and the span of the first one fill the buffer, the second span evicts the first transaction
+    assert elasticapm_client.tail_sampler.evicted == 1
+    first.end(duration=0.2)
+    second.end(duration=0.2)
+    assert elasticapm_client.tail_sampler.finish(first) is None
+    assert len(elasticapm_client.tail_sampler.finish(second)) == 1
+    assert elasticapm_client.tail_sampler._size == 0
+
+
+@pytest.mark.parametrize("elasticapm_client", [dict(tail_sampling_config, transaction_sample_rate=1.0)], indirect=True)
+def test_tail_sampling_only_for_unsampled_transactions(elasticapm_client):
+    transaction = elasticapm_client.begin_transaction("request")
+    assert not transaction.tail_sampling
+    assert transaction.trace_parent.trace_options.recorded
+    elasticapm_client.end_transaction("GET /", "HTTP 2xx")
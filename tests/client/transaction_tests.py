@@ -55,6 +55,32 @@ def test_transaction_span(elasticapm_client):
     assert spans[0]["name"] == "test"
 
 
+@pytest.mark.parametrize("elasticapm_client", [{"deferred_serialization": True}], indirect=True)
+def test_deferred_serialization(elasticapm_client):
+    queued = []
+    queue_func = elasticapm_client.tracer.queue_func
+
+    def record(event_type, data, *args, **kwargs):
+        queued.append(data)
+        return queue_func(event_type, data, *args, **kwargs)
+
+    elasticapm_client.tracer.queue_func = record
+    elasticapm_client.begin_transaction("test")
+    with elasticapm.capture_span("test", extra={"a": "b"}, labels={"foo": "bar"}):
+        pass
+    elasticapm_client.end_transaction("test", constants.OUTCOME.SUCCESS)
+
+    # the to_dict methods are queued, and called by the transport
+    assert all(callable(data) for data in queued)
+    transactions = elasticapm_client.events[constants.TRANSACTION]
+    assert transactions[0]["name"] == "test"
+    assert transactions[0]["span_count"] == {"started": 1, "dropped": 0}
+    spans = elasticapm_client.events[constants.SPAN]
+    assert spans[0]["name"] == "test"
+    assert spans[0]["context"]["tags"] == {"foo": "bar"}
+    assert spans[0]["transaction_id"] == transactions[0]["id"]
+
+
 @pytest.mark.parametrize(
     "elasticapm_client", [{"transactions_ignore_patterns": ["^OPTIONS", "views.api.v2"]}], indirect=True
 )
@@ -174,11 +200,11 @@ def test_transaction_sampling(elasticapm_client, not_so_random):
         spans_per_transaction[span["transaction_id"]].append(span)
 
     # seed is fixed by not_so_random fixture
-    assert len([t for t in transactions if t["sampled"]]) == 3
+    assert len([t for t in transactions if t["sampled"]]) == 5
     if elasticapm_client.server_version < (8, 0):
         assert len(transactions) == 10
     else:
-        assert len(transactions) == 3
+        assert len(transactions) == 5
     for transaction in transactions:
         assert transaction["sampled"] or not transaction["id"] in spans_per_transaction
         assert transaction["sampled"] or not "context" in transaction
@@ -199,7 +225,7 @@ def test_transaction_sample_rate_dynamic(elasticapm_client, not_so_random):
         spans_per_transaction[span["transaction_id"]].append(span)
 
     # seed is fixed by not_so_random fixture
-    assert len([t for t in transactions if t["sampled"]]) == 3
+    assert len([t for t in transactions if t["sampled"]]) == 5
     for transaction in transactions:
         assert transaction["sampled"] or not transaction["id"] in spans_per_transaction
         assert transaction["sampled"] or not "context" in transaction
@@ -214,7 +240,7 @@ def test_transaction_sample_rate_dynamic(elasticapm_client, not_so_random):
     transactions = elasticapm_client.events[constants.TRANSACTION]
 
     # seed is fixed by not_so_random fixture
-    assert len([t for t in transactions if t["sampled"]]) == 8
+    assert len([t for t in transactions if t["sampled"]]) == 10
 
 
 def test_transaction_max_spans_dynamic(elasticapm_client):
@@ -259,6 +285,33 @@ def test_transaction_span_stack_trace_min_duration(elasticapm_client):
     assert spans[1]["stacktrace"] is not None
 
 
+@pytest.mark.parametrize(
+    "elasticapm_client",
+    [
+        {"span_stack_trace_min_duration": 0, "collect_local_variables": "errors"},
+        {"span_stack_trace_min_duration": 0, "collect_local_variables": "all"},
+    ],
+    indirect=True,
+)
+def test_span_frames_resolved_on_serialization(elasticapm_client):
+    elasticapm_client.begin_transaction("test_type")
+    with elasticapm.capture_span("frames", leaf=True) as span:
+        local_var = "foo"  # noqa: F841
+    if elasticapm_client.config.collect_local_variables == "all":
+        # frames have to be resolved while the locals are still available
+        assert not callable(span.frames)
+    else:
+        assert callable(span.frames)
+    elasticapm_client.end_transaction("test")
+
+    stacktrace = elasticapm_client.events[constants.SPAN][0]["stacktrace"]
+    assert stacktrace[0]["function"] == "test_span_frames_resolved_on_serialization"
+    if elasticapm_client.config.collect_local_variables == "all":
+        assert stacktrace[0]["vars"]["local_var"] == "foo"
+    else:
+        assert "vars" not in stacktrace[0]
+
+
 @pytest.mark.parametrize("elasticapm_client", [{"span_stack_trace_min_duration": 0}], indirect=True)
 def test_transaction_span_stack_trace_min_duration_no_limit(elasticapm_client):
     elasticapm_client.begin_transaction("test_type")
@@ -34,6 +34,7 @@ from tests.fixtures import TempStoreClient
 
 starlette = pytest.importorskip("starlette")  # isort:skip
 
+import asyncio
 import os
 
 import mock
@@ -47,6 +48,7 @@ import elasticapm
 from elasticapm import async_capture_span
 from elasticapm.conf import constants
 from elasticapm.contrib.starlette import ElasticAPM, make_apm_client
+from elasticapm.contrib.starlette.utils import BodyTee
 from elasticapm.utils import wrapt
 from elasticapm.utils.disttracing import TraceParent
 
@@ -83,6 +85,12 @@ def app(elasticapm_client):
             pass
         return PlainTextResponse("ok")
 
+    @app.route("/stream", methods=["POST"])
+    async def stream(request):
+        chunks = [chunk async for chunk in request.stream() if chunk]
+        tee = "tee" if isinstance(request.receive, BodyTee) else "no tee"
+        return PlainTextResponse("{} chunks, {}".format(len(chunks), tee))
+
     @app.route("/raise-exception", methods=["GET", "POST"])
     async def raise_exception(request):
         await request.body()
@@ -292,6 +300,30 @@ def test_transaction_name_is_route(app, elasticapm_client):
     assert transaction["context"]["request"]["url"]["pathname"] == "/hi/shay"
 
 
+def test_route_name_cache(app, elasticapm_client):
+    client = TestClient(app)
+    with mock.patch.object(
+        ElasticAPM, "_resolve_route_name", autospec=True, side_effect=ElasticAPM._resolve_route_name
+    ) as resolve:
+        client.get("/hi/shay")
+        client.get("/hi/shay")
+        client.post("/hi/shay")
+        assert resolve.call_count == 2
+
+        # adding a route invalidates the cache
+        app.add_route("/new", lambda request: PlainTextResponse("new"))
+        client.get("/hi/shay")
+        assert resolve.call_count == 3
+
+        with mock.patch("elasticapm.contrib.starlette.ROUTE_NAME_CACHE_SIZE", 2):
+            for name in ("a", "b", "c", "a"):
+                client.get("/hi/" + name)
+        assert resolve.call_count == 7
+
+    transaction_names = [t["name"] for t in elasticapm_client.events[constants.TRANSACTION]]
+    assert transaction_names == ["GET /hi/{name}"] * 2 + ["POST /hi/shay"] + ["GET /hi/{name}"] * 5
+
+
 @pytest.mark.skipif(starlette_version_tuple < (0, 14), reason="trailing slash behaviour new in 0.14")
 @pytest.mark.parametrize(
     "url,expected",
@@ -367,6 +399,81 @@ def test_undefined_mounted_route(app, elasticapm_client):
     assert transaction["name"] == "GET /sub/subsub/undefined"
 
 
+@pytest.mark.parametrize(
+    "elasticapm_client,expected_body,expected_tee",
+    [
+        ({"capture_body": "all"}, "abcdefghi", "tee"),
+        ({"capture_body": "error"}, "[REDACTED]", "tee"),
+        ({"capture_body": "off"}, "[REDACTED]", "no tee"),
+    ],
+    indirect=["elasticapm_client"],
+)
+def test_streaming_body(app, elasticapm_client, expected_body, expected_tee):
+    client = TestClient(app)
+    response = client.post("/stream", data=(chunk for chunk in (b"abc", b"def", b"ghi")))
+
+    # the app receives the body in chunks, and not as one pre-read blob
+    assert response.text == "3 chunks, {}".format(expected_tee)
+    transaction = elasticapm_client.events[constants.TRANSACTION][0]
+    assert transaction["context"]["request"]["body"] == expected_body
+
+
+@pytest.mark.parametrize(
+    "elasticapm_client",
+    [{"capture_body": "all", "transaction_request_fields": "url, body", "error_request_fields": "headers"}],
+    indirect=True,
+)
+def test_request_fields(app, elasticapm_client):
+    client = TestClient(app)
+    client.post("/", "somedata", headers={"foo": "bar"})
+    with pytest.raises(ValueError):
+        client.post("/raise-exception", "somedata", headers={"foo": "bar"})
+
+    request = elasticapm_client.events[constants.TRANSACTION][0]["context"]["request"]
+    assert request == {"method": "POST", "url": request["url"], "body": "somedata"}
+    error_request = elasticapm_client.events[constants.ERROR][0]["context"]["request"]
+    assert set(error_request.keys()) == {"method", "headers"}
+
+
+@pytest.mark.parametrize("elasticapm_client", [{"request_headers_allowlist": "Foo, baz"}], indirect=True)
+def test_request_headers_allowlist(app, elasticapm_client):
+    client = TestClient(app)
+    client.get("/", headers={"foo": "bar", "bar": "baz"})
+
+    request = elasticapm_client.events[constants.TRANSACTION][0]["context"]["request"]
+    assert request["headers"] == {"foo": "bar"}
+
+
+@pytest.mark.parametrize("elasticapm_client", [{"capture_body": "all", "deferred_serialization": True}], indirect=True)
+def test_request_context_deferred_serialization(app, elasticapm_client):
+    client = TestClient(app)
+    client.post("/", "somedata")
+    elasticapm_client.close()
+
+    request = elasticapm_client.events[constants.TRANSACTION][0]["context"]["request"]
+    assert request["body"] == "somedata"
+    assert request["url"]["pathname"] == "/"
+
+
+def test_body_tee_max_length():
+    messages = [
+        {"type": "http.request", "body": b"abc", "more_body": True},
+        {"type": "http.request", "body": b"def", "more_body": True},
+        {"type": "http.request", "body": b"ghi", "more_body": False},
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def read_all(tee):
+        return [await tee() for _ in range(3)]
+
+    tee = BodyTee(receive, max_length=5)
+    received = asyncio.run(read_all(tee))
+    assert [message["body"] for message in received] == [b"abc", b"def", b"ghi"]
+    assert tee.decode() == "abcde"
+
+
 @pytest.mark.parametrize(
     "elasticapm_client",
     [
@@ -614,6 +614,21 @@ def test_post_read_error_logging(django_elasticapm_client, caplog, rf):
     assert_any_record_contains(caplog.records, "Can't capture request body: foobar")
 
 
+@pytest.mark.parametrize(
+    "django_elasticapm_client",
+    [{"capture_body": "all", "transaction_request_fields": "body,url"}],
+    indirect=True,
+)
+def test_transaction_request_fields(django_elasticapm_client, client):
+    with override_settings(
+        **middleware_setting(django.VERSION, ["elasticapm.contrib.django.middleware.TracingMiddleware"])
+    ):
+        client.post(reverse("elasticapm-no-error"), "foobar", content_type="text/plain")
+    request = django_elasticapm_client.events[TRANSACTION][0]["context"]["request"]
+    assert set(request.keys()) == {"method", "body", "url"}
+    assert request["body"] == b"foobar"
+
+
 @pytest.mark.skipif(django.VERSION < (1, 9), reason="get-raw-uri-not-available")
 def test_disallowed_hosts_error_django_19(django_elasticapm_client):
     request = WSGIRequest(
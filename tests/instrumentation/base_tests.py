@@ -31,6 +31,7 @@
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import logging
+import sys
 import types
 
 import mock
@@ -39,8 +40,10 @@ import pytest
 import elasticapm
 from elasticapm.conf import constants
 from elasticapm.conf.constants import SPAN, TRANSACTION
+from elasticapm.instrumentation.control import get_instrumentation_report
 from elasticapm.instrumentation.packages.base import AbstractInstrumentedModule
 from elasticapm.utils import wrapt
+from elasticapm.utils.wrapt import importer
 from tests.utils import assert_any_record_contains
 
 
@@ -152,6 +155,79 @@ def test_skip_instrument_env_var(caplog):
     assert not instrumentation.instrumented
 
 
+class _TestLazyInstrumentation(AbstractInstrumentedModule):
+    name = "test_lazy_instrument"
+
+    instrument_list = [("lazy_instrumentation_test_module", "Lazy.lazy")]
+
+    def call(self, module, method, wrapped, instance, args, kwargs):
+        return wrapped(*args, **kwargs)
+
+
+@pytest.fixture()
+def lazy_module_path(tmp_path):
+    tmp_path.joinpath("lazy_instrumentation_test_module.py").write_text(
+        "class Lazy(object):\n    def lazy(self):\n        pass\n"
+    )
+    sys.path.insert(0, str(tmp_path))
+    yield
+    sys.path.remove(str(tmp_path))
+    sys.modules.pop("lazy_instrumentation_test_module", None)
+    # the import hook registry doesn't cope with modules being removed from sys.modules
+    importer._post_import_hooks.pop("lazy_instrumentation_test_module", None)
+
+
+def test_instrument_deferred_until_import(lazy_module_path):
+    instrumentation = _TestLazyInstrumentation()
+    instrumentation.instrument()
+    try:
+        assert "lazy_instrumentation_test_module" not in sys.modules
+        assert instrumentation.instrumented
+        assert instrumentation.waiting_for == {"lazy_instrumentation_test_module"}
+        assert not instrumentation.originals
+
+        import lazy_instrumentation_test_module
+
+        assert isinstance(lazy_instrumentation_test_module.Lazy.lazy, wrapt.BoundFunctionWrapper)
+        assert not instrumentation.waiting_for
+        assert ("lazy_instrumentation_test_module", "Lazy.lazy") in instrumentation.originals
+    finally:
+        instrumentation.uninstrument()
+    assert not isinstance(lazy_instrumentation_test_module.Lazy.lazy, wrapt.BoundFunctionWrapper)
+
+
+def test_uninstrument_before_import(lazy_module_path):
+    instrumentation = _TestLazyInstrumentation()
+    instrumentation.instrument()
+    instrumentation.uninstrument()
+    assert not instrumentation.waiting_for
+
+    import lazy_instrumentation_test_module
+
+    assert not isinstance(lazy_instrumentation_test_module.Lazy.lazy, wrapt.BoundFunctionWrapper)
+
+    # instrumenting again patches right away, as the module is imported now
+    instrumentation.instrument()
+    try:
+        assert isinstance(lazy_instrumentation_test_module.Lazy.lazy, wrapt.BoundFunctionWrapper)
+    finally:
+        instrumentation.uninstrument()
+
+
+def test_instrumentation_report():
+    instrumentation = _TestDummyInstrumentation()
+    with mock.patch("elasticapm.instrumentation.register.get_instrumentation_objects", return_value=[instrumentation]):
+        assert get_instrumentation_report() == {}
+        instrumentation.instrument()
+        try:
+            report = get_instrumentation_report()
+        finally:
+            instrumentation.uninstrument()
+    assert report["test_dummy_instrument"]["instrumented"] == ["tests.instrumentation.base_tests.Dummy.dummy"]
+    assert report["test_dummy_instrument"]["waiting_for"] == []
+    assert report["test_dummy_instrument"]["duration"] > 0
+
+
 def test_skip_ignored_frames(elasticapm_client):
     elasticapm_client.begin_transaction("test")
     with elasticapm.capture_span("test"):
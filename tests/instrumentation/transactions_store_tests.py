@@ -32,14 +32,15 @@ import decimal
 import logging
 import time
 from collections import defaultdict
+from datetime import timedelta
 
 import mock
 import pytest
 
 import elasticapm
 from elasticapm.conf import Config, VersionedConfig
-from elasticapm.conf.constants import SPAN, TRANSACTION
-from elasticapm.traces import Tracer, capture_span, execution_context
+from elasticapm.conf.constants import ERROR, SPAN, TRANSACTION
+from elasticapm.traces import LazyContext, Tracer, capture_span, execution_context
 from elasticapm.utils.disttracing import TraceParent
 from tests.utils import assert_any_record_contains
 
@@ -441,6 +442,63 @@ def test_dedot_context_keys(elasticapm_client):
     assert transaction["context"]["custom"] == {"s_t_a_r": "s_t_a_r", "q_u_o_t_e": "q_u_o_t_e", "d_o_t": "d_o_t"}
 
 
+def test_lazy_context(elasticapm_client):
+    loader = mock.Mock(return_value={"method": "GET", "url": {"full": "http://example.com"}})
+    elasticapm_client.begin_transaction("test")
+    elasticapm.set_context(LazyContext(loader), "request")
+    elasticapm.set_context({"method": "POST"}, "request")
+    assert loader.call_count == 0
+    elasticapm_client.end_transaction("foo", 200)
+    transaction = elasticapm_client.events[TRANSACTION][0]
+    assert loader.call_count == 1
+    assert transaction["context"]["request"] == {"method": "POST", "url": {"full": "http://example.com"}}
+
+
+@pytest.mark.parametrize("elasticapm_client", [{"transactions_ignore_patterns": ["^ignored"]}], indirect=True)
+def test_lazy_context_not_loaded_for_ignored_transaction(elasticapm_client):
+    loader = mock.Mock(return_value={"method": "GET"})
+    elasticapm_client.begin_transaction("test")
+    elasticapm.set_context(LazyContext(loader), "request")
+    elasticapm_client.end_transaction("ignored", 200)
+    assert loader.call_count == 0
+    assert not elasticapm_client.events[TRANSACTION]
+
+
+def test_lazy_context_used_in_errors(elasticapm_client):
+    elasticapm_client.begin_transaction("test")
+    elasticapm.set_context(LazyContext(lambda: {"method": "GET"}), "request")
+    elasticapm_client.capture_message("x")
+    elasticapm_client.end_transaction("foo", 200)
+    assert elasticapm_client.events[ERROR][0]["context"]["request"] == {"method": "GET"}
+    assert elasticapm_client.events[TRANSACTION][0]["context"]["request"] == {"method": "GET"}
+
+
+def test_lazy_context_loader_failure(elasticapm_client, caplog):
+    def loader():
+        raise ValueError()
+
+    elasticapm_client.begin_transaction("test")
+    elasticapm.set_context(LazyContext(loader))
+    with caplog.at_level(logging.WARNING, "elasticapm.traces"):
+        elasticapm_client.end_transaction("foo", 200)
+    assert_any_record_contains(caplog.records, "Failed to capture context data")
+    assert "custom" not in elasticapm_client.events[TRANSACTION][0]["context"]
+
+
+def test_lazy_request_context_loader_failure(elasticapm_client):
+    def loader():
+        raise ValueError()
+
+    elasticapm_client.begin_transaction("test")
+    elasticapm.set_context(LazyContext(loader), "request")
+    # a request context without method would be rejected by the APM Server
+    elasticapm.set_context({"headers": {"foo": "bar"}}, "request")
+    elasticapm_client.capture_message("x")
+    elasticapm_client.end_transaction("foo", 200)
+    assert "request" not in elasticapm_client.events[ERROR][0]["context"]
+    assert "request" not in elasticapm_client.events[TRANSACTION][0]["context"]
+
+
 def test_transaction_name_none_is_converted_to_empty_string(elasticapm_client):
     elasticapm_client.begin_transaction("test")
     transaction = elasticapm_client.end_transaction(None, 200)
@@ -493,6 +551,48 @@ def test_span_labelling(elasticapm_client):
     assert span["context"]["tags"] == {"foo": "bar", "ba_z": "baz.zinga", "lorem": "ipsum"}
 
 
+def test_span_lazy_attributes(elasticapm_client):
+    transaction = elasticapm_client.begin_transaction("test")
+    with capture_span("parent", "type") as parent:
+        with capture_span("child", "type", leaf=True, duration=0.5) as child:
+            pass
+    elasticapm_client.end_transaction("test", "OK")
+
+    assert not hasattr(child, "__dict__")
+    assert not hasattr(transaction, "__dict__")
+    # locks, labels and context are only created when needed
+    assert child._lock is None
+    assert child._labels is None
+    assert child._context is None
+    assert parent._lock is not None
+    assert child.duration == timedelta(seconds=0.5)
+    assert elasticapm_client.events[SPAN][0]["duration"] == 500
+
+
+@pytest.mark.parametrize(
+    "context,leaf,expected",
+    [
+        ({"db": {"instance": "users"}}, False, "postgresql/users"),
+        ({"message": {"queue": {"name": "jobs"}}}, False, "postgresql/jobs"),
+        ({"http": {"url": "http://example.com:8080/foo"}}, False, "example.com:8080"),
+        ({"db": {"type": "sql"}}, False, "postgresql"),
+        ({"foo": "bar"}, True, "postgresql"),
+        ({"foo": "bar"}, False, None),
+        ({"db": {"instance": "users"}, "destination": {"service": {"resource": "known"}}}, False, "known"),
+    ],
+)
+def test_span_autofill_resource_context(elasticapm_client, context, leaf, expected):
+    elasticapm_client.begin_transaction("test")
+    with capture_span("test", "db", span_subtype="postgresql", extra=context, leaf=leaf):
+        pass
+    elasticapm_client.end_transaction("test", "OK")
+    span = elasticapm_client.events[SPAN][0]
+    if expected is None:
+        assert "destination" not in span["context"]
+    else:
+        assert span["context"]["destination"]["service"]["resource"] == expected
+
+
 def test_span_sync(elasticapm_client):
     elasticapm_client.begin_transaction("test")
     with capture_span("foo", "type", sync=True):
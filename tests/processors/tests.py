@@ -34,6 +34,7 @@ from __future__ import absolute_import
 
 import logging
 import os
+import re
 
 import mock
 import pytest
@@ -41,6 +42,7 @@ import pytest
 import elasticapm
 from elasticapm import Client, processors
 from elasticapm.conf.constants import BASE_SANITIZE_FIELD_NAMES_UNPROCESSED, ERROR, SPAN, TRANSACTION
+from elasticapm.utils import starmatch_to_regex
 from tests.utils import assert_any_record_contains
 
 
@@ -345,6 +347,53 @@ def test_sanitize_dict():
     assert result == {1: 2}
 
 
+@pytest.mark.parametrize(
+    "patterns",
+    [
+        [starmatch_to_regex(pattern) for pattern in BASE_SANITIZE_FIELD_NAMES_UNPROCESSED + ["(?-i)Foo*"]],
+        # can't be combined into a single regex, and are matched one by one
+        [starmatch_to_regex("password"), re.compile("sec", re.ASCII)],
+        [],
+    ],
+)
+def test_field_name_matcher(patterns):
+    matcher = processors._FieldNameMatcher(patterns)
+    for key in ("password", " PASSWORD ", "api_key", "csrftoken", "foo", "Foobar", "foobar", "secret", "x-auth"):
+        assert matcher(key) == any(pattern.match(key.lower().strip()) for pattern in patterns), key
+        assert matcher(key) == matcher.memo[key]
+
+
+def test_field_name_matcher_follows_sanitize_field_names():
+    processors._sanitize("foo", "bar")
+    first_matcher = processors._field_name_matcher
+    assert processors._sanitize("foo", "bar", sanitize_field_names=[starmatch_to_regex("foo")]) == processors.MASK
+    assert processors._field_name_matcher is not first_matcher
+    assert processors._sanitize("foo", "bar") == "bar"
+
+
+def test_field_name_matcher_shared_by_equal_field_names():
+    first = [starmatch_to_regex("foo")]
+    second = [starmatch_to_regex("foo")]
+    assert processors._sanitize("foo", "bar", sanitize_field_names=first) == processors.MASK
+    matcher = processors._field_name_matcher
+    with mock.patch.object(processors, "_FieldNameMatcher") as matcher_class:
+        for field_names in (second, first, second):
+            assert processors._sanitize("foo", "bar", sanitize_field_names=field_names) == processors.MASK
+            assert processors._field_name_matcher is matcher
+    assert not matcher_class.called
+
+
+def test_field_name_matcher_memo_is_bounded():
+    matcher = processors._FieldNameMatcher([starmatch_to_regex("password")])
+    with mock.patch.object(processors, "_FIELD_NAME_MEMO_MAX", 2):
+        for key in ("a", "b", "password"):
+            matcher(key)
+        # the memo is cleared once it is full, so new field names are still remembered
+        assert matcher.memo == {"password": True}
+        matcher("c")
+    assert matcher.memo == {"password": True, "c": False}
+
+
 def test_non_utf8_encoding(elasticapm_client, http_test_data):
     broken = "broken=".encode("latin-1") + u"aéöüa".encode("latin-1")
     http_test_data["context"]["request"]["headers"]["cookie"] = broken
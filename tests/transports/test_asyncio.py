@@ -0,0 +1,171 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pytest  # isort:skip
+
+aiohttp = pytest.importorskip("aiohttp")  # isort:skip
+
+import asyncio
+import gzip
+import json
+import threading
+
+import mock
+
+from elasticapm.transport.asyncio import AsyncioTransport
+from elasticapm.transport.exceptions import TransportException
+
+pytestmark = [pytest.mark.aiohttp]
+
+
+def _received_events(httpserver):
+    return [
+        json.loads(line)
+        for request in httpserver.requests
+        for line in gzip.decompress(request.data).decode("utf-8").splitlines()
+    ]
+
+
+def test_dedicated_event_loop(waiting_httpserver, elasticapm_client):
+    elasticapm_client.server_version = (8, 0)  # avoid making server_info request
+    waiting_httpserver.serve_content(code=202, content="")
+    transport = AsyncioTransport(waiting_httpserver.url, client=elasticapm_client)
+    transport.start_thread()
+    try:
+        transport.queue("error", {"id": 1})
+        transport.flush()
+        assert transport._loop_thread.is_alive()
+        events = _received_events(waiting_httpserver)
+        assert "metadata" in events[0]
+        assert events[1] == {"error": {"id": 1}}
+        assert waiting_httpserver.requests[0].args["flushed"] == "true"
+    finally:
+        transport.close()
+    transport._loop_thread.join(timeout=1)
+    assert not transport._loop_thread.is_alive()
+
+
+@pytest.mark.asyncio
+async def test_running_event_loop(waiting_httpserver, elasticapm_client):
+    elasticapm_client.server_version = (8, 0)  # avoid making server_info request
+    waiting_httpserver.serve_content(code=202, content="")
+    transport = AsyncioTransport(waiting_httpserver.url, client=elasticapm_client)
+    transport.start_thread()
+    try:
+        assert transport._loop is asyncio.get_event_loop()
+        assert transport._loop_thread is None
+        transport.queue("error", {"id": 1})
+        transport.queue("transaction", {"id": 2}, flush=True)
+        for _ in range(100):
+            if waiting_httpserver.requests:
+                break
+            await asyncio.sleep(0.01)
+        events = _received_events(waiting_httpserver)
+        assert events[1:] == [{"error": {"id": 1}}, {"transaction": {"id": 2}}]
+    finally:
+        transport.close()
+        # wait for the event processor task to finish
+        await asyncio.wait([task for task in asyncio.all_tasks() if task is not asyncio.current_task()])
+
+
+@pytest.mark.asyncio
+async def test_events_processed_outside_event_loop(waiting_httpserver, elasticapm_client):
+    elasticapm_client.server_version = (8, 0)  # avoid making server_info request
+    waiting_httpserver.serve_content(code=202, content="")
+    threads = set()
+
+    def processor(client, event):
+        threads.add(threading.get_ident())
+        return event
+
+    transport = AsyncioTransport(waiting_httpserver.url, client=elasticapm_client, processors=[processor])
+    transport.batch_size = 2
+    transport.start_thread()
+    try:
+        for i in range(5):
+            transport.queue("error", {"id": i})
+        transport.queue("transaction", {"id": 5}, flush=True)
+        for _ in range(100):
+            if waiting_httpserver.requests:
+                break
+            await asyncio.sleep(0.01)
+        events = _received_events(waiting_httpserver)
+        assert events[1:] == [{"error": {"id": i}} for i in range(5)] + [{"transaction": {"id": 5}}]
+        assert threads and threading.get_ident() not in threads
+    finally:
+        transport.close()
+        # wait for the event processor task to finish
+        await asyncio.wait([task for task in asyncio.all_tasks() if task is not asyncio.current_task()])
+
+
+@pytest.mark.asyncio
+async def test_http_error(waiting_httpserver, elasticapm_client):
+    waiting_httpserver.serve_content(code=400, content="invalid")
+    transport = AsyncioTransport(waiting_httpserver.url, client=elasticapm_client)
+    try:
+        with pytest.raises(TransportException) as exc_info:
+            await transport.send_async(b"x")
+        assert "HTTP 400: invalid" in str(exc_info.value)
+        assert not exc_info.value.retryable
+    finally:
+        await transport.session.close()
+
+
+@pytest.mark.asyncio
+async def test_send_without_client_timeout(waiting_httpserver, elasticapm_client):
+    # aiohttp < 3.3 has no ClientTimeout
+    waiting_httpserver.serve_content(code=202, content="")
+    transport = AsyncioTransport(waiting_httpserver.url, client=elasticapm_client)
+    try:
+        with mock.patch.object(transport.session, "post", wraps=transport.session.post) as post, mock.patch.object(
+            aiohttp, "ClientTimeout", create=True
+        ):
+            del aiohttp.ClientTimeout
+            await transport.send_async(b"x")
+        assert post.call_args[1]["timeout"] == transport._timeout
+        assert waiting_httpserver.requests[0].data == b"x"
+    finally:
+        await transport.session.close()
+
+
+def test_close_after_event_loop_is_closed(waiting_httpserver, elasticapm_client):
+    elasticapm_client.server_version = (8, 0)  # avoid making server_info request
+    waiting_httpserver.serve_content(code=202, content="")
+    transport = AsyncioTransport(waiting_httpserver.url, client=elasticapm_client)
+    transport.start_thread()
+
+    async def queue_event():
+        transport.queue("error", {"id": 1})
+
+    asyncio.run(queue_event())
+    assert not waiting_httpserver.requests
+    # the event is sent with a blocking request
+    transport.close()
+    assert _received_events(waiting_httpserver)[1] == {"error": {"id": 1}}
@@ -29,16 +29,22 @@
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import gzip
+import json
+import os
+import queue as _queue
 import random
 import string
+import threading
 import time
 import timeit
 
 import mock
 import pytest
 
-from elasticapm.transport.base import Transport, TransportState
+from elasticapm.transport.base import DequeQueue, Transport, TransportState
+from elasticapm.transport.buffer import StreamingBody
 from elasticapm.transport.exceptions import TransportException
+from elasticapm.transport.spool import DiskSpool
 from tests.fixtures import DummyTransport, TempStoreClient
 from tests.utils import assert_any_record_contains
 
@@ -106,7 +112,11 @@ def test_empty_queue_flush(mock_send, elasticapm_client):
 
 
 @mock.patch("elasticapm.transport.base.Transport.send")
-@pytest.mark.parametrize("elasticapm_client", [{"api_request_time": "5s"}], indirect=True)
+@pytest.mark.parametrize(
+    "elasticapm_client",
+    [{"api_request_time": "5s"}, {"api_request_time": "5s", "event_queue_type": "deque"}],
+    indirect=True,
+)
 def test_metadata_prepended(mock_send, elasticapm_client):
     transport = Transport(client=elasticapm_client, compress_level=0)
     transport.start_thread()
@@ -264,3 +274,285 @@ def test_flushed_arg(sending_elasticapm_client):
     sending_elasticapm_client._transport.flush()
 
     assert sending_elasticapm_client.httpserver.requests[0].args["flushed"] == "true"
+
+
+@pytest.mark.parametrize(
+    "elasticapm_client", [{"api_request_concurrency": 2, "api_request_size": "100b"}], indirect=True
+)
+def test_slow_send_does_not_block_event_processing(elasticapm_client):
+    send_started = threading.Event()
+    release_send = threading.Event()
+
+    def slow_send(data, forced_flush=False):
+        send_started.set()
+        release_send.wait(timeout=5)
+
+    transport = Transport(client=elasticapm_client, compress_level=0, queue_chill_count=1)
+    transport.send = mock.Mock(side_effect=slow_send)
+    transport.start_thread()
+    try:
+        assert len(transport._send_threads) == 2
+        transport.queue("error", "x" * 100000)
+        assert send_started.wait(timeout=1)
+        # the first request is still in flight, but the event processor thread continues to process events
+        transport.queue("error", "y" * 100000)
+        time.sleep(0.2)
+        assert transport._event_queue.qsize() == 0
+        assert transport.send.call_count == 2
+    finally:
+        release_send.set()
+        transport.close()
+
+
+@pytest.mark.parametrize("elasticapm_client", [{"api_request_concurrency": 3}], indirect=True)
+def test_flush_waits_for_sender_threads(elasticapm_client):
+    sent = []
+
+    def slow_send(data, forced_flush=False):
+        time.sleep(0.1)
+        sent.append(forced_flush)
+
+    transport = Transport(client=elasticapm_client, compress_level=0)
+    transport.send = mock.Mock(side_effect=slow_send)
+    transport.start_thread()
+    try:
+        transport.queue("error", {})
+        transport.flush()
+        assert sent == [True]
+    finally:
+        transport.close()
+    assert transport._send_queue is None
+    assert transport._send_threads == []
+
+
+def test_deque_queue_chill():
+    queue = DequeQueue(chill_until=2, max_chill_time=10)
+    queue.put(1)
+    queue.put(2)
+    assert not queue._not_empty.is_set()
+    queue.put(3)
+    assert queue._not_empty.is_set()
+    assert [queue.get(block=False) for _ in range(3)] == [1, 2, 3]
+    with pytest.raises(_queue.Empty):
+        queue.get(block=False)
+    queue.put(4, chill=False)
+    assert queue.get(timeout=0.1) == 4
+
+
+def test_deque_queue_get_timeout():
+    queue = DequeQueue(chill_until=2, max_chill_time=10)
+    start = timeit.default_timer()
+    with pytest.raises(_queue.Empty):
+        queue.get(timeout=0.05)
+    assert timeit.default_timer() - start >= 0.05
+    # a chilled item doesn't wake up the consumer, but it is returned once the timeout expired
+    threading.Timer(0.01, queue.put, args=("x",)).start()
+    assert queue.get(timeout=0.1) == "x"
+
+
+def test_deque_queue_full():
+    queue = DequeQueue(maxsize=2)
+    queue.put(1)
+    queue.put(2)
+    with pytest.raises(_queue.Full):
+        queue.put(3)
+    assert queue.qsize() == 2
+
+
+@mock.patch("elasticapm.transport.base.Transport.send")
+@pytest.mark.parametrize("elasticapm_client", [{"event_queue_type": "deque"}], indirect=True)
+def test_deque_queue_multiple_producers(mock_send, elasticapm_client):
+    transport = Transport(client=elasticapm_client, compression="none")
+    assert isinstance(transport._event_queue, DequeQueue)
+    transport.start_thread()
+
+    def produce(thread_id):
+        for i in range(250):
+            transport.queue("error", {"id": "%d-%d" % (thread_id, i)})
+
+    try:
+        threads = [threading.Thread(target=produce, args=(thread_id,)) for thread_id in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        transport.flush()
+    finally:
+        transport.close()
+    events = [
+        json.loads(line)
+        for args, kwargs in mock_send.call_args_list
+        for line in bytes(args[0]).decode("utf-8").splitlines()
+    ]
+    received = [event["error"]["id"] for event in events if "error" in event]
+    assert sorted(received) == sorted("%d-%d" % (thread_id, i) for thread_id in range(8) for i in range(250))
+
+
+@mock.patch("elasticapm.transport.base.Transport.send")
+@pytest.mark.parametrize(
+    "elasticapm_client",
+    [{"metrics_sets": "elasticapm.metrics.sets.transport.TransportMetricSet", "api_request_compression": "none"}],
+    indirect=True,
+)
+def test_uncompressed_flush_metrics(mock_send, elasticapm_client):
+    transport = Transport(client=elasticapm_client, compression="none")
+    transport.start_thread()
+    transport.queue("error", {"foo": "bar"}, flush=True)
+    transport.close()
+    assert mock_send.call_count == 1
+    args, kwargs = mock_send.call_args
+    data = bytes(args[0]).decode("utf-8").split("\n")
+    assert "metadata" in data[0]
+    assert data[1] == '{"error": {"foo": "bar"}}' or data[1] == '{"error":{"foo":"bar"}}'
+    metricset = elasticapm_client._metrics.get_metricset("elasticapm.metrics.sets.transport.TransportMetricSet")
+    samples = list(metricset.collect())[0]["samples"]
+    assert samples["agent.transport.flushes"]["value"] == 1
+    assert samples["agent.transport.bytes.uncompressed"]["value"] == len(args[0])
+    assert samples["agent.transport.compression.ratio"]["value"] == 1.0
+
+
+@mock.patch("elasticapm.transport.base.Transport.send")
+def test_spool_during_back_off_and_replay(mock_send, elasticapm_client, tmpdir):
+    elasticapm_client.config.update(version="1", spool_directory=str(tmpdir))
+    transport = Transport(client=elasticapm_client)
+    transport.start_thread()
+    try:
+        mock_send.side_effect = TransportException("meh")
+        transport.queue("error", {"id": 1})
+        transport.flush()
+        assert transport.state.did_fail()
+        # the first retry is allowed immediately, the third flush is spooled during the back-off interval
+        transport.queue("error", {"id": 2})
+        transport.flush()
+        transport.queue("error", {"id": 3})
+        transport.flush()
+        assert mock_send.call_count == 2
+        assert len(transport._spool) > 0
+
+        mock_send.reset_mock()
+        mock_send.side_effect = None
+        transport.state.set_success()
+        transport.queue("error", {"id": 4})
+        transport.flush()
+        events = [
+            json.loads(line)
+            for args, kwargs in mock_send.call_args_list
+            for line in gzip.decompress(args[0]).decode("utf-8").splitlines()
+        ]
+        ids = [event["error"]["id"] for event in events if "error" in event]
+        assert ids == [4, 1, 2, 3]
+        assert transport._spool.peek() is None
+    finally:
+        transport.close()
+
+
+@pytest.mark.parametrize("spooled_compression,compression", [("none", "gzip"), ("gzip", "none")])
+@mock.patch("elasticapm.transport.base.Transport.send")
+def test_spool_replay_with_other_compression(mock_send, spooled_compression, compression, elasticapm_client, tmpdir):
+    elasticapm_client.config.update(version="1", spool_directory=str(tmpdir))
+    payload = b'{"error": {"id": 1}}\n'
+    # e.g. spooled by an earlier process with another api_request_compression
+    spool = DiskSpool(str(tmpdir), max_size=1024)
+    spool.append(gzip.compress(payload) if spooled_compression == "gzip" else payload, encoding=spooled_compression)
+    spool.release()
+    os.rename(os.path.join(str(tmpdir), str(os.getpid())), os.path.join(str(tmpdir), "1"))
+
+    transport = Transport(client=elasticapm_client, compression=compression)
+    transport.start_thread()
+    try:
+        transport.queue("error", {"id": 2})
+        transport.flush()
+        bodies = [bytes(args[0]) for args, kwargs in mock_send.call_args_list]
+        assert len(bodies) == 2
+        # the replayed payload matches the Content-Encoding of the transport
+        assert (gzip.decompress(bodies[1]) if compression == "gzip" else bodies[1]) == payload
+    finally:
+        transport.close()
+
+
+@mock.patch("elasticapm.transport.base.Transport.send")
+def test_rejected_data_is_not_spooled(mock_send, elasticapm_client, tmpdir):
+    elasticapm_client.config.update(version="1", spool_directory=str(tmpdir))
+    transport = Transport(client=elasticapm_client)
+    transport.start_thread()
+    try:
+        mock_send.side_effect = TransportException("HTTP 400: invalid", retryable=False)
+        transport.queue("error", {"id": 1})
+        transport.flush()
+        assert transport._spool.peek() is None
+    finally:
+        transport.close()
+
+
+@mock.patch("elasticapm.transport.base.Transport.send")
+def test_metadata_serialized_once(mock_send, elasticapm_client):
+    transport = Transport(client=elasticapm_client, compression="none")
+    serializer = mock.Mock(wraps=transport._json_serializer)
+    transport._json_serializer = serializer
+    transport.start_thread()
+    try:
+        for i in range(2):
+            transport.queue("error", {})
+            transport.flush()
+        transport.add_metadata({"service": {"node": {"name": "foo"}}})
+        transport.queue("error", {})
+        transport.flush()
+    finally:
+        transport.close()
+    metadata_calls = [args for args, kwargs in serializer.call_args_list if "metadata" in args[0]]
+    assert len(metadata_calls) == 2
+    bodies = [bytes(args[0]).decode("utf-8").split("\n") for args, kwargs in mock_send.call_args_list]
+    assert bodies[0][0] == bodies[1][0]
+    assert json.loads(bodies[2][0])["metadata"]["service"]["node"]["name"] == "foo"
+
+
+@mock.patch("elasticapm.transport.base.Transport.send")
+def test_failed_streaming_request_is_spooled(mock_send, elasticapm_client, tmpdir):
+    elasticapm_client.config.update(version="1", api_request_streaming=True, spool_directory=str(tmpdir))
+
+    def send(data, forced_flush=False):
+        if forced_flush:
+            # the empty request that signals the forced flush
+            return
+        assert isinstance(data, StreamingBody)
+        next(iter(data))
+        raise TransportException("connection reset")
+
+    mock_send.side_effect = send
+    transport = Transport(client=elasticapm_client)
+    transport.start_thread()
+    try:
+        transport.queue("error", {"id": 1})
+        transport.flush()
+        data, encoding, token = transport._spool.peek()
+        lines = gzip.decompress(data).decode("utf-8").splitlines()
+        assert json.loads(lines[1]) == {"error": {"id": 1}}
+    finally:
+        transport.close()
+
+
+@mock.patch("elasticapm.transport.base.Transport.send")
+def test_deferred_event_serialized_on_transport_thread(mock_send, elasticapm_client, caplog):
+    threads = []
+
+    def to_dict():
+        threads.append(threading.current_thread())
+        return {"id": "foo"}
+
+    def fail():
+        raise ValueError()
+
+    transport = Transport(client=elasticapm_client, compression="none")
+    transport.start_thread()
+    try:
+        with caplog.at_level("WARNING", "elasticapm.transport"):
+            transport.queue("span", to_dict)
+            transport.queue("span", fail)
+            transport.flush()
+    finally:
+        transport.close()
+    assert threads and threads[0] is not threading.current_thread()
+    body = bytes(mock_send.call_args[0][0]).decode("utf-8").split("\n")
+    assert json.loads(body[1]) == {"span": {"id": "foo"}}
+    assert len([line for line in body if line]) == 2
+    assert_any_record_contains(caplog.records, "due to exception during serialization", "elasticapm.transport")
@@ -0,0 +1,108 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import gzip
+import random
+import string
+import threading
+
+from elasticapm.transport.buffer import EventBuffer, StreamingBody
+
+
+def test_gzip_buffer():
+    buffer = EventBuffer(compression="gzip", compress_level=5)
+    buffer.write(b'{"foo": "bar"}\n')
+    buffer.write(b'{"baz": 1}\n')
+    assert buffer.uncompressed_size == 26
+    data = buffer.close()
+    assert gzip.decompress(data) == b'{"foo": "bar"}\n{"baz": 1}\n'
+    # closing a second time returns the same data
+    assert buffer.close() == data
+
+
+def test_uncompressed_buffer():
+    buffer = EventBuffer(compression="none")
+    buffer.write(b'{"foo": "bar"}\n')
+    data = buffer.close()
+    assert bytes(data) == b'{"foo": "bar"}\n'
+    assert buffer.compression_time == 0
+
+
+def test_buffer_compresses_in_chunks():
+    buffer = EventBuffer(compression="none", chunk_size=100)
+    buffer.write(b"x" * 60)
+    assert buffer.tell() == 0
+    buffer.write(b"x" * 60)
+    assert buffer.tell() == 120
+    buffer.write(b"x" * 10)
+    assert buffer.tell() == 120
+    assert len(buffer.close()) == 130
+
+
+def test_gzip_buffer_large_payload():
+    payload = "".join(random.choice(string.ascii_letters) for i in range(100000)).encode("ascii")
+    buffer = EventBuffer(compression="gzip", compress_level=9, chunk_size=1024)
+    for i in range(0, len(payload), 1000):
+        buffer.write(payload[i : i + 1000])
+    assert buffer.tell() > 0
+    data = buffer.close()
+    assert gzip.decompress(data) == payload
+    assert len(data) < len(payload)
+    assert buffer.compression_time > 0
+
+
+def test_drain():
+    buffer = EventBuffer(compression="gzip", compress_level=5, chunk_size=100)
+    buffer.write(b"foo\n")
+    assert buffer.drain(compress_pending=False) == b""
+    chunks = [buffer.drain()]
+    buffer.write(b"bar\n")
+    buffer.write(b"baz\n")
+    chunks.append(buffer.drain())
+    assert buffer.drain() == b""
+    data = buffer.close()
+    chunks.append(buffer.drain())
+    assert b"".join(chunks) == bytes(data)
+    assert gzip.decompress(data) == b"foo\nbar\nbaz\n"
+
+
+def test_streaming_body():
+    body = StreamingBody()
+    received = []
+    thread = threading.Thread(target=lambda: received.extend(body))
+    thread.start()
+    body.write(b"foo")
+    body.write(b"")
+    body.write(b"bar")
+    body.close(b"foobar")
+    thread.join(timeout=1)
+    assert received == [b"foo", b"bar"]
+    assert body.size == 6
+    assert body.data == b"foobar"
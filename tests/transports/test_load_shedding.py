@@ -0,0 +1,103 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import mock
+
+from elasticapm.transport.base import Transport
+from elasticapm.transport.load_shedding import LoadShedder
+
+
+def _update(shedder, queue_size, max_queue_size=100):
+    # make sure that the shed level is re-evaluated
+    shedder._last_update -= shedder.interval
+    return shedder.update(queue_size, max_queue_size)
+
+
+def test_level_is_raised_progressively_while_under_pressure():
+    shedder = LoadShedder(max_send_time=10)
+    assert shedder.update(90, 100) == LoadShedder.NONE  # less than `interval` since the last evaluation
+    assert _update(shedder, 90) == LoadShedder.SKIP_SPAN_FRAMES
+    assert _update(shedder, 90) == LoadShedder.DROP_INTERNAL_SPANS
+    for _ in range(10):
+        _update(shedder, 90)
+    assert shedder.level == LoadShedder.MAX_LEVEL
+
+
+def test_level_is_raised_on_dropped_events_and_failed_or_slow_sends():
+    shedder = LoadShedder(max_send_time=10)
+    shedder.record_dropped_event()
+    assert _update(shedder, 0) == 1
+    shedder.record_send(1, success=False)
+    assert _update(shedder, 0) == 2
+    shedder.record_send(15, success=True)
+    shedder.record_send(7, success=True)
+    assert _update(shedder, 0) == 3
+    shedder.record_send(1, success=True)
+    assert _update(shedder, 0) == 3
+
+
+def test_level_is_lowered_after_cooldown():
+    shedder = LoadShedder(max_send_time=10, cooldown=10)
+    _update(shedder, 90)
+    _update(shedder, 90)
+    assert _update(shedder, 0) == 2
+    # queue is still above the low watermark
+    shedder._last_pressure -= 10
+    assert _update(shedder, 30) == 2
+    assert _update(shedder, 10) == 1
+    # cooldown is restarted after lowering the level
+    assert _update(shedder, 10) == 1
+    shedder._last_pressure -= 10
+    assert _update(shedder, 10) == 0
+
+
+def test_transaction_sample_rate():
+    shedder = LoadShedder(max_send_time=10)
+    shedder.level = LoadShedder.DROP_INTERNAL_SPANS
+    assert shedder.transaction_sample_rate(1.0) == 1.0
+    shedder.level = LoadShedder.REDUCE_SAMPLING
+    assert shedder.transaction_sample_rate(1.0) == 0.5
+    assert shedder.transaction_sample_rate(0) == 0
+    shedder.level = LoadShedder.REDUCE_SAMPLING + 2
+    assert shedder.transaction_sample_rate(0.5) == 0.0625
+    assert shedder.transaction_sample_rate(0.0001) == 0.0001
+
+
+@mock.patch("elasticapm.transport.base.Transport.send")
+def test_transport_records_sends(mock_send, elasticapm_client):
+    elasticapm_client.load_shedder = LoadShedder(max_send_time=10)
+    transport = Transport(client=elasticapm_client)
+    transport.start_thread()
+    try:
+        transport.queue("error", {})
+        transport.flush()
+        assert transport._load_shedder._send_count == 1
+    finally:
+        transport.close()
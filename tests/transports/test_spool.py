@@ -0,0 +1,150 @@
+#  BSD 3-Clause License
+#
+#  Copyright (c) 2019, Elasticsearch BV
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+#  * Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+#  DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+#  FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+#  DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+#  SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+#  CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+#  OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+
+import mock
+import pytest
+
+from elasticapm.transport.spool import DiskSpool, fcntl
+
+pytestmark = pytest.mark.skipif(not DiskSpool.is_supported(), reason="spool requires fcntl")
+
+
+def test_spool_fifo(tmpdir):
+    spool = DiskSpool(str(tmpdir), max_size=1024 * 1024, segment_size=100)
+    for i in range(10):
+        spool.append(b"payload %d" % i + b"x" * 30)
+    assert len(spool) > 1
+    received = []
+    while True:
+        spooled = spool.peek()
+        if spooled is None:
+            break
+        data, encoding, token = spooled
+        received.append(data[: data.index(b"x")])
+        spool.consume(token)
+    assert received == [b"payload %d" % i for i in range(10)]
+    assert len(spool) == 0
+    spool.close()
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_spool_peek_without_consume(tmpdir):
+    spool = DiskSpool(str(tmpdir), max_size=1024)
+    spool.append(b"foo")
+    spool.append(b"bar")
+    assert spool.peek()[0] == b"foo"
+    assert spool.peek()[0] == b"foo"
+    spool.consume(spool.peek()[2])
+    # appending after reading from the write segment starts a new segment
+    spool.append(b"baz")
+    assert spool.peek()[0] == b"bar"
+    spool.consume(spool.peek()[2])
+    assert spool.peek()[0] == b"baz"
+    spool.close()
+
+
+def test_spool_keeps_encoding(tmpdir):
+    spool = DiskSpool(str(tmpdir), max_size=1024)
+    spool.append(b"foo", encoding="gzip")
+    spool.append(b"bar")
+    data, encoding, token = spool.peek()
+    assert (data, encoding) == (b"foo", "gzip")
+    spool.consume(token)
+    assert spool.peek()[:2] == (b"bar", "")
+    spool.close()
+
+
+def test_spool_evicts_oldest_segment(tmpdir):
+    spool = DiskSpool(str(tmpdir), max_size=250, segment_size=100)
+    for i in range(10):
+        spool.append(bytes([i]) * 46)
+    assert spool.size <= 250
+    assert spool.dropped == 6
+    assert spool.peek()[0] == bytes([6]) * 46
+    spool.close()
+
+
+def test_spool_adopts_orphaned_segments(tmpdir):
+    spool = DiskSpool(str(tmpdir), max_size=1024)
+    spool.append(b"foo")
+    spool.append(b"bar")
+    spool.release()
+    # pretend the spool was left behind by a process that exited
+    os.rename(os.path.join(str(tmpdir), str(os.getpid())), os.path.join(str(tmpdir), "1"))
+
+    spool = DiskSpool(str(tmpdir), max_size=1024)
+    assert os.listdir(str(tmpdir)) == [str(os.getpid())]
+    data, encoding, token = spool.peek()
+    assert data == b"foo"
+    spool.consume(token)
+    assert spool.peek()[0] == b"bar"
+    spool.close()
+    # the spool isn't empty, so it is kept
+    assert os.listdir(str(tmpdir)) == [str(os.getpid())]
+
+
+def test_spool_lock_file_removed_before_locking(tmpdir):
+    directory = os.path.join(str(tmpdir), str(os.getpid()))
+    flock = fcntl.flock
+    calls = []
+
+    def adopt_then_flock(fd, operation):
+        if not calls:
+            # another process adopts the (still empty) directory after it was created, but before it is locked
+            os.unlink(os.path.join(directory, "lock"))
+            os.rmdir(directory)
+        calls.append(fd)
+        return flock(fd, operation)
+
+    with mock.patch.object(fcntl, "flock", side_effect=adopt_then_flock):
+        spool = DiskSpool(str(tmpdir), max_size=1024)
+    assert len(calls) == 2
+    assert os.path.samestat(os.fstat(spool._lock_fd), os.stat(os.path.join(directory, "lock")))
+    spool.append(b"foo")
+    assert spool.peek()[0] == b"foo"
+    spool.close()
+
+
+def test_spool_ignores_truncated_record(tmpdir):
+    spool = DiskSpool(str(tmpdir), max_size=1024)
+    spool.append(b"foo")
+    spool.release()
+    segment = os.path.join(str(tmpdir), str(os.getpid()), "%020d.seg" % 0)
+    with open(segment, "ab") as f:
+        f.write(b"\x00\x00\x00\x10\x00bar")
+
+    spool = DiskSpool(str(tmpdir), max_size=1024)
+    data, encoding, token = spool.peek()
+    assert data == b"foo"
+    spool.consume(token)
+    assert spool.peek() is None
+    spool.close()
@@ -29,6 +29,8 @@
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
+import gzip
+import json
 import os
 
 import certifi
@@ -422,3 +424,30 @@ def test_fetch_server_info_flat_string(waiting_httpserver, caplog, elasticapm_cl
         transport.fetch_server_info()
     assert elasticapm_client.server_version is None
     assert_any_record_contains(caplog.records, "No version key found in server response")
+
+
+@pytest.mark.parametrize("elasticapm_client", [{"api_request_streaming": True}], indirect=True)
+def test_streaming_request(waiting_httpserver, elasticapm_client):
+    elasticapm_client.server_version = (8, 0)  # avoid making server_info request
+    waiting_httpserver.serve_content(code=202, content="")
+    transport = Transport(waiting_httpserver.url, client=elasticapm_client)
+    transport.start_thread()
+    try:
+        transport.queue("error", {"id": 1})
+        transport.queue("error", {"id": 2})
+        transport.flush()
+        transport.queue("error", {"id": 3})
+        transport.flush()
+    finally:
+        transport.close()
+    # each forced flush closes the streaming request and signals the flush with an empty request
+    assert len(waiting_httpserver.requests) == 4
+    request = waiting_httpserver.requests[0]
+    assert request.headers["Transfer-Encoding"] == "chunked"
+    assert "flushed" not in request.args
+    lines = gzip.decompress(request.data).decode("utf-8").splitlines()
+    assert "metadata" in lines[0]
+    assert [json.loads(line) for line in lines[1:]] == [{"error": {"id": 1}}, {"error": {"id": 2}}]
+    for request in waiting_httpserver.requests[1::2]:
+        assert request.args["flushed"] == "true"
+        assert gzip.decompress(request.data) == b""
@@ -29,7 +29,9 @@
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import io
+import os
 
+import mock
 import pytest
 
 from elasticapm.utils import cgroup
@@ -91,3 +93,17 @@ def test_cgroup_parsing(test_input, expected):
     f = io.StringIO(test_input)
     result = cgroup.parse_cgroups(f)
     assert result == expected
+
+
+def test_cgroup_metadata_is_cached(tmpdir):
+    path = os.path.join(str(tmpdir), "cgroup")
+    with open(path, "w") as f:
+        f.write("12:devices:/docker/051e2ee0bce99116029a13df4a9e943137f19f957f38ac02d6bad96f9b700f76\n")
+    with mock.patch.object(cgroup, "CGROUP_PATH", path), mock.patch.object(cgroup, "_container_metadata", None):
+        result = cgroup.get_cgroup_container_metadata()
+        assert result == {"container": {"id": "051e2ee0bce99116029a13df4a9e943137f19f957f38ac02d6bad96f9b700f76"}}
+        os.unlink(path)
+        result["container"]["id"] = "modified"
+        assert cgroup.get_cgroup_container_metadata() == {
+            "container": {"id": "051e2ee0bce99116029a13df4a9e943137f19f957f38ac02d6bad96f9b700f76"}
+        }
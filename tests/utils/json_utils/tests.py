@@ -36,6 +36,9 @@ import datetime
 import decimal
 import uuid
 
+import mock
+import pytest
+
 from elasticapm.utils import json_encoder as json
 
 
@@ -72,3 +75,60 @@ def test_decimal():
 def test_unsupported():
     res = object()
     assert json.dumps(res).startswith('"<object object at')
+
+
+@pytest.mark.parametrize("name", ["stdlib", "orjson", "ujson"])
+def test_bytes_serializers(name):
+    if name != "stdlib":
+        pytest.importorskip(name)
+    serializer = json.get_bytes_serializer(name)
+    assert serializer is json.BYTES_SERIALIZERS[name][0]
+    value = {
+        "set": {"foo"},
+        "datetime": datetime.datetime(day=1, month=1, year=2011, hour=1, minute=1, second=1),
+        "bytes": b"foo\xffbar",
+        "decimal": decimal.Decimal("1.5"),
+        "unicode": "äöü",
+        "nested": {"list": [1, 2.5, None, True]},
+    }
+    result = serializer(value)
+    assert isinstance(result, bytes)
+    assert json.loads(result.decode("utf-8")) == {
+        "set": ["foo"],
+        "datetime": "2011-01-01T01:01:01.000000Z",
+        "bytes": "foo�bar",
+        "decimal": 1.5,
+        "unicode": "äöü",
+        "nested": {"list": [1, 2.5, None, True]},
+    }
+
+
+@pytest.mark.parametrize("name", ["orjson", "ujson"])
+def test_bytes_serializers_unsupported_values(name):
+    pytest.importorskip(name)
+    serializer = json.get_bytes_serializer(name)
+    # integers > 64 bit aren't supported by orjson, and invalid UTF-8 bytes aren't supported by some versions of ujson
+    value = {"int": 2**70, "bytes": b"\xff"}
+    assert json.loads(serializer(value).decode("utf-8")) == {"int": 2**70, "bytes": "\ufffd"}
+
+
+def test_bytes_serializer_not_installed():
+    with mock.patch.dict(json.BYTES_SERIALIZERS, {"orjson": (json.dumps_bytes_orjson, False)}):
+        assert json.get_bytes_serializer("orjson") is json.dumps_bytes
+
+
+def test_bytes_serializer_auto():
+    with mock.patch.dict(
+        json.BYTES_SERIALIZERS,
+        {"orjson": (json.dumps_bytes_orjson, False), "ujson": (json.dumps_bytes_ujson, True)},
+    ):
+        assert json.get_bytes_serializer("auto") is json.dumps_bytes_ujson
+    with mock.patch.dict(
+        json.BYTES_SERIALIZERS,
+        {"orjson": (json.dumps_bytes_orjson, False), "ujson": (json.dumps_bytes_ujson, False)},
+    ):
+        assert json.get_bytes_serializer("auto") is json.dumps_bytes
+
+
+def test_bytes_serializer_default_is_stdlib():
+    assert json.get_bytes_serializer() is json.dumps_bytes
@@ -32,11 +32,12 @@
 
 from __future__ import absolute_import
 
+import inspect
 import os
 import pkgutil
 
 import pytest
-from mock import Mock
+from mock import Mock, PropertyMock, patch
 
 import elasticapm
 from elasticapm.conf import constants
@@ -103,6 +104,87 @@ def test_traceback_hide(elasticapm_client):
     assert frames[0]["function"] == "get_me_a_filtered_frame"
 
 
+def test_traceback_hide_cell_variable(elasticapm_client):
+    def get_me_a_filtered_frame():
+        __traceback_hide__ = True
+
+        def inner():
+            return __traceback_hide__
+
+        inner()
+        return list(stacks.iter_stack_frames())
+
+    # `__traceback_hide__` is a cell variable here, as it is used by the nested function
+    assert "__traceback_hide__" in get_me_a_filtered_frame.__code__.co_cellvars
+    frames = list(stacks.get_stack_info(get_me_a_filtered_frame()))
+    assert frames[0]["function"] == "test_traceback_hide_cell_variable"
+
+
+def test_iter_stack_frames_snapshot():
+    def get_frames(snapshot):
+        return list(stacks.iter_stack_frames(snapshot=snapshot))
+
+    frames, snapshots = get_frames(snapshot=False), get_frames(snapshot=True)
+    assert all(isinstance(frame, stacks.FrameSnapshot) for frame, lineno in snapshots)
+    assert [lineno for frame, lineno in snapshots] == [lineno for frame, lineno in frames]
+    assert stacks.get_stack_info(snapshots, with_locals=False) == stacks.get_stack_info(frames, with_locals=False)
+
+
+def test_capture_stack():
+    get_frames = stacks.capture_stack(inspect.currentframe())
+    lineno = inspect.currentframe().f_lineno - 1
+    frames = get_frames()
+    assert frames[0][0].f_code.co_name == "test_capture_stack"
+    # the line number of the frame at the time of capturing is used
+    assert frames[0][1] == lineno
+    assert len(frames) > 1
+
+    frames = stacks.capture_stack(inspect.currentframe(), skip_top_modules=(__name__,))()
+    assert frames[0][0].f_globals["__name__"] != __name__
+
+    assert stacks.capture_stack(inspect.currentframe(), skip_top_modules=("",)) is None
+
+
+def test_traceback_hide_check_avoids_locals():
+    frame = Mock(f_lineno=1, f_globals={"__name__": "foo"})
+    frame.f_code.co_varnames = ("a", "b")
+    frame.f_code.co_names = ()
+    frame.f_code.co_cellvars = ()
+    frame.f_code.co_freevars = ()
+    f_locals = PropertyMock(return_value={})
+    type(frame).f_locals = f_locals
+    assert len(list(stacks.iter_stack_frames([frame]))) == 1
+    assert not f_locals.called
+
+    frame.f_code.co_varnames = ("a", "__traceback_hide__")
+    type(frame).f_locals = PropertyMock(return_value={"__traceback_hide__": True})
+    assert len(list(stacks.iter_stack_frames([frame]))) == 0
+
+
+def test_frame_info_cached_per_code_object():
+    # code objects compare equal if they only differ in their file name
+    code_a = compile("import inspect\nframe = inspect.currentframe()", "a.py", "exec")
+    code_b = compile("import inspect\nframe = inspect.currentframe()", "b.py", "exec")
+    assert code_a == code_b
+    frames = []
+    for code in (code_a, code_b, code_a):
+        namespace = {"__name__": "foo"}
+        exec(code, namespace)
+        frames.append((namespace["frame"], 2))
+    with patch("elasticapm.utils.stacks.is_library_frame", wraps=stacks.is_library_frame) as is_library_frame:
+        results = get_stack_info(frames, with_locals=False)
+    assert [result["abs_path"] for result in results] == ["a.py", "b.py", "a.py"]
+    assert is_library_frame.call_count == 2
+
+
+def test_frame_info_cache_size():
+    frames = list(stacks.iter_stack_frames())
+    assert len({frame.f_code for frame, lineno in frames}) > 2
+    with patch.object(stacks, "_STATIC_FRAME_INFO_CACHE_SIZE", 2), patch.object(stacks, "_static_frame_info_cache", {}):
+        get_stack_info(frames, with_locals=False)
+        assert len(stacks._static_frame_info_cache) == 2
+
+
 def test_iter_stack_frames_skip_frames():
     frames = get_me_more_test_frames(4)
 
@@ -219,7 +301,7 @@ def test_get_frame_info():
     ],
 )
 def test_get_lines_from_file(lineno, context, expected):
-    stacks.get_lines_from_file.cache_clear()
+    stacks.clear_source_cache()
     fname = os.path.join(os.path.dirname(__file__), "linenos.py")
     result = stacks.get_lines_from_file(fname, lineno, context)
     assert result == expected
@@ -238,9 +320,53 @@ def test_get_lines_from_file(lineno, context, expected):
     ],
 )
 def test_get_lines_from_loader(lineno, context, expected):
-    stacks.get_lines_from_file.cache_clear()
+    stacks.clear_source_cache()
     module = "tests.utils.stacks.linenos"
     loader = pkgutil.get_loader(module)
     fname = os.path.join(os.path.dirname(__file__), "linenos.py")
     result = stacks.get_lines_from_file(fname, lineno, context, loader=loader, module_name=module)
     assert result == expected
+
+
+def test_source_lines_cached_and_invalidated_by_mtime(tmpdir):
+    stacks.clear_source_cache()
+    source_file = tmpdir.join("source.py")
+    source_file.write("a = 1\nb = 2\n")
+    fname = str(source_file)
+    with patch("elasticapm.utils.stacks._read_source_lines", wraps=stacks._read_source_lines) as read_source_lines:
+        assert stacks.get_lines_from_file(fname, 1, 1) == ([], "a = 1", ["b = 2"])
+        assert stacks.get_lines_from_file(fname, 2, 1) == (["a = 1"], "b = 2", [])
+        assert read_source_lines.call_count == 1
+
+        source_file.write("c = 3\n")
+        os.utime(fname, (0, 0))
+        # the modification time is only checked once per _SOURCE_CACHE_CHECK_INTERVAL
+        assert stacks.get_lines_from_file(fname, 1, 1) == ([], "a = 1", ["b = 2"])
+        with patch("elasticapm.utils.stacks._SOURCE_CACHE_CHECK_INTERVAL", 0):
+            assert stacks.get_lines_from_file(fname, 1, 1) == ([], "c = 3", [])
+        assert read_source_lines.call_count == 2
+
+
+def test_source_cache_bounded_by_bytes(tmpdir):
+    stacks.clear_source_cache()
+    fnames = []
+    for i in range(3):
+        source_file = tmpdir.join("source%d.py" % i)
+        source_file.write("x = 1\n" * 10)
+        fnames.append(str(source_file))
+    with patch("elasticapm.utils.stacks._SOURCE_CACHE_MAX_BYTES", 150):
+        for fname in fnames:
+            stacks.get_source_lines(fname)
+        assert [key[0] for key in stacks._source_cache] == fnames[1:]
+        assert stacks._source_cache_bytes == 120
+
+
+def test_source_context_lines_not_shared(tmpdir):
+    stacks.clear_source_cache()
+    source_file = tmpdir.join("source.py")
+    source_file.write("a = 1\nb = 2\nc = 3\n")
+    fname = str(source_file)
+    pre_context, _, post_context = stacks.get_lines_from_file(fname, 2, 1)
+    pre_context.append("modified")
+    post_context.clear()
+    assert stacks.get_lines_from_file(fname, 2, 1) == (["a = 1"], "b = 2", ["c = 3"])
@@ -30,9 +30,12 @@
 
 from __future__ import absolute_import
 
+import os
+
 import pytest
 
-from elasticapm.utils.disttracing import TraceParent
+from elasticapm.utils import disttracing
+from elasticapm.utils.disttracing import TraceParent, generate_span_id, generate_trace_id
 from tests.utils import assert_any_record_contains
 
 
@@ -158,3 +161,32 @@ def test_traceparent_from_header():
     assert tp2.to_string() == legacy_header
     # traceparent has precedence over elastic-apm-traceparent
     assert tp3.to_string() == header
+
+
+@pytest.mark.parametrize("generate,length", [(generate_span_id, 16), (generate_trace_id, 32)])
+def test_generate_ids(generate, length):
+    ids = [generate() for _ in range(1000)]
+    assert len(set(ids)) == 1000
+    for id in ids:
+        assert len(id) == length
+        int(id, 16)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_id_pools_cleared_in_forked_child():
+    generate_span_id()
+    generate_trace_id()
+    assert disttracing._span_ids and disttracing._trace_ids
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # child
+        try:
+            os.close(read_fd)
+            os.write(write_fd, b"%d %d" % (len(disttracing._span_ids), len(disttracing._trace_ids)))
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as f:
+        result = f.read()
+    os.waitpid(pid, 0)
+    assert result == b"0 0"
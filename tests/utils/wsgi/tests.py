@@ -30,7 +30,10 @@
 
 from __future__ import absolute_import
 
-from elasticapm.utils.wsgi import get_environ, get_headers, get_host
+import mock
+
+from elasticapm.utils import wsgi
+from elasticapm.utils.wsgi import get_environ, get_header_dict, get_headers, get_host
 
 
 def test_get_headers_tuple_as_key():
@@ -56,6 +59,35 @@ def test_get_headers_coerces_content_length():
     assert result["content-length"] == "134"
 
 
+def test_get_header_dict():
+    environ = {
+        "HTTP_ACCEPT": "text/plain",
+        "HTTP_X_FORWARDED_FOR": "127.0.0.1",
+        "CONTENT_LENGTH": 134,
+        "HTTP_CONTENT_TYPE": "text/plain",
+        "REMOTE_ADDR": "127.0.0.1",
+    }
+    result = get_header_dict(environ)
+    assert result == {"accept": "text/plain", "x-forwarded-for": "127.0.0.1", "content-length": "134"}
+    assert result == dict((name, str(value)) for name, value in get_headers(environ))
+
+
+def test_get_header_dict_allowlist():
+    environ = {"HTTP_ACCEPT": "text/plain", "HTTP_X_FORWARDED_FOR": "127.0.0.1", "CONTENT_LENGTH": 134}
+    result = get_header_dict(environ, ["x-forwarded-for", "content-length", "user-agent"])
+    assert result == {"x-forwarded-for": "127.0.0.1", "content-length": "134"}
+
+
+def test_get_header_dict_name_cache_is_bounded():
+    with mock.patch.object(wsgi, "_header_names", {}) as header_names, mock.patch.object(wsgi, "_HEADER_NAMES_MAX", 2):
+        result = get_header_dict({"HTTP_A": "a", "HTTP_B": "b", "HTTP_C": "c"})
+        assert result == {"a": "a", "b": "b", "c": "c"}
+        # the cache is cleared once it is full, so new headers are still cached
+        assert header_names == {"HTTP_C": "c"}
+        assert get_header_dict({"HTTP_C": "c", "HTTP_D": "d"}) == {"c": "c", "d": "d"}
+        assert header_names == {"HTTP_C": "c", "HTTP_D": "d"}
+
+
 def test_get_environ_has_remote_addr():
     result = dict(get_environ({"REMOTE_ADDR": "127.0.0.1"}))
     assert "REMOTE_ADDR" in result